@@ -1,34 +1,156 @@
 import hashlib
+import os
 import secrets
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Optional, Tuple
-from config import PASSWORD_HASH_ALGORITHM
+from config import (PASSWORD_HASH_ALGORITHM, PASSWORD_PBKDF2_ITERATIONS, PASSWORD_SCRYPT_N,
+                    PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, PASSWORD_HASH_WORKERS)
+
+ALGORITHMS = ("pbkdf2_sha256", "scrypt", "sha256")
+
+
+@dataclass(frozen=True)
+class HashParams:
+    """密码哈希算法和参数，与哈希值一起保存，每个用户可以不同
+
+    保存格式: pbkdf2_sha256$<迭代次数>$<哈希>、scrypt$<n>$<r>$<p>$<哈希>；
+    旧版的 sha256 (密码+盐的一次 SHA-256) 只有十六进制哈希值，不带前缀。
+    """
+    algorithm: str = PASSWORD_HASH_ALGORITHM
+    iterations: int = PASSWORD_PBKDF2_ITERATIONS
+    n: int = PASSWORD_SCRYPT_N
+    r: int = PASSWORD_SCRYPT_R
+    p: int = PASSWORD_SCRYPT_P
+
+    def __post_init__(self):
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(f"不支持的密码哈希算法: {self.algorithm}")
+
+    def derive(self, password: str, salt: str) -> str:
+        """计算十六进制哈希值"""
+        if self.algorithm == "pbkdf2_sha256":
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode('utf-8'), salt.encode('utf-8'), self.iterations)
+        elif self.algorithm == "scrypt":
+            digest = hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'),
+                                    n=self.n, r=self.r, p=self.p, dklen=32,
+                                    maxmem=2 * 128 * self.r * (self.n + self.p))
+        else:
+            digest = hashlib.sha256(f"{password}{salt}".encode('utf-8')).digest()
+        return digest.hex()
+
+    def encode(self, digest: str) -> str:
+        if self.algorithm == "pbkdf2_sha256":
+            return f"pbkdf2_sha256${self.iterations}${digest}"
+        if self.algorithm == "scrypt":
+            return f"scrypt${self.n}${self.r}${self.p}${digest}"
+        return digest
+
+    @classmethod
+    def decode(cls, stored_hash: str) -> Tuple["HashParams", str]:
+        """从保存的哈希中取出 (参数, 哈希值)"""
+        parts = stored_hash.split("$")
+        if len(parts) == 1:
+            return cls(algorithm="sha256"), stored_hash
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 3:
+            return cls(algorithm="pbkdf2_sha256", iterations=int(parts[1])), parts[2]
+        if parts[0] == "scrypt" and len(parts) == 5:
+            return cls(algorithm="scrypt", n=int(parts[1]), r=int(parts[2]), p=int(parts[3])), parts[4]
+        raise ValueError("无法识别的密码哈希格式")
+
+    def same_cost(self, other: "HashParams") -> bool:
+        """算法和强度参数是否相同"""
+        if self.algorithm != other.algorithm:
+            return False
+        if self.algorithm == "pbkdf2_sha256":
+            return self.iterations == other.iterations
+        if self.algorithm == "scrypt":
+            return (self.n, self.r, self.p) == (other.n, other.r, other.p)
+        return True
+
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+
+
+def hash_executor() -> ThreadPoolExecutor:
+    """计算密码哈希的线程池，最多 PASSWORD_HASH_WORKERS 个线程
+
+    PBKDF2 和 scrypt 在 OpenSSL 中计算时释放 GIL，可以在线程中并行；线程数有上限，
+    大量并发登录时排队等待，不会占满全部 CPU 而拖慢其他请求。
+    """
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+                                                thread_name_prefix="password-hash")
+        return _hash_executor
+
 
 class SecurityManager:
+    # 新密码使用的算法和参数，可在运行时替换 (如性能测试)
+    hash_params = HashParams()
+
     @staticmethod
     def hash_password(password: str, salt: Optional[str] = None) -> Tuple[str, str]:
         """哈希密码，返回(哈希值, 盐)"""
         if salt is None:
             salt = secrets.token_hex(16)
-        
-        hasher = hashlib.new(PASSWORD_HASH_ALGORITHM)
-        hasher.update(f"{password}{salt}".encode('utf-8'))
-        password_hash = hasher.hexdigest()
-        
+
+        params = SecurityManager.hash_params
+        password_hash = params.encode(params.derive(password, salt))
+
         return password_hash, salt
-    
+
     @staticmethod
     def verify_password(password: str, stored_hash: str, salt: str) -> bool:
-        """验证密码"""
-        test_hash, _ = SecurityManager.hash_password(password, salt)
-        return secrets.compare_digest(test_hash, stored_hash)
-    
+        """按哈希中保存的算法和参数验证密码"""
+        try:
+            params, digest = HashParams.decode(stored_hash)
+        except ValueError:
+            return False
+        return secrets.compare_digest(params.derive(password, salt), digest)
+
+    @staticmethod
+    def needs_rehash(stored_hash: str) -> bool:
+        """保存的哈希是否使用了与当前配置不同的算法或参数"""
+        try:
+            params, _ = HashParams.decode(stored_hash)
+        except ValueError:
+            return True
+        return not params.same_cost(SecurityManager.hash_params)
+
+    @staticmethod
+    def dummy_hash() -> Tuple[str, str]:
+        """当前算法和参数下的占位 (哈希值, 盐)，不对应任何密码
+
+        用户不存在时也按它验证一次，登录耗时不会暴露用户名是否存在。
+        """
+        params = SecurityManager.hash_params
+        return params.encode("0" * 64), "0" * 32
+
+    @staticmethod
+    def hash_password_pooled(password: str, salt: Optional[str] = None) -> Tuple[str, str]:
+        """在线程池中哈希密码
+
+        调用方线程阻塞等待结果 (.result())，只限制同时计算的哈希数，不会让调用方提前返回；
+        线程池排满时调用方还要加上排队的时间。
+        """
+        return hash_executor().submit(SecurityManager.hash_password, password, salt).result()
+
+    @staticmethod
+    def verify_password_pooled(password: str, stored_hash: str, salt: str) -> bool:
+        """在线程池中验证密码，调用方线程同样阻塞等待结果"""
+        return hash_executor().submit(SecurityManager.verify_password, password, stored_hash, salt).result()
+
     @staticmethod
     def generate_session_token() -> str:
         """生成会话令牌"""
         return secrets.token_urlsafe(32)
-    
+
     @staticmethod
     def get_current_timestamp() -> int:
         """获取当前时间戳"""
-        return int(time.time())
\ No newline at end of file
+        return int(time.time())
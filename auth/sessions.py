@@ -0,0 +1,187 @@
+import hashlib
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from config import USERS_DB_FILE, SESSION_TIMEOUT_HOURS, SESSION_MAX_COUNT, SESSION_SLIDING
+from .security import SecurityManager
+
+# 滑动过期时，距上次顺延不足此秒数的访问不再顺延，避免每次访问都写堆和磁盘
+REFRESH_INTERVAL = 60
+# 清理磁盘上过期会话的最短间隔 (秒)
+BACKEND_PURGE_INTERVAL = 600
+
+
+@dataclass
+class Session:
+    """登录会话，时间均为 Unix 时间戳 (秒)"""
+    token: str
+    username: str
+    user_id: str
+    created_at: int
+    expires_at: int
+
+
+class SQLiteSessionBackend:
+    """会话的磁盘存储，与用户账户在同一个数据库 (data/users.sqlite3)
+
+    按令牌主键查询单个会话，按 expires_at 索引删除过期会话，重启后不需要扫描全部会话。
+    令牌本身不落盘，只保存其 SHA-256 摘要。
+    """
+
+    def __init__(self, db_file: Path = USERS_DB_FILE):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (token_hash TEXT PRIMARY KEY, username TEXT NOT NULL, "
+                "user_id TEXT NOT NULL, created_at INTEGER NOT NULL, expires_at INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)")
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def load(self, token: str) -> Optional[Session]:
+        """按令牌读取会话，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT username, user_id, created_at, expires_at FROM sessions WHERE token_hash = ?",
+                (self._digest(token),)).fetchone()
+        return Session(token, *row) if row is not None else None
+
+    def save(self, session: Session):
+        """新增或覆盖会话"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (token_hash, username, user_id, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self._digest(session.token), session.username, session.user_id,
+                 session.created_at, session.expires_at))
+
+    def touch(self, token: str, expires_at: int):
+        """顺延会话的过期时间"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sessions SET expires_at = ? WHERE token_hash = ?",
+                               (expires_at, self._digest(token)))
+
+    def delete(self, token: str):
+        """删除会话"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE token_hash = ?", (self._digest(token),))
+
+    def purge(self, now: int) -> int:
+        """删除已过期的会话，返回删除的数量"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+
+class SessionStore:
+    """会话管理
+
+    内存中的会话按最近使用排序 (LRU)，超过 max_sessions 时淘汰最久未使用的；
+    过期时间另存于最小堆，每次访问时弹出已过期的会话，每个会话的清理为 O(log n)，
+    不需要扫描全部会话。sliding 为 True 时每次使用会话都把过期时间顺延 timeout 秒
+    (每 REFRESH_INTERVAL 秒最多一次)，顺延时旧的堆条目留在堆中，弹出时按过期时间识别并丢弃。
+
+    有 backend 时会话同时写入磁盘，内存只作为缓存：被淘汰或重启后丢失的会话在下次使用时
+    按令牌从磁盘读回；没有 backend 时被淘汰的会话即失效。可在多个线程中使用。
+    """
+
+    def __init__(self, timeout: int = SESSION_TIMEOUT_HOURS * 3600, max_sessions: int = SESSION_MAX_COUNT,
+                 sliding: bool = SESSION_SLIDING, backend: Optional[SQLiteSessionBackend] = None,
+                 clock: Callable[[], int] = SecurityManager.get_current_timestamp):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.sliding = sliding
+        self.backend = backend
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._expiry: List[Tuple[int, str]] = []
+        self._backend_purged_at = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, username: str, user_id: str) -> Session:
+        """创建新会话"""
+        now = self._clock()
+        session = Session(SecurityManager.generate_session_token(), username, user_id, now, now + self.timeout)
+        with self._lock:
+            self._purge(now)
+            self._put(session)
+            if self.backend is not None:
+                self.backend.save(session)
+        return session
+
+    def get(self, token: str) -> Optional[Session]:
+        """取得有效的会话并记为最近使用，不存在或已过期时返回 None"""
+        now = self._clock()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(token)
+            if session is None:
+                session = self._load(token, now)
+                if session is None:
+                    return None
+            self._sessions.move_to_end(token)
+            if self.sliding and now + self.timeout - session.expires_at >= REFRESH_INTERVAL:
+                session.expires_at = now + self.timeout
+                heapq.heappush(self._expiry, (session.expires_at, token))
+                if self.backend is not None:
+                    self.backend.touch(token, session.expires_at)
+            return session
+
+    def delete(self, token: str):
+        """删除会话 (登出)"""
+        with self._lock:
+            self._sessions.pop(token, None)
+            if self.backend is not None:
+                self.backend.delete(token)
+
+    def _load(self, token: str, now: int) -> Optional[Session]:
+        """从磁盘读回不在内存中的会话"""
+        if self.backend is None:
+            return None
+        session = self.backend.load(token)
+        if session is None:
+            return None
+        if session.expires_at <= now:
+            self.backend.delete(token)
+            return None
+        self._put(session)
+        return session
+
+    def _put(self, session: Session):
+        self._sessions[session.token] = session
+        self._sessions.move_to_end(session.token)
+        heapq.heappush(self._expiry, (session.expires_at, session.token))
+        while len(self._sessions) > self.max_sessions:
+            # 被淘汰会话的堆条目留到过期或重建堆时丢弃
+            self._sessions.popitem(last=False)
+
+    def _purge(self, now: int):
+        """弹出已过期的会话；堆中的失效条目过多时重建堆"""
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            expires_at, token = heapq.heappop(expiry)
+            session = self._sessions.get(token)
+            if session is not None and session.expires_at == expires_at:
+                del self._sessions[token]
+        if len(expiry) > 2 * len(self._sessions) + 64:
+            self._expiry = [(session.expires_at, token) for token, session in self._sessions.items()]
+            heapq.heapify(self._expiry)
+        if self.backend is not None and now - self._backend_purged_at >= BACKEND_PURGE_INTERVAL:
+            self._backend_purged_at = now
+            self.backend.purge(now)
@@ -0,0 +1,155 @@
+import atexit
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+from config import (MAX_LOGIN_ATTEMPTS, LOGIN_WINDOW_SECONDS, LOGIN_LOCKOUT_SECONDS, LOGIN_SOURCE_MAX_FAILURES,
+                    LOGIN_THROTTLE_MAX_KEYS, LOGIN_THROTTLE_FLUSH_SECONDS)
+from .security import SecurityManager
+from .user_store import UserStore
+
+
+class LoginThrottle:
+    """登录失败限流
+
+    失败记录只保存在内存中，按用户名和按来源 (如客户端IP) 各自统计滑动窗口 window 秒内的失败次数：
+    一个用户名失败 max_attempts 次即锁定 lockout 秒；一个来源失败 max_source_failures 次后，
+    在最早的失败移出窗口之前拒绝该来源的所有登录。
+
+    只有锁定状态变化 (锁定、登录成功后解除) 时才写入用户库，并且由后台线程每 flush_interval 秒
+    合并写入一次，连续的失败登录不会逐次写盘。锁定状态写入后多个进程共享，窗口内的失败次数
+    只在本进程内有效。失败记录最多保留 max_keys 个键，超出时丢弃最久未更新的，
+    大量不同用户名的请求不会使内存无限增长。可在多个线程中使用。
+    """
+
+    def __init__(self, store: Optional[UserStore] = None, max_attempts: int = MAX_LOGIN_ATTEMPTS,
+                 window: int = LOGIN_WINDOW_SECONDS, lockout: int = LOGIN_LOCKOUT_SECONDS,
+                 max_source_failures: int = LOGIN_SOURCE_MAX_FAILURES, max_keys: int = LOGIN_THROTTLE_MAX_KEYS,
+                 flush_interval: float = LOGIN_THROTTLE_FLUSH_SECONDS,
+                 clock: Callable[[], int] = SecurityManager.get_current_timestamp):
+        self.store = store
+        self.max_attempts = max_attempts
+        self.window = window
+        self.lockout = lockout
+        self.max_source_failures = max_source_failures
+        self.max_keys = max_keys
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._lock = threading.RLock()
+        # 键为 ("user", 用户名) 或 ("source", 来源)，值为窗口内的失败时间
+        self._failures: "OrderedDict[Tuple[str, str], Deque[int]]" = OrderedDict()
+        self._locked: "OrderedDict[str, int]" = OrderedDict()
+        # 等待写入用户库的锁定状态: 用户名 -> (login_attempts, locked_until)
+        self._pending: Dict[str, Tuple[int, int]] = {}
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+
+    def __len__(self):
+        return len(self._failures)
+
+    def allowed(self, username: str, source: Optional[str] = None, now: Optional[int] = None) -> bool:
+        """用户名未被锁定且来源未超过失败上限时返回 True，不计为一次尝试"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            if self.locked_until(username) > now:
+                return False
+            if source is not None:
+                return len(self._window(("source", source), now)) < self.max_source_failures
+            return True
+
+    def locked_until(self, username: str) -> int:
+        """本进程记录的锁定截止时间，未锁定时为 0"""
+        with self._lock:
+            return self._locked.get(username, 0)
+
+    def record_failure(self, username: Optional[str], source: Optional[str] = None,
+                       now: Optional[int] = None) -> int:
+        """记录一次失败，返回该用户名的锁定截止时间 (未锁定为 0)
+
+        username 为 None 时 (如用户不存在) 只计入来源，不为不存在的用户名保存记录。
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            if source is not None:
+                self._add(("source", source), now, self.max_source_failures)
+            if username is None:
+                return 0
+            failures = self._add(("user", username), now, self.max_attempts)
+            if len(failures) < self.max_attempts:
+                return 0
+            locked_until = now + self.lockout
+            del self._failures[("user", username)]
+            self._locked[username] = locked_until
+            self._locked.move_to_end(username)
+            self._schedule(username, (self.max_attempts, locked_until))
+            return locked_until
+
+    def record_success(self, username: str, stored_attempts: int = 0, stored_locked_until: int = 0):
+        """登录成功，清除该用户名的失败记录；用户库中仍有失败次数或锁定时间时安排清零"""
+        with self._lock:
+            self._failures.pop(("user", username), None)
+            self._locked.pop(username, None)
+            if stored_attempts or stored_locked_until:
+                self._schedule(username, (0, 0))
+            else:
+                # 尚未写入的锁定已经过期，不再需要写入
+                self._pending.pop(username, None)
+
+    def flush(self):
+        """立即把等待中的锁定状态写入用户库"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if self.store is None:
+            return
+        for username, (attempts, locked_until) in pending.items():
+            self.store.update(username, login_attempts=attempts, locked_until=locked_until)
+
+    def close(self):
+        """写入剩余的锁定状态并停止后台线程"""
+        with self._lock:
+            self._closed = True
+            writer = self._writer
+        self._wakeup.set()
+        if writer is not None:
+            writer.join()
+        self.flush()
+
+    def _window(self, key: Tuple[str, str], now: int) -> Deque[int]:
+        """窗口内的失败时间，移出已超出窗口的记录"""
+        failures = self._failures.get(key)
+        if failures is None:
+            return deque()
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+        return failures
+
+    def _add(self, key: Tuple[str, str], now: int, limit: int) -> Deque[int]:
+        failures = self._window(key, now)
+        if key not in self._failures:
+            # 超过上限的旧记录对判断没有影响，每个键最多保留 limit 个时间
+            failures = self._failures[key] = deque(maxlen=limit)
+        failures.append(now)
+        self._failures.move_to_end(key)
+        while len(self._failures) > self.max_keys:
+            self._failures.popitem(last=False)
+        while len(self._locked) > self.max_keys:
+            # 被淘汰的锁定已经 (或即将) 写入用户库，登录时仍会从用户库读到
+            self._locked.popitem(last=False)
+        return failures
+
+    def _schedule(self, username: str, state: Tuple[int, int]):
+        self._pending[username] = state
+        if self.store is None or self._closed:
+            return
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="login-throttle", daemon=True)
+            self._writer.start()
+            # 退出程序时写入还未写入的锁定状态
+            atexit.register(self.close)
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self.flush()
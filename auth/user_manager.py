@@ -1,8 +1,9 @@
-import json
 from typing import Optional, Dict, Any
-from pathlib import Path
-from config import USERS_FILE, SESSION_TIMEOUT_HOURS, MAX_LOGIN_ATTEMPTS
+from config import SESSION_PERSIST
 from .security import SecurityManager
+from .user_store import UserStore
+from .sessions import SessionStore, SQLiteSessionBackend
+from .throttle import LoginThrottle
 
 class User:
     def __init__(self, username: str, password_hash: str, salt: str, user_id: str):
@@ -39,95 +40,81 @@ class User:
         return user
 
 class UserManager:
-    def __init__(self):
-        self.users: Dict[str, User] = {}
-        self.sessions: Dict[str, Dict] = {}
-        self._load_users()
+    def __init__(self, store: Optional[UserStore] = None, sessions: Optional[SessionStore] = None,
+                 throttle: Optional[LoginThrottle] = None):
+        # 账户按需从用户库中逐个读取，启动时不加载
+        self.store = store or UserStore()
+        if sessions is None:
+            sessions = SessionStore(backend=SQLiteSessionBackend(self.store.db_file) if SESSION_PERSIST else None)
+        self.sessions = sessions
+        # 登录失败只在内存中计数，锁定状态变化时才在后台写入用户库
+        self.throttle = throttle if throttle is not None else LoginThrottle(self.store)
     
-    def _load_users(self):
-        """加载用户数据"""
-        if USERS_FILE.exists():
-            try:
-                with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.users = {username: User.from_dict(user_data) 
-                                for username, user_data in data.items()}
-            except (json.JSONDecodeError, KeyError):
-                self.users = {}
-    
-    def _save_users(self):
-        """保存用户数据"""
-        data = {username: user.to_dict() for username, user in self.users.items()}
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def get_user(self, username: str) -> Optional[User]:
+        """按用户名读取账户"""
+        record = self.store.get(username)
+        return User.from_dict(record) if record is not None else None
     
     def register(self, username: str, password: str) -> bool:
         """注册新用户"""
-        if username in self.users:
+        if len(username) < 3 or len(password) < 6:
             return False
         
-        if len(username) < 3 or len(password) < 6:
+        if self.store.get(username) is not None:
             return False
         
-        password_hash, salt = SecurityManager.hash_password(password)
+        password_hash, salt = SecurityManager.hash_password_pooled(password)
         user_id = SecurityManager.generate_session_token()[:8]
         
         user = User(username, password_hash, salt, user_id)
-        self.users[username] = user
-        self._save_users()
-        return True
+        # 其他进程同时注册了同名账户时插入失败
+        return self.store.add(user.to_dict())
     
-    def login(self, username: str, password: str) -> Optional[Dict]:
-        """用户登录"""
-        if username not in self.users:
+    def login(self, username: str, password: str, source: Optional[str] = None) -> Optional[Dict]:
+        """用户登录，source 为客户端来源 (如IP地址)，用于按来源限制失败次数"""
+        current_time = SecurityManager.get_current_timestamp()
+        
+        # 被锁定的用户名和失败过多的来源直接拒绝，不读取账户也不计算哈希
+        if not self.throttle.allowed(username, source, current_time):
             return None
         
-        user = self.users[username]
-        current_time = SecurityManager.get_current_timestamp()
+        user = self.get_user(username)
+        if user is None:
+            # 与用户存在时一样计算一次哈希
+            SecurityManager.verify_password_pooled(password, *SecurityManager.dummy_hash())
+            self.throttle.record_failure(None, source, current_time)
+            return None
         
-        # 检查账户是否被锁定
+        # 检查账户是否被锁定 (可能由其他进程锁定)；同样计算一次哈希，响应时间不暴露锁定状态
         if user.locked_until > current_time:
+            SecurityManager.verify_password_pooled(password, *SecurityManager.dummy_hash())
             return None
         
-        if SecurityManager.verify_password(password, user.password_hash, user.salt):
-            # 登录成功，重置尝试次数
+        if SecurityManager.verify_password_pooled(password, user.password_hash, user.salt):
+            # 登录成功，清除失败记录 (用户库中没有失败记录时不写入)
+            self.throttle.record_success(username, user.login_attempts, user.locked_until)
             user.login_attempts = 0
-            self._save_users()
+            user.locked_until = 0
+            # 旧算法或旧参数的哈希按当前配置重新计算，只在登录时才能拿到明文密码
+            if SecurityManager.needs_rehash(user.password_hash):
+                user.password_hash, user.salt = SecurityManager.hash_password_pooled(password)
+                self.store.update(username, password_hash=user.password_hash, salt=user.salt)
             
             # 创建会话
-            session_token = SecurityManager.generate_session_token()
-            session_data = {
-                "username": username,
-                "user_id": user.user_id,
-                "created_at": current_time
-            }
-            self.sessions[session_token] = session_data
-            return {"token": session_token, "user": user}
+            session = self.sessions.create(username, user.user_id)
+            return {"token": session.token, "user": user}
         else:
-            # 登录失败，增加尝试次数
-            user.login_attempts += 1
-            if user.login_attempts >= MAX_LOGIN_ATTEMPTS:
-                user.locked_until = current_time + 3600  # 锁定1小时
-            self._save_users()
+            # 登录失败，窗口内失败次数达到上限时锁定
+            self.throttle.record_failure(username, source, current_time)
             return None
     
     def verify_session(self, session_token: str) -> Optional[User]:
-        """验证会话"""
-        if session_token not in self.sessions:
-            return None
-        
-        session_data = self.sessions[session_token]
-        current_time = SecurityManager.get_current_timestamp()
-        
-        # 检查会话是否过期
-        if current_time - session_data["created_at"] > SESSION_TIMEOUT_HOURS * 3600:
-            del self.sessions[session_token]
+        """验证会话，过期或不存在时返回 None"""
+        session = self.sessions.get(session_token)
+        if session is None:
             return None
-        
-        username = session_data["username"]
-        return self.users.get(username)
+        return self.get_user(session.username)
     
     def logout(self, session_token: str):
         """用户登出"""
-        if session_token in self.sessions:
-            del self.sessions[session_token]
\ No newline at end of file
+        self.sessions.delete(session_token)
\ No newline at end of file
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterable
+from config import USERS_FILE, USERS_DB_FILE
+
+# 列名与 User.to_dict 的键一一对应；新增字段时追加到末尾，打开旧数据库时自动补列
+USER_COLUMNS = {
+    "username": "TEXT PRIMARY KEY",
+    "password_hash": "TEXT NOT NULL",
+    "salt": "TEXT NOT NULL",
+    "user_id": "TEXT NOT NULL",
+    "login_attempts": "INTEGER NOT NULL DEFAULT 0",
+    "locked_until": "INTEGER NOT NULL DEFAULT 0",
+    "created_at": "INTEGER",
+}
+
+# 旧文件中可能缺少的字段
+_DEFAULTS = {"login_attempts": 0, "locked_until": 0}
+
+
+class UserStore:
+    """用户账户存储
+
+    所有账户保存在一个 SQLite 数据库 (data/users.sqlite3，WAL 模式) 中，以用户名为主键，
+    登录和注册只查询或写入一行，启动时不读取任何账户。多个进程可以同时使用：
+    同名注册由主键约束保证只有一个成功。登录失败次数由 LoginThrottle 在内存中统计，
+    这里只保存其写入的锁定状态 (login_attempts / locked_until)，供各进程共享。
+    新建数据库时自动导入旧的 users.json (见 migrate_users_json)。
+    """
+
+    def __init__(self, db_file: Path = USERS_DB_FILE, legacy_file: Optional[Path] = USERS_FILE):
+        self.db_file = db_file
+        created = not db_file.exists()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._ensure_tables()
+        if created and legacy_file is not None:
+            migrate_users_json(legacy_file, self)
+
+    def _ensure_tables(self):
+        """创建表，并为旧数据库补齐新增的列"""
+        with self._lock, self._conn:
+            column_sql = ", ".join(f"{name} {ctype}" for name, ctype in USER_COLUMNS.items())
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS users ({column_sql})")
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(users)")}
+            for name, ctype in USER_COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE users ADD COLUMN {name} {ctype}")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        """按用户名读取账户记录，不存在时返回 None"""
+        sql = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ?"
+        with self._lock:
+            row = self._conn.execute(sql, (username,)).fetchone()
+        return dict(zip(USER_COLUMNS, row)) if row is not None else None
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """新增账户；用户名或用户ID已存在时返回 False"""
+        sql = f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})"
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(sql, tuple(record.get(name) for name in USER_COLUMNS))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update(self, username: str, **fields) -> bool:
+        """只修改一个账户的指定字段；账户不存在时返回 False"""
+        unknown = [name for name in fields if name not in USER_COLUMNS or name == "username"]
+        if unknown:
+            raise ValueError(f"无法修改的字段: {', '.join(unknown)}")
+        if not fields:
+            return True
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f"UPDATE users SET {assignments} WHERE username = ?",
+                                        (*fields.values(), username))
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        """账户总数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def import_records(self, records: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+        """在一个事务中分批导入账户记录，已存在的用户名保持不变，返回导入的记录数"""
+        sql = (f"INSERT OR IGNORE INTO users ({', '.join(USER_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(USER_COLUMNS))})")
+        count = 0
+        with self._lock, self._conn:
+            batch = []
+            for record in records:
+                batch.append(tuple(record.get(name, _DEFAULTS.get(name)) for name in USER_COLUMNS))
+                if len(batch) >= batch_size:
+                    count += self._insert(sql, batch)
+                    batch = []
+            if batch:
+                count += self._insert(sql, batch)
+        return count
+
+    def _insert(self, sql: str, batch) -> int:
+        before = self._conn.total_changes
+        self._conn.executemany(sql, batch)
+        return self._conn.total_changes - before
+
+
+def migrate_users_json(users_file: Path = USERS_FILE, store: Optional[UserStore] = None) -> int:
+    """把 users.json ({用户名: 账户}) 导入用户数据库，返回导入的账户数
+
+    可重复执行，数据库中已有的用户名不会被覆盖；users.json 保持不变，不再被读取。
+    """
+    try:
+        with open(users_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        return 0
+    if not isinstance(data, dict):
+        return 0
+    own_store = store is None
+    store = store or UserStore(legacy_file=None)
+    try:
+        return store.import_records(dict(record, username=username) for username, record in data.items())
+    finally:
+        if own_store:
+            store.close()
+
+
+if __name__ == "__main__":
+    # python -m auth.user_store
+    print(f"已导入 {migrate_users_json()} 个账户")
@@ -0,0 +1,73 @@
+"""不同密码哈希强度下的登录吞吐量和延迟
+
+    python -m benchmarks.login [每种设置的登录次数] [并发数]
+
+每种设置各注册一批账户，再用多个线程同时登录 (UserManager.login，含密码验证和创建会话)，
+统计每秒登录数和单次登录的 p50/p99 延迟。哈希计算在 PASSWORD_HASH_WORKERS 个线程中进行，
+并发数大于线程数时多出的登录排队等待，延迟随之增加。
+"""
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from auth.security import HashParams, SecurityManager
+from auth.sessions import SessionStore
+from auth.user_manager import UserManager
+from auth.user_store import UserStore
+
+SETTINGS = (
+    ("sha256 (旧)", HashParams(algorithm="sha256")),
+    ("pbkdf2 100k", HashParams(algorithm="pbkdf2_sha256", iterations=100_000)),
+    ("pbkdf2 300k", HashParams(algorithm="pbkdf2_sha256", iterations=300_000)),
+    ("pbkdf2 600k", HashParams(algorithm="pbkdf2_sha256", iterations=600_000)),
+    ("scrypt 2^14", HashParams(algorithm="scrypt", n=2 ** 14)),
+    ("scrypt 2^15", HashParams(algorithm="scrypt", n=2 ** 15)),
+)
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(manager: UserManager, usernames, concurrency: int):
+    """并发登录，返回 (总耗时, 每次登录的耗时列表)"""
+    def login(username):
+        start = time.perf_counter()
+        if manager.login(username, PASSWORD) is None:
+            raise RuntimeError(f"登录失败: {username}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(login, usernames))
+    return time.perf_counter() - start, latencies
+
+
+def main(logins: int = 40, concurrency: int = 8):
+    original = SecurityManager.hash_params
+    with tempfile.TemporaryDirectory() as tmp:
+        store = UserStore(db_file=Path(tmp) / "users.sqlite3", legacy_file=None)
+        manager = UserManager(store=store, sessions=SessionStore())
+        try:
+            for index, (name, params) in enumerate(SETTINGS):
+                SecurityManager.hash_params = params
+                usernames = [f"user{index}_{i}" for i in range(logins)]
+                for username in usernames:
+                    manager.register(username, PASSWORD)
+                elapsed, latencies = measure(manager, usernames, concurrency)
+                print(f"{name:>12}: {logins / elapsed:8.1f} 次/秒, "
+                      f"p50 {statistics.median(latencies) * 1000:7.1f}ms, "
+                      f"p99 {percentile(latencies, 0.99) * 1000:7.1f}ms")
+        finally:
+            SecurityManager.hash_params = original
+            store.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 8)
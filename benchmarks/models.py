@@ -0,0 +1,128 @@
+"""任务模型的内存占用和读写吞吐量
+
+    python -m benchmarks.models [记录数]
+
+与改为 __slots__ 之前的 dataclass 模型 (LegacyTask，照原样复制) 对比：
+每个任务占用的内存、从 JSON 文本加载 (解析 + from_dict) 和保存 (to_dict + 编码) 的速度。
+"""
+import gc
+import io
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from core.models import Task
+
+
+@dataclass
+class LegacyTask:
+    task_id: str
+    user_id: str
+    title: str
+    description: str = ""
+    created_at: str = None
+    updated_at: str = None
+    status: str = "todo"
+    priority: str = "medium"
+    due_date: Optional[str] = None
+    estimated_hours: float = 0.0
+    actual_hours: float = 0.0
+    tags: List[str] = None
+    blocked_by: List[str] = None
+    recurrence: Optional[Dict[str, Any]] = None
+    series_id: Optional[str] = None
+    occurrence_date: Optional[str] = None
+    version: int = 0
+
+    def __post_init__(self):
+        current_time = datetime.now().isoformat()
+        if self.created_at is None:
+            self.created_at = current_time
+        if self.updated_at is None:
+            self.updated_at = current_time
+        if self.tags is None:
+            self.tags = []
+        if self.blocked_by is None:
+            self.blocked_by = []
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def legacy_dump(records: List[Dict[str, Any]]) -> str:
+    """改动之前 write_json_atomic 的编码方式"""
+    f = io.StringIO()
+    json.dump(records, f, ensure_ascii=False, indent=2)
+    return f.getvalue()
+
+
+def records_dump(records: List[Dict[str, Any]]) -> str:
+    """write_json_records_atomic 的编码方式"""
+    return "[\n" + ",\n".join(json.dumps(record, ensure_ascii=False) for record in records) + "\n]\n"
+
+
+def make_records(n: int) -> List[Dict[str, Any]]:
+    statuses = ["todo", "in_progress", "done", "cancelled"]
+    priorities = ["low", "medium", "high", "urgent"]
+    records = []
+    for i in range(n):
+        records.append(Task(
+            task_id=str(uuid.uuid4()), user_id="benchmark", title=f"任务 {i}", description="说明" * (i % 5),
+            status=statuses[i % 4], priority=priorities[i % 4],
+            due_date=f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" if i % 3 else None,
+            estimated_hours=float(i % 8), actual_hours=float(i % 5),
+            tags=["工作", "项目"][:i % 3]).to_dict())
+    return records
+
+
+def measure_memory(model, text: str) -> float:
+    """从 JSON 文本加载后每个任务 (含其属性值) 常驻的字节数，解析出的字典已释放"""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    tasks = [model.from_dict(record) for record in json.loads(text)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / len(tasks)
+
+
+def measure(model, dump, text: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    tasks = [model.from_dict(record) for record in json.loads(text)]
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    dump([task.to_dict() for task in tasks])
+    save = time.perf_counter() - start
+    return {"load": load, "save": save}
+
+
+def main(n: int = 100_000):
+    records = make_records(n)
+    # 每次从各自格式的文件文本加载，JSON 文本中的字符串是新创建的 (未驻留)
+    legacy_text = legacy_dump(records)
+    text = records_dump(records)
+    results = {}
+    for name, model, dump, source in (("dataclass", LegacyTask, legacy_dump, legacy_text),
+                                      ("__slots__", Task, records_dump, text)):
+        memory = measure_memory(model, source)
+        timing = measure(model, dump, source)
+        results[name] = (memory, timing)
+        print(f"{name:>10}: {memory:7.0f} 字节/任务, "
+              f"加载 {n / timing['load']:9.0f} 条/秒 ({timing['load']:.2f}s), "
+              f"保存 {n / timing['save']:9.0f} 条/秒 ({timing['save']:.2f}s)")
+    (old_memory, old), (new_memory, new) = results["dataclass"], results["__slots__"]
+    print(f"内存 {new_memory / old_memory:.0%}, 加载快 {old['load'] / new['load']:.1f} 倍, "
+          f"保存快 {old['save'] / new['save']:.1f} 倍 ({n} 条记录)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -32,9 +32,28 @@ def build_gui_executable():
         '--add-data=.;.',
         '--hidden-import=auth.user_manager',
         '--hidden-import=auth.security', 
+        '--hidden-import=auth.user_store',
+        '--hidden-import=auth.sessions',
+        '--hidden-import=auth.throttle',
         '--hidden-import=core.models',
         '--hidden-import=core.storage',
+        '--hidden-import=core.journal',
+        '--hidden-import=core.sqlite_storage',
         '--hidden-import=core.task_manager',
+        '--hidden-import=core.query',
+        '--hidden-import=core.search',
+        '--hidden-import=core.due_dates',
+        '--hidden-import=core.intervals',
+        '--hidden-import=core.reports',
+        '--hidden-import=core.tracking',
+        '--hidden-import=core.scheduler',
+        '--hidden-import=core.dependencies',
+        '--hidden-import=core.work_queue',
+        '--hidden-import=core.recurrence',
+        '--hidden-import=core.history',
+        '--hidden-import=core.changes',
+        '--hidden-import=core.locking',
+        '--hidden-import=core.async_manager',
         '--hidden-import=config',
         'start_gui.py'
     ]
@@ -12,7 +12,8 @@ else:
 
 # 数据文件路径
 DATA_DIR = BASE_DIR / "data"
-USERS_FILE = DATA_DIR / "users.json"
+USERS_FILE = DATA_DIR / "users.json"  # 旧版账户文件，首次启动时导入 USERS_DB_FILE
+USERS_DB_FILE = DATA_DIR / "users.sqlite3"
 TASKS_DIR = DATA_DIR / "tasks"
 
 # 确保目录存在
@@ -20,6 +21,49 @@ DATA_DIR.mkdir(exist_ok=True)
 TASKS_DIR.mkdir(exist_ok=True)
 
 # 安全配置
-PASSWORD_HASH_ALGORITHM = "sha256"
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"  # pbkdf2_sha256 或 scrypt；旧账户的 sha256 哈希在下次登录时自动升级
+PASSWORD_PBKDF2_ITERATIONS = 600000
+PASSWORD_SCRYPT_N = 2 ** 14  # scrypt 每次计算约占用 128 * N * R 字节内存
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_HASH_WORKERS = None  # 同时计算密码哈希的线程数，None 表示 CPU 核数
 SESSION_TIMEOUT_HOURS = 24
-MAX_LOGIN_ATTEMPTS = 5
\ No newline at end of file
+SESSION_SLIDING = True  # 每次使用会话时把过期时间顺延 SESSION_TIMEOUT_HOURS
+SESSION_MAX_COUNT = 10000  # 内存中最多保留的会话数，超出时淘汰最久未使用的
+SESSION_PERSIST = True  # 会话保存到 USERS_DB_FILE，重启后无需重新登录
+MAX_LOGIN_ATTEMPTS = 5  # LOGIN_WINDOW_SECONDS 内同一用户名失败这么多次即锁定
+LOGIN_WINDOW_SECONDS = 900
+LOGIN_LOCKOUT_SECONDS = 3600
+LOGIN_SOURCE_MAX_FAILURES = 50  # LOGIN_WINDOW_SECONDS 内同一来源 (客户端地址) 最多失败次数
+LOGIN_THROTTLE_MAX_KEYS = 100000  # 内存中最多保留的失败记录 (用户名和来源) 数
+LOGIN_THROTTLE_FLUSH_SECONDS = 1.0  # 锁定状态写入用户库的间隔
+
+# 存储引擎: "json" 每次修改重写整个文件, "journal" 追加日志并定期压缩为快照,
+# "sqlite" 每个用户一个带索引的 SQLite 数据库 (迁移: python -m core.sqlite_storage)
+STORAGE_ENGINE = "json"
+JOURNAL_COMPACT_MIN_RECORDS = 500  # 日志记录数低于此值时不压缩
+JOURNAL_COMPACT_RATIO = 2.0  # 日志记录数超过存活记录数的倍数时压缩
+JOURNAL_COMPACT_MAX_BYTES = 4 * 1024 * 1024  # 日志超过此大小时压缩
+
+# 新建时间块与已有时间块重叠时: True 允许 (可用 TaskManager.find_overlaps 查看), False 拒绝
+ALLOW_OVERLAPPING_TIMEBLOCKS = True
+
+# 操作日志: 内存中保留的可撤销操作数，每隔多少次操作保存一个任务列表检查点，
+# 保留最近多少个检查点 (日志开始时的检查点始终保留)
+HISTORY_UNDO_LIMIT = 50
+HISTORY_CHECKPOINT_INTERVAL = 200
+HISTORY_MAX_CHECKPOINTS = 10
+
+# AsyncTaskManager 执行文件读写的线程数 (所有用户共用)
+ASYNC_MAX_WORKERS = 8
+
+# HTTP 接口 (python -m ui.api_server)，只监听本机
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+API_MAX_WORKERS = 8  # 同时处理的请求数
+API_MAX_MANAGERS = 64  # 内存中保留的用户 TaskManager 数，超出时关闭最久未使用的
+API_MANAGER_IDLE_SECONDS = 600  # TaskManager 空闲超过此秒数后关闭
+API_MAX_BODY_BYTES = 1024 * 1024
+API_PAGE_SIZE = 100  # GET /tasks 默认每页任务数
+API_MAX_PAGE_SIZE = 1000  # GET /tasks 的 limit 上限
+API_REQUEST_TIMEOUT = 30  # 读取请求的超时 (秒)
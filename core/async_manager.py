@@ -0,0 +1,239 @@
+import asyncio
+import dataclasses
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from config import ASYNC_MAX_WORKERS
+from .task_manager import TaskManager
+from .changes import TaskChange
+
+# 只读取数据的操作：同一用户的读取并发执行，相同参数的并发调用合并为一次
+READ_OPERATIONS = (
+    "get_task", "list_tasks", "query", "search", "occurrences",
+    "tasks_due_between", "overdue", "next_due", "next_tasks", "task_score",
+    "ready_tasks", "blocking_tasks", "topological_order", "critical_path",
+    "get_timeblock", "find_overlaps", "timeblocks_between", "free_gaps", "plan",
+    "get_task_statistics", "hours_by_period", "hours_by_task", "hours_by_tag", "hours_variance",
+    "tasks_as_of",
+)
+
+# 修改数据的操作：同一用户依次执行，执行期间没有读取
+WRITE_OPERATIONS = (
+    "create_task", "create_recurring_task", "create_tasks",
+    "update_task", "update_tasks", "delete_task", "delete_tasks",
+    "add_dependency", "remove_dependency",
+    "create_timeblock", "update_timeblock", "delete_timeblock",
+    "commit_plan", "rebuild_actual_hours", "check_statistics",
+    "undo", "redo",
+)
+
+_default_executor: Optional[ThreadPoolExecutor] = None
+
+
+def default_executor() -> ThreadPoolExecutor:
+    """所有 AsyncTaskManager 共用的线程池，最多 ASYNC_MAX_WORKERS 个线程"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_WORKERS, thread_name_prefix="task-io")
+    return _default_executor
+
+
+def _freeze(value: Any) -> Any:
+    """把参数转换为可哈希的合并键：列表、字典、集合、数据类 (如 PlanConstraints)
+    和有 to_dict 的模型 (如 Task) 按内容比较
+
+    含有其他不可哈希的值时抛出 TypeError。
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return dict, frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (set, frozenset)):
+        return frozenset, frozenset(_freeze(item) for item in value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return type(value), tuple(_freeze(getattr(value, f.name)) for f in dataclasses.fields(value))
+    if hasattr(value, "to_dict"):
+        return type(value), _freeze(value.to_dict())
+    hash(value)
+    return value
+
+
+class _ReadWriteLock:
+    """asyncio 读写锁：读取之间并发，写入独占；有写入在等待时新的读取排在写入之后
+
+    每一轮读取 (从没有读取方到有读取方) 开始时先独占执行 on_start，
+    最后一个读取方离开时执行 on_end。
+    """
+
+    def __init__(self, on_start: Callable[[], Awaitable[None]], on_end: Callable[[], None]):
+        self._on_start = on_start
+        self._on_end = on_end
+        self._cond = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writing and not self._waiting_writers)
+            starting = not self._readers
+            self._readers += 1
+            # 开始新一轮读取时先独占，on_start 完成前其他读取方不能进入
+            self._writing = starting
+        try:
+            if starting:
+                try:
+                    await self._on_start()
+                finally:
+                    async with self._cond:
+                        self._writing = False
+                        self._cond.notify_all()
+            yield
+        finally:
+            async with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._on_end()
+                    self._cond.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        async with self._cond:
+            self._waiting_writers += 1
+            try:
+                await self._cond.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class AsyncTaskManager:
+    """TaskManager 的 asyncio 接口
+
+    每个操作都是同名的协程，文件读写和 JSON 解析在有界线程池中执行，不阻塞事件循环。
+    TaskManager 的写入不是线程安全的：同一用户的写入依次执行，执行期间没有读取；
+    读取之间在线程池中并发执行。每一轮并发读取开始时检查一次其他进程的修改，
+    此后到本轮读取全部结束前存储不再重新加载 (见 TaskStorage.refresh_paused)，
+    读取看到的是本轮开始时的数据加上本进程的全部写入。不同用户的操作互不影响；
+    第一次使用时加载数据，此前并发的调用只等待同一次加载。
+    同一用户相同参数的并发读取合并为一次，各调用方得到同一个结果对象，不应修改。
+    """
+
+    def __init__(self, user_id: str, executor: Optional[Executor] = None):
+        self.user_id = user_id
+        self._executor = executor or default_executor()
+        self._manager: Optional[TaskManager] = None
+        self._loading: Optional[asyncio.Future] = None
+        self._lock = _ReadWriteLock(self._start_reads, self._end_reads)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    async def open(self) -> TaskManager:
+        """加载数据 (只加载一次)，返回底层的 TaskManager"""
+        if self._manager is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load())
+            await asyncio.shield(self._loading)
+        return self._manager
+
+    async def _load(self):
+        try:
+            self._manager = await asyncio.get_running_loop().run_in_executor(
+                self._executor, TaskManager, self.user_id)
+        finally:
+            # 加载失败时下次调用重新加载
+            self._loading = None
+
+    async def close(self):
+        """等待进行中的操作完成后释放存储 (如 SQLite 连接)"""
+        if self._manager is None:
+            return
+        async with self._lock.write():
+            manager, self._manager = self._manager, None
+            close = getattr(manager.storage, "close", None)
+            if close is not None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, close)
+
+    async def _start_reads(self):
+        """新一轮读取开始：检查其他进程的修改，之后暂停存储的自动重新加载"""
+        manager = self._manager
+        if manager is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(self._executor, manager.storage.refresh)
+        manager.storage.refresh_paused = True
+
+    def _end_reads(self):
+        if self._manager is not None:
+            self._manager.storage.refresh_paused = False
+
+    async def _call(self, manager: TaskManager, name: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: getattr(manager, name)(*args, **kwargs))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 线程中的操作无法中断，等它结束后才释放锁，以免与之后的写入同时执行
+            await asyncio.wait([future])
+            raise
+
+    async def _write(self, name: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        manager = await self.open()
+        async with self._lock.write():
+            return await self._call(manager, name, args, kwargs)
+
+    async def _run_read(self, name: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        manager = await self.open()
+        async with self._lock.read():
+            return await self._call(manager, name, args, kwargs)
+
+    async def _read(self, name: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        try:
+            key = (name, _freeze(args), _freeze(kwargs))
+        except TypeError:
+            # 参数含有无法按内容比较的值，不合并
+            return await self._run_read(name, args, kwargs)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._shared_read(key, name, args, kwargs))
+            self._inflight[key] = future
+        # 一个调用方被取消时不影响其他等待同一结果的调用方
+        return await asyncio.shield(future)
+
+    async def _shared_read(self, key: Tuple, name: str, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        try:
+            return await self._run_read(name, args, kwargs)
+        finally:
+            # 读取完成后立即移除，之后的调用会看到此后的写入
+            self._inflight.pop(key, None)
+
+    async def subscribe(self, callback: Callable[[TaskChange], None],
+                        kinds: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """订阅任务变更，回调在当前事件循环中调用；返回取消订阅的函数"""
+        loop = asyncio.get_running_loop()
+        manager = await self.open()
+        return manager.subscribe(lambda change: loop.call_soon_threadsafe(callback, change), kinds)
+
+
+def _operation(name: str, write: bool):
+    if write:
+        async def operation(self, *args, **kwargs):
+            return await self._write(name, args, kwargs)
+    else:
+        async def operation(self, *args, **kwargs):
+            return await self._read(name, args, kwargs)
+    operation.__name__ = name
+    operation.__qualname__ = f"AsyncTaskManager.{name}"
+    operation.__doc__ = getattr(TaskManager, name).__doc__
+    return operation
+
+
+for _name in READ_OPERATIONS:
+    setattr(AsyncTaskManager, _name, _operation(_name, write=False))
+for _name in WRITE_OPERATIONS:
+    setattr(AsyncTaskManager, _name, _operation(_name, write=True))
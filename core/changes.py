@@ -0,0 +1,90 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Callable, Iterable, Optional, Set, Tuple
+from .models import Task
+
+# 变更类型
+TASK_CREATED = "created"
+TASK_UPDATED = "updated"
+TASK_DELETED = "deleted"
+# 数据文件被外部修改后整体重新加载，订阅方应重新读取需要的任务
+TASKS_RELOADED = "reloaded"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskChange:
+    """一次任务变更，task 为变更后的任务 (删除和重新加载时为 None)"""
+    kind: str
+    task_id: Optional[str] = None
+    task: Optional[Task] = None
+
+
+class ChangeFeed:
+    """任务变更通知
+
+    作为二级索引挂在 TaskStorage 上，每次写入时按 put/remove 转为
+    created/updated/deleted 通知订阅方；撤销、重做和时间块工时汇总引起的修改同样会通知。
+    put/remove 只记下变更，存储在写入成功 (文件写入、日志追加或事务提交) 之后调用 commit
+    才在写入的线程中同步发出，订阅方不会收到未持久化的修改；写入失败时存储调用 rollback
+    丢弃这些变更，随后重新加载，订阅方会收到 reloaded。
+    订阅方抛出的异常记录到日志，不影响写入和其他订阅方。
+    """
+
+    def __init__(self):
+        self._known: Set[str] = set()
+        self._loaded = False
+        self._pending: List[TaskChange] = []
+        self._subscribers: List[Tuple[Callable[[TaskChange], None], Optional[Set[str]]]] = []
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建；不是第一次加载时通知 reloaded"""
+        self._known = {task.task_id for task in tasks}
+        self._pending = []
+        if self._loaded:
+            self._emit(TaskChange(TASKS_RELOADED))
+        self._loaded = True
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        kind = TASK_UPDATED if task.task_id in self._known else TASK_CREATED
+        self._known.add(task.task_id)
+        self._pending.append(TaskChange(kind, task.task_id, task))
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        if task_id in self._known:
+            self._known.discard(task_id)
+            self._pending.append(TaskChange(TASK_DELETED, task_id))
+
+    def commit(self):
+        """写入成功，发出记下的变更"""
+        pending, self._pending = self._pending, []
+        for change in pending:
+            self._emit(change)
+
+    def rollback(self):
+        """写入失败，丢弃记下的变更；_known 在重新加载时重建"""
+        self._pending = []
+
+    def subscribe(self, callback: Callable[[TaskChange], None],
+                  kinds: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """订阅变更，kinds 为空时接收全部类型；返回取消订阅的函数"""
+        entry = (callback, set(kinds) if kinds else None)
+        self._subscribers.append(entry)
+
+        def unsubscribe():
+            if entry in self._subscribers:
+                self._subscribers.remove(entry)
+        return unsubscribe
+
+    def _emit(self, change: TaskChange):
+        for callback, kinds in list(self._subscribers):
+            if kinds is not None and change.kind not in kinds:
+                continue
+            try:
+                callback(change)
+            except Exception:
+                # 订阅方的错误不应使写入失败，但要留下记录
+                logger.exception("任务变更订阅方处理 %s 通知时出错", change.kind)
@@ -0,0 +1,262 @@
+from typing import List, Dict, Set, Iterable, Optional, Tuple
+from .models import Task
+from .due_dates import OPEN_STATUSES
+
+
+class DependencyCycleError(ValueError):
+    """添加依赖会形成环"""
+
+    def __init__(self, cycle: List[str]):
+        super().__init__(f"依赖会形成环: {' -> '.join(cycle)}")
+        self.cycle = cycle
+
+
+class DependencyGraph:
+    """任务依赖图 (task.blocked_by)
+
+    作为二级索引挂在 TaskStorage 上，随每次保存/删除增量更新：
+    拓扑序用 Pearce-Kelly 算法维护，加边时只调整受影响区间内的节点；
+    每个任务记录未完成的前置任务数，状态变化时只更新直接后继，
+    从而维护“可以开始”的任务集合。
+    被引用但不存在 (已删除) 的前置任务视为已完成。
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        # 生效的边: 前置任务 -> 后继任务 及其反向
+        self.dependents: Dict[str, Set[str]] = {}
+        self.blockers: Dict[str, Set[str]] = {}
+        # 数据中会形成环而未生效的边 (前置任务, 后继任务)
+        self.rejected: Set[Tuple[str, str]] = set()
+        self.ready: Set[str] = set()
+        self._unfinished: Set[str] = set()
+        self._pending: Dict[str, int] = {}
+        self._ord: Dict[str, int] = {}
+        self._next_ord = 0
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建"""
+        self.__init__()
+        for task in tasks:
+            self.put(task)
+
+    def _ensure_node(self, node: str):
+        if node not in self._ord:
+            self._ord[node] = self._next_ord
+            self._next_ord += 1
+            self.dependents[node] = set()
+            self.blockers[node] = set()
+            self._pending[node] = 0
+
+    def _drop_node_if_unused(self, node: str):
+        if node not in self.tasks and node in self._ord and not self.dependents[node] and not self.blockers[node]:
+            for mapping in (self._ord, self.dependents, self.blockers, self._pending):
+                del mapping[node]
+
+    def _update_ready(self, node: str):
+        if node in self._unfinished and self._pending.get(node, 0) == 0:
+            self.ready.add(node)
+        else:
+            self.ready.discard(node)
+
+    def _set_unfinished(self, node: str, unfinished: bool):
+        """节点的完成状态变化时更新后继的未完成前置数"""
+        if (node in self._unfinished) == unfinished:
+            return
+        if unfinished:
+            self._unfinished.add(node)
+        else:
+            self._unfinished.discard(node)
+        step = 1 if unfinished else -1
+        for dependent in self.dependents.get(node, ()):
+            self._pending[dependent] += step
+            self._update_ready(dependent)
+        self._update_ready(node)
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        node = task.task_id
+        self._ensure_node(node)
+        self.tasks[node] = task
+        wanted = set(task.blocked_by or ()) - {node}
+        current = set(self.blockers[node]) | {b for b, d in self.rejected if d == node}
+        for blocker in current - wanted:
+            self._remove_edge(blocker, node)
+        for blocker in wanted - current:
+            self._add_edge(blocker, node)
+        self._set_unfinished(node, task.status in OPEN_STATUSES)
+        self._update_ready(node)
+
+    def remove(self, task_id: str):
+        """删除任务；仍被其他任务引用时保留为已完成的占位节点"""
+        if self.tasks.pop(task_id, None) is None:
+            return
+        for blocker in list(self.blockers[task_id]):
+            self._remove_edge(blocker, task_id)
+        self.rejected = {(b, d) for b, d in self.rejected if d != task_id}
+        self._set_unfinished(task_id, False)
+        self.ready.discard(task_id)
+        self._drop_node_if_unused(task_id)
+
+    def _add_edge(self, blocker: str, dependent: str):
+        self._ensure_node(blocker)
+        if self._reorder(blocker, dependent) is not None:
+            self.rejected.add((blocker, dependent))
+            return
+        self.dependents[blocker].add(dependent)
+        self.blockers[dependent].add(blocker)
+        if blocker in self._unfinished:
+            self._pending[dependent] += 1
+
+    def _remove_edge(self, blocker: str, dependent: str):
+        if (blocker, dependent) in self.rejected:
+            self.rejected.discard((blocker, dependent))
+            return
+        self.dependents[blocker].discard(dependent)
+        self.blockers[dependent].discard(blocker)
+        if blocker in self._unfinished:
+            self._pending[dependent] -= 1
+        self._drop_node_if_unused(blocker)
+
+    def _forward(self, start: str, upper: int, target: Optional[str]) -> Tuple[List[str], Optional[List[str]]]:
+        """从 start 沿后继深度优先搜索 ord <= upper 的节点
+
+        返回 (访问到的节点, 到 target 的路径或 None)。
+        """
+        visited = {start}
+        parent: Dict[str, Optional[str]] = {start: None}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                return list(visited), path[::-1]
+            for nxt in self.dependents[node]:
+                if nxt not in visited and self._ord[nxt] <= upper:
+                    visited.add(nxt)
+                    parent[nxt] = node
+                    stack.append(nxt)
+        return list(visited), None
+
+    def _backward(self, start: str, lower: int) -> List[str]:
+        visited = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for prev in self.blockers[node]:
+                if prev not in visited and self._ord[prev] >= lower:
+                    visited.add(prev)
+                    stack.append(prev)
+        return list(visited)
+
+    def _reorder(self, blocker: str, dependent: str) -> Optional[List[str]]:
+        """为新边 blocker -> dependent 调整拓扑序，会形成环时不修改并返回环"""
+        if blocker == dependent:
+            return [blocker, dependent]
+        lower, upper = self._ord[dependent], self._ord[blocker]
+        if lower > upper:
+            return None
+        forward, path = self._forward(dependent, upper, blocker)
+        if path is not None:
+            return path + [dependent]
+        backward = self._backward(blocker, lower)
+        # 受影响区间内，前置一侧整体排到后继一侧之前，各自保持原有相对顺序
+        backward.sort(key=self._ord.__getitem__)
+        forward.sort(key=self._ord.__getitem__)
+        nodes = backward + forward
+        slots = sorted(self._ord[node] for node in nodes)
+        for node, slot in zip(nodes, slots):
+            self._ord[node] = slot
+        return None
+
+    def find_cycle(self, task_id: str, blocker_id: str) -> Optional[List[str]]:
+        """task_id 新增前置任务 blocker_id 时会形成的环，不会形成环时返回 None"""
+        if task_id == blocker_id:
+            return [task_id, task_id]
+        if task_id not in self._ord or blocker_id not in self._ord:
+            return None
+        upper = self._ord[blocker_id]
+        if self._ord[task_id] > upper:
+            return None
+        _, path = self._forward(task_id, upper, blocker_id)
+        return path + [task_id] if path is not None else None
+
+    def find_batch_cycle(self, changes: Dict[str, Iterable[str]]) -> Optional[List[str]]:
+        """多个任务的前置任务同时改为 changes[任务ID] 后会形成的环，不会形成环时返回 None
+
+        不修改图：在当前生效的边上把涉及任务的入边换成新值，从涉及的任务出发深度优先搜索。
+        当前图无环，新的环必然经过某个涉及任务的新入边，因此只需从这些任务出发，
+        整体为 O(V + E)，批量中互为前置 (A 依赖 B、B 依赖 A) 的情况同样能发现。
+        """
+        wanted = {task_id: set(blockers or ()) for task_id, blockers in changes.items()}
+        for task_id, blockers in wanted.items():
+            if task_id in blockers:
+                return [task_id, task_id]
+        added: Dict[str, Set[str]] = {}
+        for task_id, blockers in wanted.items():
+            for blocker in blockers:
+                added.setdefault(blocker, set()).add(task_id)
+
+        def successors(node: str) -> Iterable[str]:
+            for dependent in self.dependents.get(node, ()):
+                if dependent not in wanted:
+                    yield dependent
+            yield from added.get(node, ())
+
+        # 0: 未访问, 1: 在当前搜索路径上, 2: 已完成
+        state: Dict[str, int] = {}
+        for root in wanted:
+            if state.get(root):
+                continue
+            path = [root]
+            stack = [iter(successors(root))]
+            state[root] = 1
+            while stack:
+                node = next(stack[-1], None)
+                if node is None:
+                    state[path.pop()] = 2
+                    stack.pop()
+                    continue
+                if state.get(node) == 1:
+                    # 与 find_cycle 相同，沿前置任务 -> 后继任务的方向
+                    return path[path.index(node):] + [node]
+                if not state.get(node):
+                    state[node] = 1
+                    path.append(node)
+                    stack.append(iter(successors(node)))
+        return None
+
+    def topological_order(self) -> List[Task]:
+        """全部任务的拓扑序，前置任务在前"""
+        return [self.tasks[node] for node in sorted(self.tasks, key=self._ord.__getitem__)]
+
+    def ready_tasks(self) -> List[Task]:
+        """未完成且前置任务都已完成的任务，按拓扑序"""
+        return [self.tasks[node] for node in sorted(self.ready, key=self._ord.__getitem__)]
+
+    def unfinished_blockers(self, task_id: str) -> List[Task]:
+        """任务尚未完成的前置任务"""
+        return [self.tasks[node] for node in self.blockers.get(task_id, ()) if node in self._unfinished]
+
+    def critical_path(self) -> Tuple[float, List[Task]]:
+        """未完成任务中按预估工时加权的最长依赖链，返回 (总工时, 任务链)"""
+        best: Dict[str, float] = {}
+        via: Dict[str, Optional[str]] = {}
+        end, end_hours = None, 0.0
+        for node in sorted(self._unfinished, key=self._ord.__getitem__):
+            prev, prev_hours = None, 0.0
+            for blocker in self.blockers[node]:
+                if blocker in best and best[blocker] > prev_hours:
+                    prev, prev_hours = blocker, best[blocker]
+            best[node] = prev_hours + (self.tasks[node].estimated_hours or 0.0)
+            via[node] = prev
+            if end is None or best[node] > end_hours:
+                end, end_hours = node, best[node]
+        path = []
+        while end is not None:
+            path.append(self.tasks[end])
+            end = via[end]
+        return end_hours, path[::-1]
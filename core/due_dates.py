@@ -0,0 +1,118 @@
+import bisect
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import List, Dict, Iterable, Optional, Tuple
+from .models import Task
+
+# 只有未完成的任务参与截止日期提醒
+OPEN_STATUSES = {"todo", "in_progress"}
+
+_DATE_RE = re.compile(r"^\s*(\d{4})[-/.年]?(\d{1,2})[-/.月]?(\d{1,2})日?(?:[T\s].*)?$")
+
+
+@lru_cache(maxsize=4096)
+def normalize_due_date(value: Optional[str]) -> Optional[str]:
+    """将自由格式的截止日期规范为 YYYY-MM-DD，无法识别时返回 None
+
+    支持 2024-01-20、2024/1/20、2024.01.20、20240120、2024年1月20日
+    以及带时间的 ISO 格式 (2024-01-20T18:00:00)。
+    """
+    if not value:
+        return None
+    match = _DATE_RE.match(value)
+    if not match:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups())).isoformat()
+    except ValueError:
+        return None
+
+
+def to_date_key(value) -> str:
+    """把 date/datetime/字符串统一为 YYYY-MM-DD"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    key = normalize_due_date(value)
+    if key is None:
+        raise ValueError(f"无法识别的日期: {value}")
+    return key
+
+
+class DueDateIndex:
+    """未完成任务的截止日期有序索引
+
+    作为二级索引挂在 TaskStorage 上，保存按 (规范化截止日期, 任务ID) 排序的列表，
+    区间查询为 O(log n + k)。已完成、已取消、没有有效截止日期的任务和重复任务的系列不在索引中。
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self._entries: List[Tuple[str, str]] = []
+        self._keys: Dict[str, str] = {}
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建索引"""
+        self.__init__()
+        for task in tasks:
+            due = self._due_of(task)
+            if due is not None:
+                self.tasks[task.task_id] = task
+                self._keys[task.task_id] = due
+                self._entries.append((due, task.task_id))
+        self._entries.sort()
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        self.remove(task.task_id)
+        due = self._due_of(task)
+        if due is not None:
+            self.tasks[task.task_id] = task
+            self._keys[task.task_id] = due
+            bisect.insort(self._entries, (due, task.task_id))
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        due = self._keys.pop(task_id, None)
+        self.tasks.pop(task_id, None)
+        if due is None:
+            return
+        pos = bisect.bisect_left(self._entries, (due, task_id))
+        if pos < len(self._entries) and self._entries[pos] == (due, task_id):
+            del self._entries[pos]
+
+    @staticmethod
+    def _due_of(task: Task) -> Optional[str]:
+        # 重复任务的系列本身不到期，实例在查询时按日期范围生成
+        if task.status not in OPEN_STATUSES or task.recurrence:
+            return None
+        return normalize_due_date(task.due_date)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def between(self, start: str, end: str) -> List[Task]:
+        """截止日期在 [start, end] 内的任务，按截止日期排序"""
+        lo = bisect.bisect_left(self._entries, (start,))
+        hi = bisect.bisect_right(self._entries, (end, "\uffff"))
+        return [self.tasks[task_id] for _, task_id in self._entries[lo:hi]]
+
+    def before(self, day: str) -> List[Task]:
+        """截止日期早于 day 的任务"""
+        hi = bisect.bisect_left(self._entries, (day,))
+        return [self.tasks[task_id] for _, task_id in self._entries[:hi]]
+
+    def first_from(self, day: str, n: int) -> List[Task]:
+        """从 day 起最近到期的 n 个任务"""
+        lo = bisect.bisect_left(self._entries, (day,))
+        return [self.tasks[task_id] for _, task_id in self._entries[lo:lo + n]]
+
+
+def today_key() -> str:
+    return date.today().isoformat()
+
+
+def days_from_today(days: int) -> str:
+    return (date.today() + timedelta(days=days)).isoformat()
@@ -0,0 +1,380 @@
+import json
+import os
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Set, Tuple
+from config import TASKS_DIR, HISTORY_UNDO_LIMIT, HISTORY_CHECKPOINT_INTERVAL, HISTORY_MAX_CHECKPOINTS
+from .models import Task, TimeBlock
+from .storage import VersionConflictError, write_json_atomic
+
+# 撤销/重做时不恢复的字段；版本号沿用当前值，否则恢复出的旧版本会被视为冲突
+_VOLATILE_FIELDS = {"updated_at", "version"}
+
+
+def _snapshot(record) -> Optional[Dict[str, Any]]:
+    return record.to_dict() if record is not None else None
+
+
+def diff_records(before: Optional[Dict[str, Any]],
+                 after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """两个版本之间的差量 {"before", "after"}，相同时返回 None
+
+    新建和删除保存完整记录，修改只保存变化的字段。
+    """
+    if before is None and after is None:
+        return None
+    if before is None or after is None:
+        return {"before": before, "after": after}
+    changed = [key for key, value in after.items() if before.get(key) != value]
+    if not changed:
+        return None
+    return {"before": {key: before.get(key) for key in changed},
+            "after": {key: after[key] for key in changed}}
+
+
+class _Recording:
+    """一次操作中涉及的任务和时间块在操作前的快照"""
+
+    def __init__(self, label: str, kind: Optional[str] = None, target: Optional[int] = None):
+        self.label = label
+        self.kind = kind
+        self.target = target
+        self.tasks: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.blocks: Dict[str, Optional[Dict[str, Any]]] = {}
+        # 只因时间块工时汇总而变化的任务
+        self.derived: Set[str] = set()
+
+
+class OperationLog:
+    """操作日志：撤销/重做和按时间点还原任务列表
+
+    TaskManager 的每次操作 (含批量操作) 记为日志中的一行，只保存涉及记录的差量，
+    追加到 <user_id>_history.jsonl。最近 HISTORY_UNDO_LIMIT 次操作保存在内存中供撤销，
+    撤销和重做本身也作为新的操作记入日志，因此日志始终是按时间顺序的完整历史。
+    第一次记录前以及每 HISTORY_CHECKPOINT_INTERVAL 次操作保存一个任务列表检查点，
+    还原某一时刻的任务列表时从该时刻之前最近的检查点起逐行重放日志，
+    内存只需容纳一份任务列表。只保留第一个检查点和最近 HISTORY_MAX_CHECKPOINTS 个，
+    更早的时刻从第一个检查点起重放。
+
+    只记录经 TaskManager 发生的修改；直接修改数据文件或 core.tracking 重算工时不会记入。
+    多个进程共享数据目录时，追加日志在存储的文件锁内进行；日志文件在本进程上次写入后
+    有变化 (其他进程追加过) 时才重新读取文件末尾的序号。撤销栈只包含本进程的操作。
+    """
+
+    def __init__(self, user_id: str, storage):
+        self.user_id = user_id
+        self.storage = storage
+        self.log_file = TASKS_DIR / f"{user_id}_history.jsonl"
+        # 检查点清单 [[序号, 时间, 日志偏移], ...]
+        self.manifest_file = TASKS_DIR / f"{user_id}_checkpoints.json"
+        self.undo_stack: deque = deque(maxlen=HISTORY_UNDO_LIMIT)
+        self.redo_stack: deque = deque(maxlen=HISTORY_UNDO_LIMIT)
+        self._current: Optional[_Recording] = None
+        # 最后一条记录的序号，及读取或写入它时日志文件的 (修改时间, 大小)
+        self._seq: Optional[int] = None
+        self._seq_stamp: Optional[Tuple[int, int]] = None
+
+    def _checkpoint_file(self, seq: int) -> Path:
+        return TASKS_DIR / f"{self.user_id}_checkpoint_{seq}.json"
+
+    def _read_manifest(self) -> List[List[Any]]:
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return []
+
+    def _log_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.log_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _last_seq(self) -> int:
+        """日志中最后一条记录的序号；日志文件没有变化时使用缓存，否则只读取文件末尾"""
+        stamp = self._log_stamp()
+        if self._seq is not None and stamp == self._seq_stamp:
+            return self._seq
+        self._seq = self._read_last_seq()
+        self._seq_stamp = stamp
+        return self._seq
+
+    def _read_last_seq(self) -> int:
+        try:
+            with open(self.log_file, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                window = 64 * 1024
+                while True:
+                    start = max(0, size - window)
+                    f.seek(start)
+                    lines = f.read(size - start).splitlines()
+                    if start > 0:
+                        # 第一行可能不完整
+                        lines = lines[1:]
+                    for line in reversed(lines):
+                        try:
+                            return json.loads(line)["seq"]
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                    if start == 0:
+                        break
+                    window *= 4
+        except FileNotFoundError:
+            pass
+        return 0
+
+    def _write_checkpoint(self, seq: int):
+        """保存当前任务列表为检查点，并在清单中记录对应的日志位置"""
+        offset = self.log_file.stat().st_size if self.log_file.exists() else 0
+        write_json_atomic(self._checkpoint_file(seq),
+                          [task.to_dict() for task in self.storage.load_tasks()], indent=None)
+        manifest = self._read_manifest()
+        manifest.append([seq, datetime.now().isoformat(timespec="microseconds"), offset])
+        # 第一个检查点是日志的起点，始终保留
+        pruned = manifest[1:-HISTORY_MAX_CHECKPOINTS]
+        manifest = manifest[:1] + manifest[1:][-HISTORY_MAX_CHECKPOINTS:]
+        write_json_atomic(self.manifest_file, manifest, indent=None)
+        # 先写清单再删文件，中断时只会留下多余的文件
+        for item in pruned:
+            try:
+                self._checkpoint_file(item[0]).unlink()
+            except FileNotFoundError:
+                pass
+
+    def track(self, task_ids: Iterable[str] = (), block_ids: Iterable[str] = (),
+              derived_task_ids: Iterable[str] = ()):
+        """记录当前操作将要修改的任务和时间块，须在修改之前调用
+
+        时间块所属的任务自动作为工时汇总的派生修改记录；
+        不在 record 中时不做任何事。
+        """
+        recording = self._current
+        if recording is None:
+            return
+        for task_id in task_ids:
+            if task_id not in recording.tasks:
+                recording.tasks[task_id] = _snapshot(self.storage.get_task(task_id))
+            recording.derived.discard(task_id)
+        for block_id in block_ids:
+            if block_id in recording.blocks:
+                continue
+            block = self.storage.get_timeblock(block_id)
+            recording.blocks[block_id] = _snapshot(block)
+            if block is not None:
+                derived_task_ids = list(derived_task_ids) + [block.task_id]
+        for task_id in derived_task_ids:
+            if task_id not in recording.tasks:
+                recording.tasks[task_id] = _snapshot(self.storage.get_task(task_id))
+                recording.derived.add(task_id)
+
+    @contextmanager
+    def record(self, label: str, kind: Optional[str] = None, target: Optional[int] = None):
+        """把其中的修改记为一次操作；嵌套时并入外层操作"""
+        if self._current is not None:
+            yield self._current
+            return
+        with self.storage.lock:
+            if self._last_seq() == 0 and not self._read_manifest():
+                # 日志开始前的状态，作为还原的起点
+                self._write_checkpoint(0)
+        self._current = recording = _Recording(label, kind, target)
+        try:
+            yield recording
+        finally:
+            self._current = None
+            self._commit(recording)
+
+    def _commit(self, recording: _Recording):
+        """比较操作前后的快照，有变化时追加到日志"""
+        changes = []
+        for task_id, before in recording.tasks.items():
+            delta = diff_records(before, _snapshot(self.storage.get_task(task_id)))
+            if delta is not None:
+                delta.update(type="task", id=task_id)
+                if task_id in recording.derived:
+                    delta["derived"] = True
+                changes.append(delta)
+        for block_id, before in recording.blocks.items():
+            delta = diff_records(before, _snapshot(self.storage.get_timeblock(block_id)))
+            if delta is not None:
+                delta.update(type="block", id=block_id)
+                changes.append(delta)
+        if changes:
+            self._append(recording.label, changes, recording.kind, recording.target)
+
+    def log_changes(self, label: str, changes: List[Dict[str, Any]]):
+        """直接记录已经发生的修改，用于事先不知道涉及哪些记录的操作 (如重算工时)"""
+        if not changes:
+            return
+        if self._last_seq() == 0 and not self._read_manifest():
+            # 修改已经发生，检查点只能取修改之后的状态
+            self._write_checkpoint(0)
+            return
+        self._append(label, changes)
+
+    def _append(self, label: str, changes: List[Dict[str, Any]],
+                kind: Optional[str] = None, target: Optional[int] = None):
+        try:
+            with self.storage.lock:
+                # 其他进程可能已追加记录，日志文件有变化时序号以文件末尾为准
+                seq = self._last_seq() + 1
+                entry = {"seq": seq, "ts": datetime.now().isoformat(timespec="microseconds"),
+                         "label": label, "changes": changes}
+                if kind:
+                    entry["kind"] = kind
+                    entry["target"] = target
+                data = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+                with open(self.log_file, 'a+b') as f:
+                    if f.seek(0, os.SEEK_END) > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            # 崩溃留下的半行，另起一行
+                            data = b"\n" + data
+                    f.write(data)
+                    f.flush()
+                    stat = os.fstat(f.fileno())
+                self._seq = seq
+                self._seq_stamp = (stat.st_mtime_ns, stat.st_size)
+                if seq % HISTORY_CHECKPOINT_INTERVAL == 0:
+                    self._write_checkpoint(seq)
+        except OSError:
+            # 日志写入失败不影响数据本身，只是这次操作无法撤销
+            return
+        if kind is None and any(not change.get("derived") for change in changes):
+            self.undo_stack.append(entry)
+            self.redo_stack.clear()
+
+    def undo_label(self) -> Optional[str]:
+        """可以撤销的操作名称，没有时返回 None"""
+        return self.undo_stack[-1]["label"] if self.undo_stack else None
+
+    def redo_label(self) -> Optional[str]:
+        """可以重做的操作名称，没有时返回 None"""
+        return self.redo_stack[-1]["label"] if self.redo_stack else None
+
+    def undo(self) -> Optional[str]:
+        """撤销最近一次操作，返回其名称；没有可撤销的操作或写入失败时返回 None"""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        if not self._replay(entry, forward=False, label=f"撤销: {entry['label']}", kind="undo"):
+            self.undo_stack.append(entry)
+            return None
+        self.redo_stack.append(entry)
+        return entry["label"]
+
+    def redo(self) -> Optional[str]:
+        """重做最近一次撤销的操作，返回其名称；没有可重做的操作或写入失败时返回 None"""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        if not self._replay(entry, forward=True, label=f"重做: {entry['label']}", kind="redo"):
+            self.redo_stack.append(entry)
+            return None
+        self.undo_stack.append(entry)
+        return entry["label"]
+
+    def _replay(self, entry: Dict[str, Any], forward: bool, label: str, kind: str) -> bool:
+        """把操作涉及的记录恢复到操作后 (forward) 或操作前的状态
+
+        修改只恢复记录的字段，期间其他字段的修改保留；派生的工时由时间块重新汇总。
+        """
+        task_saves, task_deletes, block_saves, block_deletes = [], [], [], []
+        for change in entry["changes"]:
+            if change.get("derived"):
+                continue
+            target, source = ((change["after"], change["before"]) if forward
+                              else (change["before"], change["after"]))
+            is_task = change["type"] == "task"
+            if target is None:
+                (task_deletes if is_task else block_deletes).append(change["id"])
+                continue
+            if source is None:
+                (task_saves if is_task else block_saves).append(
+                    Task.from_dict(target) if is_task else TimeBlock.from_dict(target))
+                continue
+            current = self.storage.get_task(change["id"]) if is_task else self.storage.get_timeblock(change["id"])
+            if current is None:
+                # 之后已被删除，无法恢复字段
+                continue
+            data = current.to_dict()
+            data.update((key, value) for key, value in target.items() if key not in _VOLATILE_FIELDS)
+            if is_task:
+                task = Task.from_dict(data)
+                task.update()
+                task_saves.append(task)
+            else:
+                block_saves.append(TimeBlock.from_dict(data))
+        with self.record(label, kind, entry["seq"]):
+            self.track(task_ids=[task.task_id for task in task_saves] + task_deletes,
+                       block_ids=[block.block_id for block in block_saves] + block_deletes,
+                       derived_task_ids=[block.task_id for block in block_saves])
+            try:
+                # 任务的恢复和删除一次写入 (例如撤销批量删除时恢复任务、删掉跳过的实例)
+                return ((not (task_saves or task_deletes) or self.storage.write_tasks(task_saves, task_deletes))
+                        and (not block_saves or self.storage.save_timeblocks(block_saves))
+                        and (not block_deletes or self.storage.delete_timeblocks(block_deletes)))
+            except VersionConflictError:
+                # 读取之后被其他进程修改，本次不恢复，可以再次撤销
+                return False
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """逐行读取日志"""
+        try:
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def tasks_as_of(self, when: datetime) -> Optional[List[Task]]:
+        """还原 when 时刻的任务列表，早于日志开始时返回 None
+
+        从 when 之前最近的检查点开始，按检查点记录的偏移定位日志，逐行重放到 when 为止。
+        """
+        moment = when.isoformat(timespec="microseconds")
+        checkpoint = None
+        for item in self._read_manifest():
+            if item[1] <= moment:
+                checkpoint = item
+        if checkpoint is None:
+            return None
+        seq, _, offset = checkpoint
+        try:
+            with open(self._checkpoint_file(seq), 'r', encoding='utf-8') as f:
+                state = {data["task_id"]: data for data in json.load(f)}
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None
+        try:
+            with open(self.log_file, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry["seq"] <= seq:
+                        continue
+                    if entry["ts"] > moment:
+                        break
+                    for change in entry["changes"]:
+                        if change["type"] == "task":
+                            self._apply_change(state, change)
+        except FileNotFoundError:
+            pass
+        return [Task.from_dict(data) for data in state.values()]
+
+    @staticmethod
+    def _apply_change(state: Dict[str, Dict[str, Any]], change: Dict[str, Any]):
+        if change["after"] is None:
+            state.pop(change["id"], None)
+        elif change["before"] is None:
+            state[change["id"]] = dict(change["after"])
+        elif change["id"] in state:
+            state[change["id"]].update(change["after"])
@@ -0,0 +1,187 @@
+import random
+from datetime import datetime
+from typing import List, Dict, Iterable, Optional, Tuple
+from .models import TimeBlock
+
+
+class TimeBlockOverlapError(ValueError):
+    """新时间块与已有时间块重叠"""
+
+    def __init__(self, overlaps: List[TimeBlock]):
+        super().__init__(f"与 {len(overlaps)} 个已有时间块重叠")
+        self.overlaps = overlaps
+
+
+def parse_time(value: str) -> Optional[float]:
+    """解析 ISO 格式时间为时间戳，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+def to_timestamp(value) -> float:
+    """把 datetime 或 ISO 字符串转为时间戳，无法识别时抛出 ValueError"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    timestamp = parse_time(value)
+    if timestamp is None:
+        raise ValueError(f"无法识别的时间: {value}")
+    return timestamp
+
+
+def block_hours(block: TimeBlock) -> float:
+    """时间块计入任务的工时：计划时段不计入，记录了 actual_hours 时用它，否则用起止时间之差"""
+    if block.planned:
+        return 0.0
+    if (block.actual_hours or 0.0) > 0:
+        return block.actual_hours
+    start = parse_time(block.start_time)
+    end = parse_time(block.end_time)
+    if start is None or end is None or end <= start:
+        return 0.0
+    return (end - start) / 3600.0
+
+
+def format_time(timestamp: float) -> str:
+    """时间戳转为与 TimeBlock 一致的 ISO 格式 (本地时间)"""
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="minutes")
+
+
+class _Node:
+    __slots__ = ("start", "end", "block_id", "priority", "left", "right", "max_end")
+
+    def __init__(self, start: float, end: float, block_id: str):
+        self.start = start
+        self.end = end
+        self.block_id = block_id
+        self.priority = random.random()
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.max_end = end
+
+    @property
+    def key(self) -> Tuple[float, str]:
+        return (self.start, self.block_id)
+
+    def update(self):
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+
+def _split(node: Optional[_Node], key: Tuple[float, str]) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """按键拆分为 (< key, >= key) 两棵树"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        node.update()
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    node.update()
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    """合并两棵树，left 中的键全部小于 right"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+class IntervalIndex:
+    """时间块的区间树
+
+    以 (开始时间, 时间块ID) 为键的 treap，每个节点记录子树中最大的结束时间，
+    插入、删除为 O(log n)，区间相交查询为 O(log n + k)。
+    作为时间块索引挂在 TaskStorage 上，随每次保存/删除增量更新。
+    """
+
+    def __init__(self):
+        self.blocks: Dict[str, TimeBlock] = {}
+        self._root: Optional[_Node] = None
+        self._spans: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._spans)
+
+    def rebuild(self, timeblocks: Iterable[TimeBlock]):
+        """从全部时间块重建索引"""
+        self.__init__()
+        for block in timeblocks:
+            self.put(block)
+
+    def put(self, block: TimeBlock):
+        """新增或更新时间块，时间无法解析的时间块不进入区间树"""
+        self.remove(block.block_id)
+        self.blocks[block.block_id] = block
+        start = parse_time(block.start_time)
+        end = parse_time(block.end_time)
+        if start is None or end is None or end <= start:
+            return
+        node = _Node(start, end, block.block_id)
+        left, right = _split(self._root, node.key)
+        self._root = _merge(_merge(left, node), right)
+        self._spans[block.block_id] = (start, end)
+
+    def remove(self, block_id: str):
+        """删除时间块"""
+        self.blocks.pop(block_id, None)
+        span = self._spans.pop(block_id, None)
+        if span is None:
+            return
+        key = (span[0], block_id)
+        left, rest = _split(self._root, key)
+        # 拆出恰好等于 key 的节点：rest 中最小的键就是它
+        _, right = _split(rest, (span[0], block_id + "\0"))
+        self._root = _merge(left, right)
+
+    def overlapping(self, start: float, end: float) -> List[TimeBlock]:
+        """与 [start, end) 相交的时间块，按开始时间排序"""
+        result: List[TimeBlock] = []
+        self._collect(self._root, start, end, result)
+        return result
+
+    def _collect(self, node: Optional[_Node], start: float, end: float, result: List[TimeBlock]):
+        if node is None or node.max_end <= start:
+            return
+        self._collect(node.left, start, end, result)
+        if node.start >= end:
+            # 右子树的开始时间都不早于本节点，不可能相交
+            return
+        if node.end > start:
+            result.append(self.blocks[node.block_id])
+        self._collect(node.right, start, end, result)
+
+    def gaps(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """[start, end) 内没有被任何时间块占用的空闲区间"""
+        free = []
+        cursor = start
+        for block in self.overlapping(start, end):
+            block_start, block_end = self._spans[block.block_id]
+            if block_start > cursor:
+                free.append((cursor, block_start))
+            cursor = max(cursor, block_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            free.append((cursor, end))
+        return free
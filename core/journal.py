@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
+from config import (TASKS_DIR, JOURNAL_COMPACT_MIN_RECORDS,
+                    JOURNAL_COMPACT_RATIO, JOURNAL_COMPACT_MAX_BYTES)
+from .models import Task, TimeBlock
+from .storage import TaskStorage, VersionConflictError, write_json_records_atomic
+
+class JournalTaskStorage(TaskStorage):
+    """追加日志存储引擎
+
+    每次创建/更新/删除只向 <user_id>_journal.jsonl 追加一行记录，
+    打开时读取快照 (<user_id>_tasks.json / <user_id>_timeblocks.json) 并重放日志。
+    日志超过阈值后在后台线程中压缩为新的快照，快照格式与 json 引擎一致。
+    多个进程共享数据目录时，写入在文件锁内追加；只有日志变长时只重放新增的部分，
+    并逐条通知索引，不必重新读取快照。
+    """
+
+    def __init__(self, user_id: str, tasks_dir: Optional[Path] = None):
+        tasks_dir = tasks_dir or TASKS_DIR
+        self.journal_file = tasks_dir / f"{user_id}_journal.jsonl"
+        # 压缩期间旧日志被改名为此文件，压缩完成后删除
+        self.compacting_file = tasks_dir / f"{user_id}_journal.jsonl.compacting"
+        self._lock = threading.RLock()
+        self._stamp: Optional[Tuple] = None
+        self._journal_records = 0
+        self._journal_bytes = 0
+        # 已重放到的日志文件位置 (字节)
+        self._journal_offset = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+        super().__init__(user_id, tasks_dir)
+
+    def _state_stamp(self) -> Tuple:
+        """快照和日志文件的整体状态"""
+        return tuple(self._file_stamp(path) for path in
+                     (self.task_file, self.timeblock_file,
+                      self.compacting_file, self.journal_file))
+
+    def _refresh(self):
+        """文件状态变化时重新读取快照并重放日志；只是日志变长时只重放新增部分"""
+        if self.refresh_paused:
+            return
+        with self._lock:
+            stamp = self._state_stamp()
+            if stamp == self._stamp:
+                return
+            if (self._stamp is not None and stamp[:3] == self._stamp[:3]
+                    and stamp[3] is not None and stamp[3][1] >= self._journal_offset):
+                self._replay_tail(stamp)
+                return
+            # 快照和日志须在文件锁内一起读取，否则可能读到其他进程压缩到一半的状态
+            # (新快照 + 尚未删除的旧日志，或旧快照 + 已清空的日志)；整体重新读取很少发生
+            with self.lock:
+                stamp = self._state_stamp()
+                self._tasks = {task.task_id: task for task in self._read_tasks()}
+                self._timeblocks = {block.block_id: block for block in self._read_timeblocks()}
+                self._journal_records = 0
+                self._journal_bytes = 0
+                self._replay(self.compacting_file)
+                self._journal_offset = self._replay(self.journal_file)
+            self._stamp = stamp
+            self._rebuild_indexes(list(self._tasks.values()))
+            self._rebuild_timeblock_indexes(list(self._timeblocks.values()))
+
+    def _replay_tail(self, stamp: Tuple):
+        """重放其他进程追加的日志并逐条通知索引"""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._stamp = None
+            return
+        # 只处理完整的行，写到一半的行留到下次
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            self._journal_bytes += len(line) + 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(record, notify=True)
+            self._journal_records += self._record_weight(record)
+        self._journal_offset += end
+        self._notify_commit()
+        # 有未完整的行时记下不同的状态，下次访问再读
+        self._stamp = stamp if end == len(data) else stamp[:3] + (None,)
+
+    def _refresh_tasks(self):
+        self._refresh()
+
+    def _refresh_timeblocks(self):
+        self._refresh()
+
+    def invalidate(self):
+        """丢弃缓存，下次访问时重新读取快照和日志"""
+        with self._lock:
+            self._stamp = None
+
+    def _replay(self, path: Path) -> int:
+        """将日志中的记录应用到缓存，返回已重放的完整行的字节数"""
+        offset = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # 正在写入的行，下次再读
+                        break
+                    offset += len(line)
+                    self._journal_bytes += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中途崩溃留下的半行记录，忽略
+                        continue
+                    self._apply(record)
+                    self._journal_records += self._record_weight(record)
+        except FileNotFoundError:
+            pass
+        return offset
+
+    def _apply(self, record: Dict[str, Any], notify: bool = False):
+        """应用单条日志记录，notify 为 True 时同时更新索引"""
+        op = record.get("op")
+        if op == "task":
+            task = Task.from_dict(record["data"])
+            self._tasks[task.task_id] = task
+            if notify:
+                self._notify_put(task)
+        elif op == "task_del":
+            if self._tasks.pop(record["id"], None) is not None and notify:
+                self._notify_remove(record["id"])
+        elif op == "block":
+            block = TimeBlock.from_dict(record["data"])
+            self._timeblocks[block.block_id] = block
+            if notify:
+                self._notify_timeblock_put(block)
+        elif op == "block_del":
+            if self._timeblocks.pop(record["id"], None) is not None and notify:
+                self._notify_timeblock_remove(record["id"])
+        elif op == "batch":
+            # 批量写入作为一行记录，要么整行生效要么整行被忽略
+            for item in record["records"]:
+                self._apply(item, notify)
+
+    def _append(self, records: List[Dict[str, Any]]):
+        """向日志追加记录，须在文件锁内、重放到最新之后调用"""
+        data = "".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+                       for record in records).encode('utf-8')
+        with open(self.journal_file, 'ab') as f:
+            if os.fstat(f.fileno()).st_size > self._journal_offset:
+                # 其他进程崩溃留下的半行，先换行使其成为一条可跳过的坏记录
+                data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        self._journal_records += sum(self._record_weight(record) for record in records)
+        self._journal_bytes += len(data)
+        self._stamp = self._state_stamp()
+        self._maybe_compact()
+
+    @staticmethod
+    def _record_weight(record: Dict[str, Any]) -> int:
+        """记录包含的修改条数，用于判断是否需要压缩"""
+        return len(record["records"]) if record.get("op") == "batch" else 1
+
+    @staticmethod
+    def _batch(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """多条记录合并为一条 batch 记录，保证原子性"""
+        if len(records) == 1:
+            return records
+        return [{"op": "batch", "records": records}]
+
+    def write_tasks(self, tasks: Iterable[Task], delete_ids: Iterable[str]) -> bool:
+        """保存 tasks 并删除 delete_ids，只追加一行日志；失败时全部不生效"""
+        tasks = list(tasks)
+        previous = None
+        with self._lock:
+            try:
+                with self.lock:
+                    self._refresh()
+                    previous = self._stamp_versions(tasks)
+                    for task in tasks:
+                        self._tasks[task.task_id] = task
+                    removed = [task_id for task_id in delete_ids if self._tasks.pop(task_id, None) is not None]
+                    if not tasks and not removed:
+                        return True
+                    # 先更新索引再追加日志，失败时整体重新加载
+                    for task in tasks:
+                        self._notify_put(task)
+                    for task_id in removed:
+                        self._notify_remove(task_id)
+                    self._append(self._batch([{"op": "task", "data": task.to_dict()} for task in tasks]
+                                             + [{"op": "task_del", "id": task_id} for task_id in removed]))
+            except VersionConflictError:
+                raise
+            except Exception:
+                if previous is not None:
+                    self._restore_versions(tasks, previous)
+                self._stamp = None
+                self._notify_rollback()
+                return False
+            self._notify_commit()
+            return True
+
+    def _write_timeblocks(self, changes: List[Tuple[str, Optional[TimeBlock]]]) -> bool:
+        """时间块和任务工时的修改合并为一行日志，同时生效"""
+        with self._lock, self.lock:
+            try:
+                self._refresh()
+                applied = []
+                records = []
+                for block_id, timeblock in changes:
+                    previous = self._timeblocks.get(block_id)
+                    if timeblock is None and previous is None:
+                        continue
+                    applied.append((previous, timeblock))
+                    if timeblock is None:
+                        del self._timeblocks[block_id]
+                        records.append({"op": "block_del", "id": block_id})
+                    else:
+                        self._timeblocks[block_id] = timeblock
+                        records.append({"op": "block", "data": timeblock.to_dict()})
+                if not applied:
+                    return True
+                tasks = self._rolled_up_tasks(applied)
+                self._bump_versions(tasks, {})
+                for task in tasks:
+                    self._tasks[task.task_id] = task
+                    records.append({"op": "task", "data": task.to_dict()})
+                self._notify_timeblock_changes(applied)
+                for task in tasks:
+                    self._notify_put(task)
+                self._append(self._batch(records))
+            except Exception:
+                self._stamp = None
+                self._notify_rollback()
+                return False
+            self._notify_commit()
+            return True
+
+    def _iter_timeblocks(self) -> Iterator[TimeBlock]:
+        """时间块需要重放日志才能得到，直接使用缓存"""
+        return iter(self.load_timeblocks())
+
+    def _maybe_compact(self):
+        """日志超过阈值时触发后台压缩"""
+        live_records = len(self._tasks) + len(self._timeblocks)
+        if self._journal_records < JOURNAL_COMPACT_MIN_RECORDS:
+            return
+        if (self._journal_records > live_records * JOURNAL_COMPACT_RATIO
+                or self._journal_bytes > JOURNAL_COMPACT_MAX_BYTES):
+            self.compact()
+
+    def compact(self, background: bool = True) -> bool:
+        """将当前状态写成快照并清空日志，返回是否启动了压缩"""
+        with self._lock, self.lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return False
+            self._refresh()
+            if self.compacting_file.exists():
+                # 上次压缩未完成，缓存中已包含其记录，直接同步压缩；
+                # 日志没有改名，计数和已重放到的位置仍与日志文件对应
+                background = False
+            elif self.journal_file.exists():
+                os.replace(self.journal_file, self.compacting_file)
+                # 改名之后的写入都进入新日志，计数从零开始
+                self._journal_records = 0
+                self._journal_bytes = 0
+                self._journal_offset = 0
+            else:
+                return False
+            tasks = list(self._tasks.values())
+            timeblocks = list(self._timeblocks.values())
+            self._stamp = self._state_stamp()
+            if not background:
+                self._write_snapshot(tasks, timeblocks)
+                return True
+            self._compaction_thread = threading.Thread(
+                target=self._write_snapshot, args=(tasks, timeblocks), daemon=True)
+            self._compaction_thread.start()
+            return True
+
+    def _write_snapshot(self, tasks: List[Task], timeblocks: List[TimeBlock]):
+        """写入快照并删除已压缩的日志
+
+        快照可能包含改名之后才发生的修改，但新日志会在其之上重放，
+        记录按ID覆盖，因此重放结果不变。替换快照和删除旧日志在文件锁内完成，
+        其他进程不会读到只替换了一半的状态。此处只持有文件锁，不持有 self._lock，
+        前台线程持有 self._lock 等待文件锁时不会死锁。
+        """
+        try:
+            with self.lock:
+                write_json_records_atomic(self.task_file, (task.to_dict() for task in tasks))
+                write_json_records_atomic(self.timeblock_file, (block.to_dict() for block in timeblocks))
+                self.compacting_file.unlink()
+                written = (self._file_stamp(self.task_file), self._file_stamp(self.timeblock_file), None)
+        except (OSError, TimeoutError):
+            # 保留 .compacting 文件，下次访问时快照状态不同，整体重新读取
+            return
+        with self._lock:
+            # 只记下自己写入的快照；日志部分保留已重放到的状态，
+            # 其他进程在此期间追加的记录在下次访问时照常重放
+            if self._stamp is not None:
+                self._stamp = written + self._stamp[3:]
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """等待后台压缩结束"""
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join(timeout)
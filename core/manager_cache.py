@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+from config import API_MAX_MANAGERS, API_MANAGER_IDLE_SECONDS
+from .task_manager import TaskManager
+
+
+class _Entry:
+    __slots__ = ("manager", "lock", "users", "last_used")
+
+    def __init__(self):
+        self.manager: Optional[TaskManager] = None
+        # TaskManager 不是线程安全的，同一用户的操作依次执行
+        self.lock = threading.Lock()
+        self.users = 0
+        self.last_used = 0.0
+
+
+class ManagerCache:
+    """多个用户的 TaskManager 缓存
+
+    每个用户的 TaskManager (及其存储和索引) 在第一次使用时加载，之后保留在内存中供后续请求使用；
+    超过 max_managers 个时关闭最久未使用的，空闲超过 idle_timeout 秒的也会关闭，
+    正在使用的不会被关闭。同一用户的操作依次执行，不同用户的操作 (包括加载) 可以并行。
+    """
+
+    def __init__(self, max_managers: int = API_MAX_MANAGERS, idle_timeout: float = API_MANAGER_IDLE_SECONDS,
+                 factory: Callable[[str], TaskManager] = TaskManager,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_managers = max_managers
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id: str):
+        return user_id in self._entries
+
+    @contextmanager
+    def lease(self, user_id: str) -> Iterator[TaskManager]:
+        """独占使用一个用户的 TaskManager，退出时记为最近使用"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry()
+            self._entries.move_to_end(user_id)
+            entry.users += 1
+        try:
+            with entry.lock:
+                if entry.manager is None:
+                    entry.manager = self._factory(user_id)
+                yield entry.manager
+        finally:
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = self._clock()
+            self.evict()
+
+    def evict(self) -> int:
+        """关闭空闲超时和超出数量上限的 TaskManager，返回关闭的数量"""
+        now = self._clock()
+        removed: List[_Entry] = []
+        with self._lock:
+            excess = len(self._entries) - self.max_managers
+            # 按最近使用的顺序，最久未使用的在前
+            for user_id, entry in list(self._entries.items()):
+                if entry.users:
+                    continue
+                if excess > 0 or now - entry.last_used >= self.idle_timeout:
+                    del self._entries[user_id]
+                    removed.append(entry)
+                    excess -= 1
+        for entry in removed:
+            self._close(entry)
+        return len(removed)
+
+    def close(self):
+        """关闭所有 TaskManager"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            with entry.lock:
+                self._close(entry)
+
+    @staticmethod
+    def _close(entry: _Entry):
+        manager, entry.manager = entry.manager, None
+        close = getattr(manager.storage, "close", None) if manager is not None else None
+        if close is not None:
+            close()
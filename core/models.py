@@ -1,71 +1,208 @@
-from dataclasses import dataclass, asdict
+import sys
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 import uuid
 
-@dataclass
+# 任务状态和优先级的取值
+TASK_STATUSES = ("todo", "in_progress", "done", "cancelled")
+TASK_PRIORITIES = ("low", "medium", "high", "urgent")
+
+
+def _interned(value):
+    # 状态、优先级、用户ID、标签等取值有限，驻留后所有记录共用一份字符串
+    return sys.intern(value) if type(value) is str else value
+
+
 class Task:
-    task_id: str
-    user_id: str
-    title: str
-    description: str = ""
-    created_at: str = None
-    updated_at: str = None
-    status: str = "todo"  # todo, in_progress, done, cancelled
-    priority: str = "medium"  # low, medium, high, urgent
-    due_date: Optional[str] = None
-    estimated_hours: float = 0.0
-    actual_hours: float = 0.0
-    tags: List[str] = None
-    
-    def __post_init__(self):
-        current_time = datetime.now().isoformat()
-        if self.created_at is None:
-            self.created_at = current_time
-        if self.updated_at is None:
-            self.updated_at = current_time
-        if self.tags is None:
-            self.tags = []
-    
+    """任务
+
+    使用 __slots__，不为每个任务分配 __dict__；to_dict/from_dict 按固定字段顺序
+    直接读写属性，不经过 dataclasses.asdict 的递归深拷贝。已有的时间戳原样保留，
+    只有缺少时才取当前时间。
+    """
+    __slots__ = ("task_id", "user_id", "title", "description", "created_at", "updated_at",
+                 "status", "priority", "due_date", "estimated_hours", "actual_hours", "tags",
+                 "blocked_by", "recurrence", "series_id", "occurrence_date", "version")
+
+    # 字段顺序，与构造函数参数和 to_dict 的输出一致
+    FIELDS = ("task_id", "user_id", "title", "description", "created_at", "updated_at",
+              "status", "priority", "due_date", "estimated_hours", "actual_hours", "tags",
+              "blocked_by", "recurrence", "series_id", "occurrence_date", "version")
+
+    def __init__(self, task_id: str, user_id: str, title: str, description: str = "",
+                 created_at: str = None, updated_at: str = None,
+                 status: str = "todo",  # todo, in_progress, done, cancelled
+                 priority: str = "medium",  # low, medium, high, urgent
+                 due_date: Optional[str] = None, estimated_hours: float = 0.0, actual_hours: float = 0.0,
+                 tags: List[str] = None,
+                 blocked_by: List[str] = None,  # 前置任务ID，这些任务完成后才能开始
+                 recurrence: Optional[Dict[str, Any]] = None,  # 重复规则，见 core.recurrence.RecurrenceRule
+                 series_id: Optional[str] = None,  # 重复任务的实例所属的系列任务ID
+                 occurrence_date: Optional[str] = None,  # 实例对应的重复日期
+                 version: int = 0):  # 每次保存时由存储引擎加一，用于发现其他进程的并发修改
+        self.task_id = task_id
+        self.user_id = _interned(user_id)
+        self.title = title
+        self.description = description
+        if created_at is None or updated_at is None:
+            current_time = datetime.now().isoformat()
+            if created_at is None:
+                created_at = current_time
+            if updated_at is None:
+                updated_at = current_time
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.status = _interned(status)
+        self.priority = _interned(priority)
+        self.due_date = due_date
+        self.estimated_hours = estimated_hours
+        self.actual_hours = actual_hours
+        self.tags = tags if tags is not None else []
+        self.blocked_by = blocked_by if blocked_by is not None else []
+        self.recurrence = recurrence
+        self.series_id = series_id
+        self.occurrence_date = occurrence_date
+        self.version = version
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"Task({values})"
+
     def to_dict(self):
         """转换为字典"""
-        return asdict(self)
-    
+        recurrence = self.recurrence
+        return {
+            "task_id": self.task_id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "description": self.description,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "status": self.status,
+            "priority": self.priority,
+            "due_date": self.due_date,
+            "estimated_hours": self.estimated_hours,
+            "actual_hours": self.actual_hours,
+            "tags": list(self.tags),
+            "blocked_by": list(self.blocked_by),
+            "recurrence": dict(recurrence) if recurrence is not None else None,
+            "series_id": self.series_id,
+            "occurrence_date": self.occurrence_date,
+            "version": self.version,
+        }
+
     @classmethod
     def from_dict(cls, data):
-        """从字典创建实例"""
-        return cls(**data)
-    
+        """从字典创建实例；旧文件中缺少的字段取默认值，忽略未知字段
+
+        加载时每条记录都要调用，直接给各属性赋值，不经过 __init__ 的参数绑定。
+        """
+        task = object.__new__(cls)
+        get = data.get
+        task.task_id = data["task_id"]
+        task.user_id = _interned(data["user_id"])
+        task.title = data["title"]
+        task.description = get("description", "")
+        created_at = get("created_at")
+        updated_at = get("updated_at")
+        if created_at is None or updated_at is None:
+            current_time = datetime.now().isoformat()
+            if created_at is None:
+                created_at = current_time
+            if updated_at is None:
+                updated_at = current_time
+        task.created_at = created_at
+        task.updated_at = updated_at
+        task.status = _interned(get("status", "todo"))
+        task.priority = _interned(get("priority", "medium"))
+        task.due_date = get("due_date")
+        task.estimated_hours = get("estimated_hours", 0.0)
+        task.actual_hours = get("actual_hours", 0.0)
+        tags = get("tags")
+        task.tags = [_interned(tag) for tag in tags] if tags else []
+        task.blocked_by = get("blocked_by") or []
+        task.recurrence = get("recurrence")
+        task.series_id = get("series_id")
+        task.occurrence_date = get("occurrence_date")
+        task.version = get("version", 0)
+        return task
+
     def update(self, **kwargs):
         """更新任务属性"""
         for key, value in kwargs.items():
-            if hasattr(self, key):
+            if key in _TASK_FIELDS:
                 setattr(self, key, value)
         self.updated_at = datetime.now().isoformat()
-    
+
     def mark_done(self):
         """标记为完成"""
         self.status = "done"
         self.updated_at = datetime.now().isoformat()
-    
+
     def mark_in_progress(self):
         """标记为进行中"""
         self.status = "in_progress"
         self.updated_at = datetime.now().isoformat()
 
-@dataclass
+
+_TASK_FIELDS = frozenset(Task.FIELDS)
+
+
 class TimeBlock:
-    block_id: str
-    user_id: str
-    task_id: str
-    start_time: str
-    end_time: str
-    description: str = ""
-    actual_hours: float = 0.0
-    
+    """时间块，与 Task 一样使用 __slots__ 和按字段顺序的序列化
+
+    planned 为 True 的是自动排程安排的计划时段，不计入任务的实际工时。
+    """
+    __slots__ = ("block_id", "user_id", "task_id", "start_time", "end_time", "description", "actual_hours",
+                 "planned")
+
+    FIELDS = __slots__
+
+    def __init__(self, block_id: str, user_id: str, task_id: str, start_time: str, end_time: str,
+                 description: str = "", actual_hours: float = 0.0, planned: bool = False):
+        self.block_id = block_id
+        self.user_id = _interned(user_id)
+        # 一个任务通常有多个时间块
+        self.task_id = _interned(task_id)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.description = description
+        self.actual_hours = actual_hours
+        self.planned = planned
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"TimeBlock({values})"
+
     def to_dict(self):
-        return asdict(self)
-    
+        return {
+            "block_id": self.block_id,
+            "user_id": self.user_id,
+            "task_id": self.task_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "description": self.description,
+            "actual_hours": self.actual_hours,
+            "planned": self.planned,
+        }
+
     @classmethod
     def from_dict(cls, data):
-        return cls(**data)
\ No newline at end of file
+        get = data.get
+        # SQLite 中以整数存储
+        return cls(data["block_id"], data["user_id"], data["task_id"], data["start_time"], data["end_time"],
+                   get("description", ""), get("actual_hours", 0.0), bool(get("planned", False)))
@@ -0,0 +1,434 @@
+import base64
+import bisect
+import heapq
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Set, Tuple
+from .models import Task
+from .due_dates import normalize_due_date, to_date_key
+
+# 优先级从低到高
+PRIORITY_RANK = {"low": 0, "medium": 1, "high": 2, "urgent": 3}
+
+# 可用于排序的字段
+SORTABLE_FIELDS = {"title", "status", "priority", "due_date", "created_at", "updated_at",
+                   "estimated_hours", "actual_hours"}
+
+# 同时保留的排序键索引数 (每种 order_by 一个)，超出时丢弃最久未用的
+MAX_SORT_INDEXES = 8
+
+
+def due_key(task: Task) -> Optional[str]:
+    """截止日期排序键 (YYYY-MM-DD)，空值或无法识别时返回 None"""
+    return normalize_due_date(task.due_date)
+
+
+@dataclass
+class TaskQuery:
+    """任务查询条件
+
+    status/priority 为 IN 条件，tags 要求包含全部标签，due_before/due_after 为
+    闭区间；order_by 中字段名前加 "-" 表示降序；cursor 取自上一页结果的
+    next_cursor，与 offset 二选一；fields 不为空时返回只含这些字段的字典。
+    """
+    status: Optional[Iterable[str]] = None
+    priority: Optional[Iterable[str]] = None
+    min_priority: Optional[str] = None
+    due_before: Optional[str] = None
+    due_after: Optional[str] = None
+    tags: Optional[Iterable[str]] = None
+    min_estimated_hours: Optional[float] = None
+    max_estimated_hours: Optional[float] = None
+    min_actual_hours: Optional[float] = None
+    max_actual_hours: Optional[float] = None
+    order_by: List[str] = field(default_factory=list)
+    limit: Optional[int] = None
+    offset: int = 0
+    cursor: Optional[str] = None
+    fields: Optional[List[str]] = None
+
+    def __post_init__(self):
+        if isinstance(self.status, str):
+            self.status = [self.status]
+        if isinstance(self.priority, str):
+            self.priority = [self.priority]
+        if isinstance(self.tags, str):
+            self.tags = [self.tags]
+        if self.due_before is not None:
+            self.due_before = to_date_key(self.due_before)
+        if self.due_after is not None:
+            self.due_after = to_date_key(self.due_after)
+        if isinstance(self.order_by, str):
+            self.order_by = [self.order_by]
+        for name in self.order_by:
+            if name.lstrip("-") not in SORTABLE_FIELDS:
+                raise ValueError(f"不支持按 {name} 排序")
+        if self.min_priority is not None and self.min_priority not in PRIORITY_RANK:
+            raise ValueError(f"未知的优先级: {self.min_priority}")
+        if isinstance(self.fields, str):
+            self.fields = [self.fields]
+        unknown = [name for name in self.fields or () if name not in Task.FIELDS]
+        if unknown:
+            raise ValueError(f"未知的字段: {', '.join(unknown)}")
+        # matches 对每个任务调用，允许的优先级只在构造时计算一次
+        self._allowed = self._merge_priorities()
+
+    def _merge_priorities(self) -> Optional[Set[str]]:
+        allowed = set(self.priority) if self.priority is not None else None
+        if self.min_priority is not None:
+            rank = PRIORITY_RANK[self.min_priority]
+            at_least = {p for p, r in PRIORITY_RANK.items() if r >= rank}
+            allowed = at_least if allowed is None else allowed & at_least
+        return allowed
+
+    def allowed_priorities(self) -> Optional[Set[str]]:
+        """priority 与 min_priority 合并后允许的优先级"""
+        return self._allowed
+
+    def matches(self, task: Task) -> bool:
+        """判断任务是否满足全部条件"""
+        if self.status is not None and task.status not in self.status:
+            return False
+        allowed = self._allowed
+        if allowed is not None and task.priority not in allowed:
+            return False
+        due = due_key(task)
+        if (self.due_before is not None or self.due_after is not None) and due is None:
+            return False
+        if self.due_before is not None and due > self.due_before:
+            return False
+        if self.due_after is not None and due < self.due_after:
+            return False
+        if self.tags and not set(self.tags) <= set(task.tags):
+            return False
+        for value, low, high in ((task.estimated_hours, self.min_estimated_hours, self.max_estimated_hours),
+                                 (task.actual_hours, self.min_actual_hours, self.max_actual_hours)):
+            if low is not None and value < low:
+                return False
+            if high is not None and value > high:
+                return False
+        return True
+
+
+@dataclass
+class QueryResult:
+    """查询结果，next_cursor 为 None 表示没有下一页"""
+    items: List[Any]
+    next_cursor: Optional[str] = None
+
+
+class _Descending:
+    """降序排序时包装字段值"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class _Highest:
+    """比任何值都大，用作排序键区间的上界"""
+    __slots__ = ()
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_HIGHEST = _Highest()
+
+
+def _field_value(task: Task, name: str):
+    if name == "priority":
+        return PRIORITY_RANK.get(task.priority, -1)
+    if name == "due_date":
+        return due_key(task)
+    return getattr(task, name)
+
+
+def _sort_key(values: List[Any], order_by: List[str], task_id: str) -> Tuple:
+    """组合排序键：空值总排在最后，最后按任务ID保证顺序稳定"""
+    key = []
+    for value, name in zip(values, order_by):
+        if value is None:
+            key.append((1, 0))
+        else:
+            key.append((0, _Descending(value) if name.startswith("-") else value))
+    key.append(task_id)
+    return tuple(key)
+
+
+def task_sort_key(task: Task, order_by: List[str]) -> Tuple:
+    return _sort_key([_field_value(task, name.lstrip("-")) for name in order_by],
+                     order_by, task.task_id)
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """分页游标：有排序时记录末条的排序键 {"key": [字段值, 任务ID]}，否则记录 {"offset": n}"""
+    return base64.urlsafe_b64encode(json.dumps(payload, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("无效的分页游标")
+    if not isinstance(payload, dict):
+        raise ValueError("无效的分页游标")
+    return payload
+
+
+class TaskIndex:
+    """任务二级索引
+
+    由 TaskStorage 在每次写入时维护：状态、优先级、标签的倒排集合，
+    以及按截止日期排序的 (截止日期, 任务ID) 列表。排序查询按完整排序键
+    (task_sort_key) 建立有序列表，每种 order_by 一个，第一次按它排序时建立，
+    之后随写入维护；有序列表中取前 limit 条只需从游标位置顺序向后检查条件，
+    第一个排序字段取值很少 (如 -priority) 时也不必对同值的一整组排序。
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self.by_status: Dict[str, Set[str]] = {}
+        self.by_priority: Dict[str, Set[str]] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        self.by_due: List[Tuple[str, str]] = []
+        self.without_due: Set[str] = set()
+        # order_by -> (按完整排序键排序的列表, 任务ID -> 排序键)，按最近使用排列
+        self._orders: "OrderedDict[Tuple[str, ...], Tuple[List[Tuple], Dict[str, Tuple]]]" = OrderedDict()
+        # 并发的查询 (AsyncTaskManager 的读取) 可能同时建立或淘汰排序索引
+        self._orders_lock = threading.Lock()
+        # 任务ID -> 入索引时的 (状态, 优先级, 标签, 截止日期)，用于更新时撤销旧条目
+        self._keys: Dict[str, Tuple] = {}
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建索引；排序键索引丢弃，下次按该排序查询时重新建立"""
+        self.__init__()
+        for task in tasks:
+            self._add(task)
+        self.by_due.sort()
+
+    def put(self, task: Task):
+        """新增或更新任务，更新时保持原有的存储顺序"""
+        self._unindex(task.task_id)
+        self._add(task, keep_sorted=True)
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        self._unindex(task_id)
+        self.tasks.pop(task_id, None)
+
+    def _unindex(self, task_id: str):
+        keys = self._keys.pop(task_id, None)
+        if keys is None:
+            return
+        status, priority, tags, due = keys
+        self._discard(self.by_status, status, task_id)
+        self._discard(self.by_priority, priority, task_id)
+        for tag in tags:
+            self._discard(self.by_tag, tag, task_id)
+        if due is None:
+            self.without_due.discard(task_id)
+        else:
+            self._delete_sorted(self.by_due, (due, task_id))
+        for entries, sort_keys in self._orders.values():
+            self._delete_sorted(entries, sort_keys.pop(task_id))
+
+    @staticmethod
+    def _delete_sorted(entries: List[Tuple], entry: Tuple):
+        pos = bisect.bisect_left(entries, entry)
+        if pos < len(entries) and entries[pos] == entry:
+            del entries[pos]
+
+    def _add(self, task: Task, keep_sorted: bool = False):
+        tags = tuple(set(task.tags or []))
+        due = due_key(task)
+        self.tasks[task.task_id] = task
+        self.by_status.setdefault(task.status, set()).add(task.task_id)
+        self.by_priority.setdefault(task.priority, set()).add(task.task_id)
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(task.task_id)
+        if due is None:
+            self.without_due.add(task.task_id)
+        elif keep_sorted:
+            bisect.insort(self.by_due, (due, task.task_id))
+        else:
+            self.by_due.append((due, task.task_id))
+        for order, (entries, sort_keys) in self._orders.items():
+            key = sort_keys[task.task_id] = task_sort_key(task, list(order))
+            bisect.insort(entries, key)
+        self._keys[task.task_id] = (task.status, task.priority, tags, due)
+
+    def _sort_index(self, order_by: List[str]) -> List[Tuple]:
+        """按完整排序键排序的列表，没有时建立"""
+        order = tuple(order_by)
+        with self._orders_lock:
+            entry = self._orders.get(order)
+            if entry is not None:
+                self._orders.move_to_end(order)
+            else:
+                sort_keys = {task_id: task_sort_key(task, order_by) for task_id, task in self.tasks.items()}
+                entry = self._orders[order] = (sorted(sort_keys.values()), sort_keys)
+                while len(self._orders) > MAX_SORT_INDEXES:
+                    self._orders.popitem(last=False)
+            return entry[0]
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, task_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(task_id)
+            if not ids:
+                del index[key]
+
+    def _candidates(self, query: TaskQuery) -> Optional[Set[str]]:
+        """用倒排索引求候选任务ID，返回 None 表示没有可用的索引条件"""
+        sets = []
+        if query.status is not None:
+            sets.append(self._union(self.by_status, query.status))
+        allowed = query.allowed_priorities()
+        if allowed is not None:
+            sets.append(self._union(self.by_priority, allowed))
+        for tag in query.tags or []:
+            sets.append(self.by_tag.get(tag, set()))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+        return result
+
+    @staticmethod
+    def _union(index: Dict[str, Set[str]], keys: Iterable[str]) -> Set[str]:
+        result = set()
+        for key in keys:
+            result |= index.get(key, set())
+        return result
+
+    def _due_range(self, query: TaskQuery) -> Tuple[int, int]:
+        """截止日期条件在 by_due 中对应的下标范围"""
+        start = 0
+        end = len(self.by_due)
+        if query.due_after is not None:
+            start = bisect.bisect_left(self.by_due, (query.due_after,))
+        if query.due_before is not None:
+            # 任务ID不会以 \uffff 开头，因此能包含截止日期相等的全部条目
+            end = bisect.bisect_right(self.by_due, (query.due_before, "\uffff"))
+        return start, end
+
+    @staticmethod
+    def _key_range(query: TaskQuery, entries: List[Tuple]) -> Tuple[int, int]:
+        """第一个排序字段为截止日期时，截止日期条件在排序键列表中对应的下标范围"""
+        first = query.order_by[0]
+        if first.lstrip("-") != "due_date":
+            return 0, len(entries)
+        low, high = query.due_after, query.due_before
+        wrap = lambda value: value
+        if first.startswith("-"):
+            low, high, wrap = high, low, _Descending
+        start = 0 if low is None else bisect.bisect_left(entries, ((0, wrap(low)),))
+        end = len(entries) if high is None else bisect.bisect_right(entries, ((0, wrap(high)), _HIGHEST))
+        return start, end
+
+    def _walk_sorted(self, query: TaskQuery, candidates: Optional[Set[str]], after: Optional[Tuple],
+                     wanted: Optional[int]) -> Iterator[Task]:
+        """沿完整排序键的有序列表，从游标 after 之后顺序给出满足条件的任务，取够 wanted 条后停止"""
+        entries = self._sort_index(query.order_by)
+        start, end = self._key_range(query, entries)
+        if after is not None:
+            start = max(start, bisect.bisect_right(entries, after))
+        emitted = 0
+        for pos in range(start, end):
+            task_id = entries[pos][-1]
+            if candidates is not None and task_id not in candidates:
+                continue
+            task = self.tasks[task_id]
+            if not query.matches(task):
+                continue
+            yield task
+            emitted += 1
+            if wanted is not None and emitted >= wanted:
+                return
+
+    def execute(self, query: TaskQuery) -> QueryResult:
+        """执行查询，未指定排序时按存储顺序返回"""
+        candidates = self._candidates(query)
+        has_due_range = query.due_before is not None or query.due_after is not None
+        order_by = query.order_by
+        after = None
+        skip = query.offset
+        if query.cursor:
+            payload = decode_cursor(query.cursor)
+            try:
+                if order_by:
+                    values, task_id = payload["key"]
+                    if len(values) != len(order_by) or not isinstance(task_id, str):
+                        raise ValueError
+                    after = _sort_key(values, order_by, task_id)
+                    skip = 0
+                else:
+                    skip = payload["offset"]
+                    if not isinstance(skip, int) or skip < 0:
+                        raise ValueError
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("无效的分页游标")
+        wanted = None if query.limit is None else skip + query.limit + 1
+
+        if order_by and (candidates is None or len(candidates) > 4 * (wanted or len(candidates))):
+            # 候选集很大时沿排序键索引遍历，只检查到取够 limit 条为止
+            ordered: Iterable[Task] = self._walk_sorted(query, candidates, after, wanted)
+        else:
+            if candidates is None and has_due_range:
+                start, end = self._due_range(query)
+                candidates = {task_id for _, task_id in self.by_due[start:end]}
+            if candidates is None:
+                pool = self.tasks.values()
+            elif not order_by:
+                pool = [task for task_id, task in self.tasks.items() if task_id in candidates]
+            else:
+                pool = [self.tasks[task_id] for task_id in candidates]
+            matched = (t for t in pool if query.matches(t))
+            if after is not None:
+                matched = (t for t in matched if task_sort_key(t, order_by) > after)
+            if not order_by:
+                ordered = matched
+            elif wanted is not None:
+                ordered = heapq.nsmallest(wanted, matched, key=lambda t: task_sort_key(t, order_by))
+            else:
+                ordered = sorted(matched, key=lambda t: task_sort_key(t, order_by))
+
+        page: List[Task] = []
+        has_more = False
+        page_start = skip
+        for task in ordered:
+            if skip:
+                skip -= 1
+                continue
+            if query.limit is not None and len(page) >= query.limit:
+                has_more = True
+                break
+            page.append(task)
+
+        next_cursor = None
+        if has_more and page:
+            if order_by:
+                last = page[-1]
+                values = [_field_value(last, name.lstrip("-")) for name in order_by]
+                next_cursor = encode_cursor({"key": [values, last.task_id]})
+            else:
+                next_cursor = encode_cursor({"offset": page_start + len(page)})
+        items: List[Any] = page
+        if query.fields:
+            items = [{name: getattr(task, name) for name in query.fields} for task in page]
+        return QueryResult(items=items, next_cursor=next_cursor)
@@ -0,0 +1,168 @@
+import calendar
+from dataclasses import dataclass, asdict
+from datetime import date, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from .models import Task
+from .due_dates import OPEN_STATUSES, normalize_due_date
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+# 未保存的重复任务实例的ID: <系列任务ID>@<YYYY-MM-DD>
+OCCURRENCE_SEPARATOR = "@"
+
+
+@dataclass
+class RecurrenceRule:
+    """重复规则，保存在系列任务的 recurrence 字段中
+
+    从 start 起每 interval 天/周/月重复一次，until (含) 和 count 限制结束；
+    按月重复时，没有对应日期的月份取月末 (1月31日 -> 2月28/29日)。
+    """
+    freq: str
+    start: str
+    interval: int = 1
+    until: Optional[str] = None
+    count: Optional[int] = None
+
+    def __post_init__(self):
+        if self.freq not in FREQUENCIES:
+            raise ValueError(f"重复频率必须是 {', '.join(FREQUENCIES)} 之一")
+        if not isinstance(self.interval, int) or self.interval < 1:
+            raise ValueError("重复间隔必须是正整数")
+        if self.count is not None and self.count < 1:
+            raise ValueError("重复次数必须是正整数")
+        start = normalize_due_date(self.start)
+        if start is None:
+            raise ValueError(f"无法识别的开始日期: {self.start}")
+        self.start = start
+        if self.until is not None:
+            until = normalize_due_date(self.until)
+            if until is None:
+                raise ValueError(f"无法识别的结束日期: {self.until}")
+            self.until = until
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RecurrenceRule":
+        return cls(**data)
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def iter_occurrences(rule: RecurrenceRule, window_start: date, window_end: date) -> Iterator[date]:
+    """惰性生成 [window_start, window_end] 内的重复日期
+
+    直接跳到窗口内的第一次，开销只与窗口内的次数有关，与系列已经重复过多少次无关。
+    """
+    anchor = date.fromisoformat(rule.start)
+    end = window_end
+    if rule.until is not None:
+        end = min(end, date.fromisoformat(rule.until))
+    if rule.freq == "monthly":
+        months = (window_start.year - anchor.year) * 12 + window_start.month - anchor.month
+        n = max(0, months // rule.interval - 1)
+        step = None
+    else:
+        step = rule.interval * (7 if rule.freq == "weekly" else 1)
+        n = max(0, -(-(window_start - anchor).days // step))
+    while rule.count is None or n < rule.count:
+        day = (_add_months(anchor, n * rule.interval) if step is None
+               else anchor + timedelta(days=n * step))
+        if day > end:
+            return
+        if day >= window_start:
+            yield day
+        n += 1
+
+
+def occurrence_id(series_id: str, day: str) -> str:
+    return f"{series_id}{OCCURRENCE_SEPARATOR}{day}"
+
+
+def parse_occurrence_id(task_id: str) -> Optional[Tuple[str, str]]:
+    """未保存实例的ID拆分为 (系列任务ID, 日期)，不是实例ID时返回 None"""
+    series_id, sep, day = task_id.rpartition(OCCURRENCE_SEPARATOR)
+    if not sep or normalize_due_date(day) != day:
+        return None
+    return series_id, day
+
+
+def make_occurrence(series: Task, day: str, task_id: Optional[str] = None) -> Task:
+    """由系列任务生成某一天的实例，task_id 为空时生成未保存的实例"""
+    return Task(
+        task_id=task_id or occurrence_id(series.task_id, day),
+        user_id=series.user_id,
+        title=series.title,
+        description=series.description,
+        priority=series.priority,
+        due_date=day,
+        estimated_hours=series.estimated_hours,
+        tags=list(series.tags),
+        series_id=series.task_id,
+        occurrence_date=day
+    )
+
+
+class RecurrenceIndex:
+    """重复任务系列及已保存实例的索引
+
+    作为二级索引挂在 TaskStorage 上。系列任务 (带 recurrence) 本身不展开，
+    查询某个日期范围时才由 iter_occurrences 生成实例；
+    只有被编辑、完成或跳过的实例才作为普通任务保存，这里按 (系列ID, 日期) 记录它们。
+    """
+
+    def __init__(self):
+        self.series: Dict[str, Task] = {}
+        self.rules: Dict[str, RecurrenceRule] = {}
+        self.instances: Dict[Tuple[str, str], Task] = {}
+        self._instance_keys: Dict[str, Tuple[str, str]] = {}
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建"""
+        self.__init__()
+        for task in tasks:
+            self.put(task)
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        self.remove(task.task_id)
+        if task.recurrence:
+            try:
+                self.rules[task.task_id] = RecurrenceRule.from_dict(task.recurrence)
+            except (TypeError, ValueError):
+                return
+            self.series[task.task_id] = task
+        elif task.series_id and task.occurrence_date:
+            key = (task.series_id, task.occurrence_date)
+            self.instances[key] = task
+            self._instance_keys[task.task_id] = key
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        self.series.pop(task_id, None)
+        self.rules.pop(task_id, None)
+        key = self._instance_keys.pop(task_id, None)
+        if key is not None:
+            self.instances.pop(key, None)
+
+    def occurrences(self, start: date, end: date) -> List[Task]:
+        """[start, end] 内的全部实例，已保存的实例代替生成的实例，按日期排序
+
+        已结束 (完成或取消) 的系列不再生成实例。
+        """
+        result = []
+        for series_id, series in self.series.items():
+            if series.status not in OPEN_STATUSES:
+                continue
+            for day in iter_occurrences(self.rules[series_id], start, end):
+                key = (series_id, day.isoformat())
+                stored = self.instances.get(key)
+                result.append(stored if stored is not None else make_occurrence(series, key[1]))
+        result.sort(key=lambda task: (task.occurrence_date, task.title))
+        return result
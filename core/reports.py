@@ -0,0 +1,211 @@
+import warnings
+from datetime import date, datetime
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from .models import Task, TimeBlock
+from .due_dates import to_date_key
+
+try:
+    import numpy as np
+except ImportError:  # 工时报表为可选功能: pip install numpy
+    np = None
+
+PERIODS = ("day", "week", "month")
+
+
+def _parse_local(value: str):
+    """单个时间字符串转为本地时间的 datetime64[s]，无法解析时为 NaT"""
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except (ValueError, TypeError, AttributeError):
+        return np.datetime64("NaT")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return np.datetime64(parsed, "s")
+
+
+def to_datetime64(values: List[str]):
+    """时间字符串列表批量转为 datetime64[s]
+
+    全部是不带时区的 ISO 时间时由 NumPy 一次性解析，否则逐个解析，
+    带时区的换算为本地时间，无法解析的为 NaT。
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        try:
+            return np.array(values, dtype="datetime64[s]")
+        except (ValueError, TypeError, Warning):
+            pass
+    return np.array([_parse_local(value) for value in values], dtype="datetime64[s]")
+
+
+def _week_label(monday: int) -> str:
+    year, week, _ = date.fromordinal(date(1970, 1, 1).toordinal() + monday).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class TimeBlockColumns:
+    """时间块的列式数组
+
+    start/end 为本地时间的 datetime64[s]，hours 为时间块工时
+    (记录了 actual_hours 时用它，否则用起止时间之差)，
+    task 为任务在 task_ids 中的下标，任务不存在时为 -1。
+    """
+
+    def __init__(self, timeblocks: List[TimeBlock], task_ids: List[str]):
+        self.task_ids = task_ids
+        positions = {task_id: i for i, task_id in enumerate(task_ids)}
+        self.start = to_datetime64([block.start_time for block in timeblocks])
+        self.end = to_datetime64([block.end_time for block in timeblocks])
+        recorded = np.fromiter((block.actual_hours or 0.0 for block in timeblocks),
+                               dtype=float, count=len(timeblocks))
+        timed = ~(np.isnat(self.start) | np.isnat(self.end))
+        seconds = np.where(timed, (self.end - self.start).astype(np.int64), 0)
+        duration = np.maximum(seconds, 0) / 3600.0
+        self.hours = np.where(recorded > 0, recorded, duration)
+        self.task = np.fromiter((positions.get(block.task_id, -1) for block in timeblocks),
+                                dtype=np.int64, count=len(timeblocks))
+
+    def __len__(self):
+        return len(self.hours)
+
+
+class TimeRollups:
+    """基于 NumPy 的工时汇总
+
+    作为时间块索引挂在 TaskStorage 上，只记录时间块的增删，计划时段 (planned) 不参与汇总；
+    列式数组在时间块变化后的第一次查询时重建，之后的分组汇总都是向量化运算。
+    任务列表在每次查询时传入，标题、标签和预估工时以查询时为准。
+    """
+
+    def __init__(self):
+        self.blocks: Dict[str, TimeBlock] = {}
+        self._columns: Optional[TimeBlockColumns] = None
+
+    def rebuild(self, timeblocks: Iterable[TimeBlock]):
+        """从全部时间块重建"""
+        self.blocks = {block.block_id: block for block in timeblocks if not block.planned}
+        self._columns = None
+
+    def put(self, block: TimeBlock):
+        """新增或更新时间块"""
+        if block.planned:
+            self.remove(block.block_id)
+            return
+        self.blocks[block.block_id] = block
+        self._columns = None
+
+    def remove(self, block_id: str):
+        """删除时间块"""
+        if self.blocks.pop(block_id, None) is not None:
+            self._columns = None
+
+    def columns(self, tasks: List[Task]) -> TimeBlockColumns:
+        """当前时间块的列式数组，任务列表变化时重新映射任务下标"""
+        if np is None:
+            raise ImportError("工时报表需要 NumPy: pip install numpy")
+        task_ids = [task.task_id for task in tasks]
+        if self._columns is None:
+            self._columns = TimeBlockColumns(list(self.blocks.values()), task_ids)
+        elif self._columns.task_ids != task_ids:
+            positions = {task_id: i for i, task_id in enumerate(task_ids)}
+            self._columns.task = np.fromiter(
+                (positions.get(block.task_id, -1) for block in self.blocks.values()),
+                dtype=np.int64, count=len(self.blocks))
+            self._columns.task_ids = task_ids
+        return self._columns
+
+    def by_period(self, tasks: List[Task], period: str = "day",
+                  start=None, end=None) -> List[Tuple[str, float]]:
+        """按开始时间所在的 日/ISO 周/月 汇总工时，start/end 为日期 (含)
+
+        跨越零点的时间块整块计入开始的那一天。
+        """
+        if period not in PERIODS:
+            raise ValueError(f"period 必须是 {', '.join(PERIODS)} 之一")
+        cols = self.columns(tasks)
+        days = cols.start.astype("datetime64[D]")
+        mask = ~np.isnat(days)
+        if start is not None:
+            mask &= days >= np.datetime64(to_date_key(start))
+        if end is not None:
+            mask &= days <= np.datetime64(to_date_key(end))
+        days, hours = days[mask], cols.hours[mask]
+        if period == "day":
+            keys = days.astype(np.int64)
+        elif period == "week":
+            # 1970-01-01 是星期四，减去到周一的偏移得到所在 ISO 周的周一
+            keys = days.astype(np.int64)
+            keys = keys - (keys + 3) % 7
+        else:
+            keys = days.astype("datetime64[M]").astype(np.int64)
+        groups, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=hours, minlength=len(groups))
+        if period == "day":
+            labels = groups.astype("datetime64[D]").astype(str)
+        elif period == "week":
+            labels = [_week_label(int(monday)) for monday in groups]
+        else:
+            labels = groups.astype("datetime64[M]").astype(str)
+        return [(str(label), float(total)) for label, total in zip(labels, totals)]
+
+    def _task_hours(self, cols: TimeBlockColumns, n_tasks: int):
+        known = cols.task >= 0
+        return np.bincount(cols.task[known], weights=cols.hours[known], minlength=n_tasks)
+
+    def by_task(self, tasks: List[Task]) -> List[Tuple[Task, float]]:
+        """每个任务记录的工时，按工时降序，不含没有时间块的任务"""
+        cols = self.columns(tasks)
+        hours = self._task_hours(cols, len(tasks))
+        order = np.argsort(-hours, kind="stable")
+        return [(tasks[i], float(hours[i])) for i in order if hours[i] > 0]
+
+    def by_tag(self, tasks: List[Task]) -> List[Tuple[str, float]]:
+        """每个标签下任务记录的工时，按工时降序；多个标签的任务计入每个标签"""
+        cols = self.columns(tasks)
+        hours = self._task_hours(cols, len(tasks))
+        tag_names: Dict[str, int] = {}
+        pair_task, pair_tag = [], []
+        for i, task in enumerate(tasks):
+            for tag in dict.fromkeys(task.tags or []):
+                pair_task.append(i)
+                pair_tag.append(tag_names.setdefault(tag, len(tag_names)))
+        if not tag_names:
+            return []
+        totals = np.bincount(np.array(pair_tag, dtype=np.int64),
+                             weights=hours[np.array(pair_task, dtype=np.int64)],
+                             minlength=len(tag_names))
+        names = list(tag_names)
+        order = np.argsort(-totals, kind="stable")
+        return [(names[i], float(totals[i])) for i in order if totals[i] > 0]
+
+    def variance(self, tasks: List[Task]) -> Dict[str, Any]:
+        """预估工时与记录工时的偏差
+
+        items 为有预估或有记录的任务，按偏差绝对值降序，
+        每项为 {task, estimated_hours, tracked_hours, variance, ratio}，
+        variance = 记录 - 预估，ratio = 记录 / 预估 (无预估时为 None)；
+        unassigned_hours 为所属任务已不存在的时间块工时。
+        """
+        cols = self.columns(tasks)
+        tracked = self._task_hours(cols, len(tasks))
+        estimated = np.fromiter((task.estimated_hours or 0.0 for task in tasks),
+                                dtype=float, count=len(tasks))
+        diff = tracked - estimated
+        involved = np.flatnonzero((estimated > 0) | (tracked > 0))
+        order = involved[np.argsort(-np.abs(diff[involved]), kind="stable")]
+        items = [{
+            "task": tasks[i],
+            "estimated_hours": float(estimated[i]),
+            "tracked_hours": float(tracked[i]),
+            "variance": float(diff[i]),
+            "ratio": float(tracked[i] / estimated[i]) if estimated[i] > 0 else None
+        } for i in order]
+        estimated_total = float(estimated[involved].sum())
+        tracked_total = float(tracked[involved].sum())
+        return {
+            "items": items,
+            "estimated_hours": estimated_total,
+            "tracked_hours": tracked_total,
+            "variance": tracked_total - estimated_total,
+            "unassigned_hours": float(cols.hours[cols.task < 0].sum())
+        }
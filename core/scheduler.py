@@ -0,0 +1,162 @@
+import heapq
+import math
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Tuple, Iterable
+from .models import Task, TimeBlock
+from .due_dates import OPEN_STATUSES, normalize_due_date
+from .intervals import IntervalIndex, format_time
+from .query import PRIORITY_RANK
+
+# 自动排程生成的时间块的描述
+PLANNED_DESCRIPTION = "自动排程"
+
+
+@dataclass
+class PlanConstraints:
+    """排程约束
+
+    work_start/work_end 为每天的工作时间 (HH:MM)，workdays 为工作日 (周一为 0)，
+    短于 min_block_minutes 的空闲时段不安排任务，
+    max_task_hours_per_day 限制单个任务每天安排的工时 (None 为不限)。
+    priority_lead_days 把高优先级任务的截止日期视为提前若干天，使其更早被安排；
+    not_before 之前不安排 (None 为当前时间)。参数不合理时抛出 ValueError。
+    """
+    work_start: str = "09:00"
+    work_end: str = "18:00"
+    workdays: Tuple[int, ...] = (0, 1, 2, 3, 4)
+    min_block_minutes: int = 30
+    max_task_hours_per_day: Optional[float] = None
+    priority_lead_days: Dict[str, int] = field(default_factory=lambda: {"urgent": 2, "high": 1})
+    not_before: Optional[datetime] = None
+
+    def __post_init__(self):
+        start = datetime.strptime(self.work_start, "%H:%M").time()
+        end = datetime.strptime(self.work_end, "%H:%M").time()
+        if start >= end:
+            raise ValueError("工作结束时间必须晚于开始时间")
+        if self.min_block_minutes < 1:
+            raise ValueError("最短时间块至少为 1 分钟")
+        if self.max_task_hours_per_day is not None and (
+                self.max_task_hours_per_day <= 0
+                or self.max_task_hours_per_day * 60 < self.min_block_minutes):
+            raise ValueError("每天工时上限必须大于 0 且不短于最短时间块")
+
+
+@dataclass
+class SchedulePlan:
+    """排程结果，blocks 尚未保存
+
+    unscheduled 为范围内放不下的任务及剩余工时，
+    late 为安排完成时间晚于截止日期的任务。
+    """
+    blocks: List[TimeBlock]
+    unscheduled: List[Tuple[Task, float]]
+    late: List[Task]
+
+    @property
+    def planned_hours(self) -> float:
+        return sum((datetime.fromisoformat(block.end_time) - datetime.fromisoformat(block.start_time))
+                   .total_seconds() for block in self.blocks) / 3600.0
+
+
+def remaining_hours(task: Task, planned_hours: float = 0.0) -> float:
+    """未完成任务还需安排的工时：预估减去已记录和已排程的，重复任务的系列不安排"""
+    if task.status not in OPEN_STATUSES or task.recurrence:
+        return 0.0
+    return max((task.estimated_hours or 0.0) - (task.actual_hours or 0.0) - planned_hours, 0.0)
+
+
+def _minute(timestamp: float, up: bool) -> int:
+    """时间戳取整到整分钟，返回秒"""
+    minutes = math.ceil(timestamp / 60) if up else math.floor(timestamp / 60)
+    return int(minutes * 60)
+
+
+def plan_schedule(tasks: Iterable[Task], busy: IntervalIndex, start_day: date, end_day: date,
+                  constraints: PlanConstraints, user_id: str,
+                  planned_hours: Optional[Dict[str, float]] = None) -> SchedulePlan:
+    """把任务按截止日期优先 (EDF) 排入 [start_day, end_day] 的空闲时段
+
+    planned_hours 为各任务已保存但尚未进行的排程工时，不再重复安排。
+
+    堆顶为 (截止日期 - 优先级提前天数, 优先级, 输入顺序) 最小的任务，
+    按时间顺序遍历每天工作时间内未被已有时间块占用的时段，依次分给堆顶任务，
+    任务完成或达到当天上限时出堆，总复杂度 O(n log n + 时段数)。
+    """
+    heap = []
+    remaining: Dict[str, int] = {}
+    by_id: Dict[str, Task] = {}
+    planned_hours = planned_hours or {}
+    for seq, task in enumerate(tasks):
+        hours = remaining_hours(task, planned_hours.get(task.task_id, 0.0))
+        seconds = int(math.ceil(hours * 60 - 1e-9)) * 60
+        if seconds <= 0:
+            continue
+        due = normalize_due_date(task.due_date)
+        if due is None:
+            effective_due = math.inf
+        else:
+            effective_due = (date.fromisoformat(due).toordinal()
+                             - constraints.priority_lead_days.get(task.priority, 0))
+        heap.append((effective_due, -PRIORITY_RANK.get(task.priority, 0), seq, task.task_id))
+        remaining[task.task_id] = seconds
+        by_id[task.task_id] = task
+    heapq.heapify(heap)
+
+    work_start = datetime.strptime(constraints.work_start, "%H:%M").time()
+    work_end = datetime.strptime(constraints.work_end, "%H:%M").time()
+    not_before = (constraints.not_before or datetime.now()).timestamp()
+    min_block = constraints.min_block_minutes * 60
+    daily_cap = (int(constraints.max_task_hours_per_day * 3600)
+                 if constraints.max_task_hours_per_day else None)
+    blocks: List[TimeBlock] = []
+    finished: Dict[str, float] = {}
+
+    day = start_day
+    while day <= end_day and heap:
+        if day.weekday() in constraints.workdays:
+            window_start = max(datetime.combine(day, work_start).timestamp(), not_before)
+            window_end = datetime.combine(day, work_end).timestamp()
+            deferred = []
+            used_today: Dict[str, int] = {}
+            for gap_start, gap_end in (busy.gaps(window_start, window_end) if window_start < window_end else []):
+                cursor, gap_end = _minute(gap_start, up=True), _minute(gap_end, up=False)
+                while heap and gap_end - cursor >= min_block:
+                    task_id = heap[0][3]
+                    seconds = min(remaining[task_id], gap_end - cursor)
+                    if daily_cap is not None:
+                        seconds = min(seconds, daily_cap - used_today.get(task_id, 0))
+                    if seconds <= 0:
+                        # 约束已校验，不应发生；防止在同一位置无限循环
+                        break
+                    blocks.append(TimeBlock(
+                        block_id=str(uuid.uuid4()),
+                        user_id=user_id,
+                        task_id=task_id,
+                        start_time=format_time(cursor),
+                        end_time=format_time(cursor + seconds),
+                        description=PLANNED_DESCRIPTION,
+                        planned=True
+                    ))
+                    cursor += seconds
+                    remaining[task_id] -= seconds
+                    used_today[task_id] = used_today.get(task_id, 0) + seconds
+                    if remaining[task_id] <= 0:
+                        heapq.heappop(heap)
+                        finished[task_id] = cursor
+                    elif daily_cap is not None and used_today[task_id] >= daily_cap:
+                        deferred.append(heapq.heappop(heap))
+            for entry in deferred:
+                heapq.heappush(heap, entry)
+        day += timedelta(days=1)
+
+    unscheduled = [(by_id[task_id], seconds / 3600.0)
+                   for task_id, seconds in remaining.items() if seconds > 0]
+    late = []
+    for task_id, end in finished.items():
+        due = normalize_due_date(by_id[task_id].due_date)
+        if due is not None and datetime.fromtimestamp(end - 1).date().isoformat() > due:
+            late.append(by_id[task_id])
+    return SchedulePlan(blocks=blocks, unscheduled=unscheduled, late=late)
@@ -0,0 +1,149 @@
+import heapq
+import math
+import re
+from typing import List, Dict, Iterable, Tuple
+from .models import Task
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# 中日韩文字按字切分，其余文字 (含带重音的字母) 按单词切分
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+# 各字段命中时的权重
+FIELD_WEIGHTS = (("title", 3.0), ("tags", 2.0), ("description", 1.0))
+# 非中日韩单词的前缀也建索引 (至少 PREFIX_MIN_LENGTH 个字符)，前缀命中按此比例降低权重
+PREFIX_MIN_LENGTH = 2
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text: str, for_query: bool = False) -> List[str]:
+    """切分文本
+
+    中日韩文字没有空格分词，建索引时生成单字和相邻两字 (bigram)；
+    查询时多字的片段只用 bigram，单字片段用单字。
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall(text.casefold()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query:
+            tokens.extend(bigrams if bigrams else [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+class SearchIndex:
+    """任务标题、描述和标签的倒排索引
+
+    作为二级索引挂在 TaskStorage 上，随每次保存/删除增量更新。
+    查询要求包含全部词项，按 词频 x 字段权重 x IDF 排序。非中日韩单词的前缀同样作为词项
+    (权重乘以 PREFIX_WEIGHT)，查询 "rep" 可以找到 "report"，完整单词命中排在前缀命中之前。
+
+    倒排表按权重分桶 (词项 -> {权重: 任务ID})，权重只有少数几种取值。查询时从最短的
+    倒排表的最高权重桶开始遍历，其他词项的权重从 _doc_terms 中直接查出；一旦前 limit 个
+    得分不低于剩余任务可能达到的上限即停止，常见词的宽泛查询只需检查约 limit 个任务。
+    最坏情况 (各词项高权重的任务很少同时出现) 仍需遍历最短的倒排表。
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        # 词项 -> {权重: {任务ID: None}}，用 dict 保持插入顺序，同分时结果稳定
+        self.postings: Dict[str, Dict[float, Dict[str, None]]] = {}
+        # 词项 -> 包含该词项的任务数
+        self.doc_freq: Dict[str, int] = {}
+        # 任务ID -> {词项: 权重}，查询时取其他词项的权重，更新时用于撤销旧的倒排条目
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建索引"""
+        self.__init__()
+        for task in tasks:
+            self._add(task)
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        self.remove(task.task_id)
+        self._add(task)
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        terms = self._doc_terms.pop(task_id, None)
+        self.tasks.pop(task_id, None)
+        if terms is None:
+            return
+        for term, weight in terms.items():
+            buckets = self.postings[term]
+            docs = buckets[weight]
+            del docs[task_id]
+            if not docs:
+                del buckets[weight]
+            self.doc_freq[term] -= 1
+            if not self.doc_freq[term]:
+                del self.postings[term]
+                del self.doc_freq[term]
+
+    def _add(self, task: Task):
+        terms: Dict[str, float] = {}
+        for field_name, weight in FIELD_WEIGHTS:
+            value = getattr(task, field_name)
+            text = " ".join(value) if isinstance(value, list) else (value or "")
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0.0) + weight
+                if not _CJK_RE.match(term):
+                    for end in range(PREFIX_MIN_LENGTH, len(term)):
+                        prefix = term[:end]
+                        terms[prefix] = terms.get(prefix, 0.0) + weight * PREFIX_WEIGHT
+        self.tasks[task.task_id] = task
+        self._doc_terms[task.task_id] = terms
+        for term, weight in terms.items():
+            self.postings.setdefault(term, {}).setdefault(weight, {})[task.task_id] = None
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, Task]]:
+        """返回按相关度降序的 (得分, 任务)"""
+        terms = list(dict.fromkeys(tokenize(query, for_query=True)))
+        if not terms or limit <= 0:
+            return []
+        if any(term not in self.postings for term in terms):
+            return []
+        total = len(self.tasks)
+        # 从最短的倒排表开始遍历
+        terms.sort(key=self.doc_freq.__getitem__)
+        idf = {term: math.log(1 + total / self.doc_freq[term]) for term in terms}
+        lead, others = terms[0], terms[1:]
+        # 其他词项的最高权重得分，按与实际得分相同的顺序累加出上限
+        others_max = [max(self.postings[term]) * idf[term] for term in others]
+        # 小顶堆 (得分, -序号, 任务ID)，同分时先遍历到的排在前面
+        heap: List[Tuple[float, int, str]] = []
+        seen = 0
+        buckets = self.postings[lead]
+        for weight in sorted(buckets, reverse=True):
+            base = bound = weight * idf[lead]
+            for value in others_max:
+                bound += value
+            if len(heap) >= limit and heap[0][0] >= bound:
+                break
+            for task_id in buckets[weight]:
+                doc_terms = self._doc_terms[task_id]
+                score = base
+                for term in others:
+                    other = doc_terms.get(term)
+                    if other is None:
+                        break
+                    score += other * idf[term]
+                else:
+                    seen += 1
+                    entry = (score, -seen, task_id)
+                    if len(heap) < limit:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+                    if len(heap) >= limit and heap[0][0] >= bound:
+                        # 本桶及之后的任务得分都不会超过 bound
+                        break
+        heap.sort(reverse=True)
+        return [(score, self.tasks[task_id]) for score, _, task_id in heap]
@@ -0,0 +1,502 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple
+from config import TASKS_DIR
+from .models import Task, TimeBlock
+from .storage import TaskStorage, VersionConflictError, iter_json_array
+from .statistics import totals_drift
+
+# 列名与模型字段一一对应；新增字段时追加到末尾，打开旧数据库时自动补列
+TASK_COLUMNS = {
+    "task_id": "TEXT PRIMARY KEY",
+    "user_id": "TEXT NOT NULL",
+    "title": "TEXT NOT NULL",
+    "description": "TEXT NOT NULL DEFAULT ''",
+    "created_at": "TEXT",
+    "updated_at": "TEXT",
+    "status": "TEXT NOT NULL DEFAULT 'todo'",
+    "priority": "TEXT NOT NULL DEFAULT 'medium'",
+    "due_date": "TEXT",
+    "estimated_hours": "REAL NOT NULL DEFAULT 0",
+    "actual_hours": "REAL NOT NULL DEFAULT 0",
+    "tags": "TEXT NOT NULL DEFAULT '[]'",
+    "blocked_by": "TEXT NOT NULL DEFAULT '[]'",
+    "recurrence": "TEXT",
+    "series_id": "TEXT",
+    "occurrence_date": "TEXT",
+    "version": "INTEGER NOT NULL DEFAULT 0",
+}
+
+TIMEBLOCK_COLUMNS = {
+    "block_id": "TEXT PRIMARY KEY",
+    "user_id": "TEXT NOT NULL",
+    "task_id": "TEXT NOT NULL",
+    "start_time": "TEXT NOT NULL",
+    "end_time": "TEXT NOT NULL",
+    "description": "TEXT NOT NULL DEFAULT ''",
+    "actual_hours": "REAL NOT NULL DEFAULT 0",
+    "planned": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# 以 JSON 文本存储的列
+JSON_COLUMNS = {"tags", "blocked_by", "recurrence"}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(priority)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks(due_date)",
+    "CREATE INDEX IF NOT EXISTS idx_timeblocks_start_time ON timeblocks(start_time)",
+    "CREATE INDEX IF NOT EXISTS idx_timeblocks_task_id ON timeblocks(task_id)",
+]
+
+# 按状态分组的统计表，由触发器随 tasks 表的每次写入增量维护
+STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS task_stats (
+    status TEXT PRIMARY KEY,
+    task_count INTEGER NOT NULL,
+    estimated_hours REAL NOT NULL,
+    actual_hours REAL NOT NULL
+)"""
+
+_STATS_ADD = """
+    INSERT INTO task_stats (status, task_count, estimated_hours, actual_hours)
+    VALUES (NEW.status, 1, NEW.estimated_hours, NEW.actual_hours)
+    ON CONFLICT(status) DO UPDATE SET
+        task_count = task_count + 1,
+        estimated_hours = estimated_hours + excluded.estimated_hours,
+        actual_hours = actual_hours + excluded.actual_hours;"""
+
+_STATS_SUBTRACT = """
+    UPDATE task_stats SET
+        task_count = task_count - 1,
+        estimated_hours = estimated_hours - OLD.estimated_hours,
+        actual_hours = actual_hours - OLD.actual_hours
+    WHERE status = OLD.status;"""
+
+STATS_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_task_stats_insert AFTER INSERT ON tasks BEGIN {_STATS_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_task_stats_delete AFTER DELETE ON tasks BEGIN {_STATS_SUBTRACT} END",
+    "CREATE TRIGGER IF NOT EXISTS trg_task_stats_update "
+    f"AFTER UPDATE OF status, estimated_hours, actual_hours ON tasks BEGIN {_STATS_SUBTRACT} {_STATS_ADD} END",
+]
+
+# 变更日志：触发器为 tasks/timeblocks 的每次写入记一行，其他连接据此只重新读取改动的记录
+CHANGE_LOG_TABLE = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    record_id TEXT NOT NULL
+)"""
+
+CHANGE_LOG_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_log_{event.lower()} AFTER {event} ON {table} "
+    f"BEGIN INSERT INTO change_log (kind, record_id) VALUES ('{kind}', {row}.{key}); END"
+    for table, kind, key in (("tasks", "task", "task_id"), ("timeblocks", "block", "block_id"))
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+]
+
+# 变更日志保留的行数；落后更多的连接整体重新加载
+CHANGE_LOG_KEEP = 10000
+
+STATS_REBUILD = [
+    "DELETE FROM task_stats",
+    "INSERT INTO task_stats (status, task_count, estimated_hours, actual_hours) "
+    "SELECT status, COUNT(*), TOTAL(estimated_hours), TOTAL(actual_hours) FROM tasks GROUP BY status",
+]
+
+class SQLiteTaskStorage(TaskStorage):
+    """SQLite 存储引擎
+
+    每个用户一个数据库文件 (<user_id>.sqlite3)，使用 WAL 模式，
+    筛选、计数和统计直接在带索引的列上查询，不把整表读入内存。
+    写入使用 BEGIN IMMEDIATE 事务，版本检查与写入之间不会插入其他进程的写入，
+    读取不受写入阻塞。其他连接的修改由 PRAGMA data_version 发现，
+    按变更日志 (change_log) 只把改动的记录通知索引。
+    """
+
+    def __init__(self, user_id: str, tasks_dir: Optional[Path] = None):
+        self.db_file = (tasks_dir or TASKS_DIR) / f"{user_id}.sqlite3"
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 其他连接提交后 data_version 会变化，用于发现外部修改
+        self._data_version: Optional[int] = None
+        # 索引已反映到的变更日志序号，为 None 时下次整体重建
+        self._change_seq: Optional[int] = None
+        super().__init__(user_id, tasks_dir)
+        # 统计由数据库触发器维护，不需要内存中的增量统计
+        self._indexes = []
+
+    def _ensure_files_exist(self):
+        """创建表和索引，并为旧数据库补齐新增的列"""
+        with self._lock, self._conn:
+            for table, columns in (("tasks", TASK_COLUMNS), ("timeblocks", TIMEBLOCK_COLUMNS)):
+                column_sql = ", ".join(f"{name} {ctype}" for name, ctype in columns.items())
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_sql})")
+                existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                for name, ctype in columns.items():
+                    if name not in existing:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ctype}")
+            for statement in INDEXES:
+                self._conn.execute(statement)
+            has_stats = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_stats'").fetchone()
+            self._conn.execute(STATS_TABLE)
+            for statement in STATS_TRIGGERS:
+                self._conn.execute(statement)
+            self._conn.execute(CHANGE_LOG_TABLE)
+            for statement in CHANGE_LOG_TRIGGERS:
+                self._conn.execute(statement)
+            if not has_stats:
+                # 旧数据库首次升级，按现有数据初始化统计
+                for statement in STATS_REBUILD:
+                    self._conn.execute(statement)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _refresh_tasks(self):
+        """其他连接修改过数据库时更新索引
+
+        写入事务中不检查：写入开始时已经追上了其他连接的修改。
+        """
+        if self.refresh_paused:
+            return
+        with self._lock:
+            if self._conn.in_transaction:
+                return
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            with self._conn:
+                # 在同一个读事务中读取变更日志和记录
+                self._conn.execute("BEGIN")
+                self._catch_up()
+            self._data_version = version
+        self._notify_commit()
+
+    def _catch_up(self):
+        """把 _change_seq 之后其他连接的修改通知索引，须在事务中调用
+
+        只重新读取变更日志中出现的记录；第一次加载、缓存失效或落后的部分
+        已从日志中清理时整体重建。
+        """
+        last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        if last == self._change_seq:
+            return
+        rows = []
+        if self._change_seq is not None and last > self._change_seq:
+            rows = self._conn.execute("SELECT seq, kind, record_id FROM change_log WHERE seq > ? ORDER BY seq",
+                                      (self._change_seq,)).fetchall()
+        if not rows or rows[0][0] != self._change_seq + 1:
+            if self._indexes:
+                self._rebuild_indexes(self._query_tasks())
+            if self._timeblock_indexes:
+                self._rebuild_timeblock_indexes(self.load_timeblocks())
+        else:
+            # 同一记录多次修改只读取一次，按日志中最后一次出现的顺序通知
+            changed = {}
+            for _, kind, record_id in rows:
+                changed.pop((kind, record_id), None)
+                changed[(kind, record_id)] = kind
+            task_ids = [record_id for (kind, record_id) in changed if kind == "task"]
+            block_ids = [record_id for (kind, record_id) in changed if kind == "block"]
+            if self._indexes and task_ids:
+                tasks = {task.task_id: task for task in self._tasks_by_id(task_ids)}
+                for task_id in task_ids:
+                    if task_id in tasks:
+                        self._notify_put(tasks[task_id])
+                    else:
+                        self._notify_remove(task_id)
+            if self._timeblock_indexes and block_ids:
+                for block_id in block_ids:
+                    block = self.get_timeblock(block_id)
+                    if block is not None:
+                        self._notify_timeblock_put(block)
+                    else:
+                        self._notify_timeblock_remove(block_id)
+        self._change_seq = last
+
+    def _tasks_by_id(self, task_ids: List[str], chunk_size: int = 500) -> List[Task]:
+        tasks = []
+        for i in range(0, len(task_ids), chunk_size):
+            chunk = task_ids[i:i + chunk_size]
+            tasks += self._query_tasks(f"WHERE task_id IN ({', '.join('?' * len(chunk))})", tuple(chunk))
+        return tasks
+
+    def _prune_change_log(self) -> int:
+        """只保留最近 CHANGE_LOG_KEEP 行变更日志，返回最新的序号"""
+        last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        self._conn.execute("DELETE FROM change_log WHERE seq <= ?", (last - CHANGE_LOG_KEEP,))
+        return last
+
+    def _finish_write(self):
+        """写入事务提交前调用：自己的修改已通知索引，不必再从变更日志读取"""
+        self._change_seq = self._prune_change_log()
+
+    def _refresh_timeblocks(self):
+        """时间块索引随 _refresh_tasks 一起检查"""
+
+    def invalidate(self):
+        """SQLite 引擎不缓存记录，只需在下次访问时重建索引"""
+        self._data_version = None
+        self._change_seq = None
+
+    @staticmethod
+    def _to_row(data: Dict[str, Any], columns: Dict[str, str]) -> Tuple:
+        return tuple(json.dumps(data.get(name), ensure_ascii=False) if name in JSON_COLUMNS
+                     else data.get(name) for name in columns)
+
+    @staticmethod
+    def _from_row(row: Iterable, columns: Dict[str, str]) -> Dict[str, Any]:
+        data = dict(zip(columns, row))
+        for name in JSON_COLUMNS & data.keys():
+            data[name] = json.loads(data[name]) if data[name] is not None else None
+        return data
+
+    @staticmethod
+    def _upsert_sql(table: str, columns: Dict[str, str]) -> str:
+        """插入或按主键原位更新，保持 rowid 即插入顺序不变"""
+        names = list(columns)
+        key = names[0]
+        updates = ", ".join(f"{name}=excluded.{name}" for name in names[1:])
+        return (f"INSERT INTO {table} ({', '.join(names)}) "
+                f"VALUES ({', '.join('?' * len(names))}) "
+                f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+
+    def _query_tasks(self, where: str = "", params: Tuple = ()) -> List[Task]:
+        sql = f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks {where} ORDER BY rowid"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [Task.from_dict(self._from_row(row, TASK_COLUMNS)) for row in rows]
+
+    @staticmethod
+    def _filter_clause(status: Optional[str], priority: Optional[str]) -> Tuple[str, Tuple]:
+        conditions = []
+        params = []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if priority:
+            conditions.append("priority = ?")
+            params.append(priority)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, tuple(params)
+
+    def write_tasks(self, tasks: Iterable[Task], delete_ids: Iterable[str]) -> bool:
+        """在一个事务中保存 tasks 并删除 delete_ids；失败时全部回滚
+
+        版本号与数据库中的不一致时抛出 VersionConflictError。
+        索引在提交之前更新，索引无法接受的数据 (如非数值的工时) 随事务一起回滚，
+        之后按数据库重建索引。
+        """
+        tasks = list(tasks)
+        delete_ids = list(delete_ids)
+        previous = None
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._catch_up()
+                current = self._stored_versions([task.task_id for task in tasks])
+                conflicts = [task.task_id for task in tasks
+                             if task.task_id in current and current[task.task_id] != task.version]
+                if conflicts:
+                    raise VersionConflictError(conflicts)
+                previous = self._bump_versions(tasks, current)
+                self._conn.executemany(self._upsert_sql("tasks", TASK_COLUMNS),
+                                       [self._to_row(task.to_dict(), TASK_COLUMNS) for task in tasks])
+                self._conn.executemany("DELETE FROM tasks WHERE task_id = ?",
+                                       [(task_id,) for task_id in delete_ids])
+                for task in tasks:
+                    self._notify_put(task)
+                for task_id in delete_ids:
+                    self._notify_remove(task_id)
+                self._finish_write()
+        except VersionConflictError:
+            # 写入开始时追上的其他连接的修改已经提交
+            self._notify_commit()
+            raise
+        except Exception:
+            if previous is not None:
+                self._restore_versions(tasks, previous)
+            self.invalidate()
+            self._notify_rollback()
+            return False
+        self._notify_commit()
+        return True
+
+    def _stored_versions(self, task_ids: List[str], chunk_size: int = 500) -> Dict[str, int]:
+        """数据库中各任务的版本号，分批查询避免超出参数个数限制"""
+        versions = {}
+        for i in range(0, len(task_ids), chunk_size):
+            chunk = task_ids[i:i + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            versions.update(self._conn.execute(
+                f"SELECT task_id, version FROM tasks WHERE task_id IN ({placeholders})", chunk).fetchall())
+        return versions
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        """根据ID获取任务；与其他读取一样先检查外部修改，使索引与返回的数据一致"""
+        self._refresh_tasks()
+        tasks = self._query_tasks("WHERE task_id = ?", (task_id,))
+        return tasks[0] if tasks else None
+
+    def load_tasks(self) -> List[Task]:
+        """加载所有任务"""
+        self._refresh_tasks()
+        return self._query_tasks()
+
+    def find_tasks(self, status: Optional[str] = None, priority: Optional[str] = None) -> List[Task]:
+        """按状态和优先级筛选任务，走索引查询"""
+        self._refresh_tasks()
+        return self._query_tasks(*self._filter_clause(status, priority))
+
+    def count_tasks(self, status: Optional[str] = None, priority: Optional[str] = None) -> int:
+        """统计符合条件的任务数"""
+        self._refresh_tasks()
+        where, params = self._filter_clause(status, priority)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+
+    def task_totals(self) -> Dict[str, Any]:
+        """读取触发器维护的统计表"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, task_count, estimated_hours, actual_hours "
+                "FROM task_stats WHERE task_count > 0").fetchall()
+        return self._totals_from_rows(rows)
+
+    def check_task_totals(self, repair: bool = True) -> Dict[str, Tuple[Any, Any]]:
+        """按 tasks 表重新统计并与统计表比较，返回偏差 {字段: (记录值, 实际值)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*), TOTAL(estimated_hours), TOTAL(actual_hours) "
+                "FROM tasks GROUP BY status").fetchall()
+            drift = totals_drift(self.task_totals(), self._totals_from_rows(rows))
+            if drift and repair:
+                with self._conn:
+                    for statement in STATS_REBUILD:
+                        self._conn.execute(statement)
+        return drift
+
+    @staticmethod
+    def _totals_from_rows(rows: List[Tuple]) -> Dict[str, Any]:
+        return {
+            "total": sum(row[1] for row in rows),
+            "by_status": {row[0]: row[1] for row in rows},
+            "estimated_hours": sum(row[2] for row in rows),
+            "actual_hours": sum(row[3] for row in rows)
+        }
+
+    def get_timeblock(self, block_id: str) -> Optional[TimeBlock]:
+        """根据ID获取时间块"""
+        sql = f"SELECT {', '.join(TIMEBLOCK_COLUMNS)} FROM timeblocks WHERE block_id = ?"
+        with self._lock:
+            row = self._conn.execute(sql, (block_id,)).fetchone()
+        return TimeBlock.from_dict(self._from_row(row, TIMEBLOCK_COLUMNS)) if row else None
+
+    def _write_timeblocks(self, changes: List[Tuple[str, Optional[TimeBlock]]]) -> bool:
+        """在一个事务中写入时间块并按差值调整任务工时"""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._catch_up()
+                applied = []
+                for block_id, timeblock in changes:
+                    previous = self.get_timeblock(block_id)
+                    if timeblock is None and previous is None:
+                        continue
+                    applied.append((previous, timeblock))
+                    if timeblock is None:
+                        self._conn.execute("DELETE FROM timeblocks WHERE block_id = ?", (block_id,))
+                    else:
+                        self._conn.execute(self._upsert_sql("timeblocks", TIMEBLOCK_COLUMNS),
+                                           self._to_row(timeblock.to_dict(), TIMEBLOCK_COLUMNS))
+                tasks = self._rolled_up_tasks(applied)
+                self._bump_versions(tasks, {})
+                self._conn.executemany("UPDATE tasks SET actual_hours = ?, version = ? WHERE task_id = ?",
+                                       [(task.actual_hours, task.version, task.task_id) for task in tasks])
+                self._notify_timeblock_changes(applied)
+                for task in tasks:
+                    self._notify_put(task)
+                self._finish_write()
+        except Exception:
+            self.invalidate()
+            self._notify_rollback()
+            return False
+        self._notify_commit()
+        return True
+
+    def load_timeblocks(self) -> List[TimeBlock]:
+        """加载所有时间块"""
+        sql = f"SELECT {', '.join(TIMEBLOCK_COLUMNS)} FROM timeblocks ORDER BY rowid"
+        with self._lock:
+            rows = self._conn.execute(sql).fetchall()
+        return [TimeBlock.from_dict(self._from_row(row, TIMEBLOCK_COLUMNS)) for row in rows]
+
+    def _iter_timeblocks(self) -> Iterator[TimeBlock]:
+        """逐行读取时间块，不把整表读入内存"""
+        sql = f"SELECT {', '.join(TIMEBLOCK_COLUMNS)} FROM timeblocks"
+        with self._lock:
+            for row in self._conn.execute(sql):
+                yield TimeBlock.from_dict(self._from_row(row, TIMEBLOCK_COLUMNS))
+
+    def import_records(self, task_records: Iterable[Dict[str, Any]],
+                       timeblock_records: Iterable[Dict[str, Any]],
+                       batch_size: int = 500) -> Tuple[int, int]:
+        """在一个事务中分批导入原始记录，返回 (任务数, 时间块数)"""
+        counts = []
+        with self._lock, self._conn:
+            for table, columns, model, records in (
+                    ("tasks", TASK_COLUMNS, Task, task_records),
+                    ("timeblocks", TIMEBLOCK_COLUMNS, TimeBlock, timeblock_records)):
+                sql = self._upsert_sql(table, columns)
+                count = 0
+                batch = []
+                for record in records:
+                    # 经过模型一次，补齐旧文件中缺失的默认值
+                    batch.append(self._to_row(model.from_dict(record).to_dict(), columns))
+                    if len(batch) >= batch_size:
+                        self._conn.executemany(sql, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self._conn.executemany(sql, batch)
+                    count += len(batch)
+                counts.append(count)
+            self._prune_change_log()
+        # 导入的记录没有逐条通知索引
+        self.invalidate()
+        return counts[0], counts[1]
+
+
+def migrate_json_to_sqlite(tasks_dir: Optional[Path] = None) -> Dict[str, Tuple[int, int]]:
+    """将 tasks_dir (默认 config.TASKS_DIR) 中的 *_tasks.json / *_timeblocks.json
+    流式导入同一目录下各用户的 SQLite 数据库
+
+    可重复执行，已存在的记录按ID覆盖。返回 {用户ID: (任务数, 时间块数)}。
+    """
+    tasks_dir = tasks_dir or TASKS_DIR
+    results = {}
+    for task_file in sorted(tasks_dir.glob("*_tasks.json")):
+        user_id = task_file.name[:-len("_tasks.json")]
+        timeblock_file = tasks_dir / f"{user_id}_timeblocks.json"
+        storage = SQLiteTaskStorage(user_id, tasks_dir)
+        try:
+            task_records = iter_json_array(task_file)
+            timeblock_records = iter_json_array(timeblock_file) if timeblock_file.exists() else []
+            results[user_id] = storage.import_records(task_records, timeblock_records)
+        finally:
+            storage.close()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m core.sqlite_storage
+    for migrated_user, (task_count, timeblock_count) in migrate_json_to_sqlite().items():
+        print(f"{migrated_user}: {task_count} 个任务, {timeblock_count} 个时间块")
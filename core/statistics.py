@@ -0,0 +1,95 @@
+from typing import Dict, Any, Iterable, Tuple
+from .models import Task
+
+# 工时累计允许的浮点误差
+HOURS_TOLERANCE = 1e-6
+
+
+def compute_totals(tasks: Iterable[Task]) -> Dict[str, Any]:
+    """从头统计任务数量和工时，格式同 TaskStorage.task_totals"""
+    by_status: Dict[str, int] = {}
+    estimated_hours = 0.0
+    actual_hours = 0.0
+    total = 0
+    for task in tasks:
+        total += 1
+        by_status[task.status] = by_status.get(task.status, 0) + 1
+        estimated_hours += task.estimated_hours
+        actual_hours += task.actual_hours
+    return {
+        "total": total,
+        "by_status": by_status,
+        "estimated_hours": estimated_hours,
+        "actual_hours": actual_hours
+    }
+
+
+def totals_drift(stored: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    """比较两份统计，返回 {字段: (记录值, 实际值)}，一致时为空"""
+    drift = {}
+    if stored["total"] != actual["total"]:
+        drift["total"] = (stored["total"], actual["total"])
+    for status in set(stored["by_status"]) | set(actual["by_status"]):
+        recorded = stored["by_status"].get(status, 0)
+        counted = actual["by_status"].get(status, 0)
+        if recorded != counted:
+            drift[f"by_status.{status}"] = (recorded, counted)
+    for key in ("estimated_hours", "actual_hours"):
+        if abs(stored[key] - actual[key]) > HOURS_TOLERANCE:
+            drift[key] = (stored[key], actual[key])
+    return drift
+
+
+class TaskStatistics:
+    """增量维护的任务统计
+
+    作为二级索引挂在 TaskStorage 上，记录每个任务当前计入的
+    (状态, 预估工时, 实际工时)，更新时先减去旧值再加上新值，读取为 O(1)。
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.by_status: Dict[str, int] = {}
+        self.estimated_hours = 0.0
+        self.actual_hours = 0.0
+        self._contributions: Dict[str, Tuple[str, float, float]] = {}
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重新统计"""
+        self.__init__()
+        for task in tasks:
+            self._add(task)
+
+    def put(self, task: Task):
+        """新增或更新任务"""
+        self.remove(task.task_id)
+        self._add(task)
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        contribution = self._contributions.pop(task_id, None)
+        if contribution is None:
+            return
+        status, estimated_hours, actual_hours = contribution
+        self.total -= 1
+        self.by_status[status] -= 1
+        if not self.by_status[status]:
+            del self.by_status[status]
+        self.estimated_hours -= estimated_hours
+        self.actual_hours -= actual_hours
+
+    def _add(self, task: Task):
+        self._contributions[task.task_id] = (task.status, task.estimated_hours, task.actual_hours)
+        self.total += 1
+        self.by_status[task.status] = self.by_status.get(task.status, 0) + 1
+        self.estimated_hours += task.estimated_hours
+        self.actual_hours += task.actual_hours
+
+    def totals(self) -> Dict[str, Any]:
+        """当前统计，格式同 TaskStorage.task_totals"""
+        return {
+            "total": self.total,
+            "by_status": dict(self.by_status),
+            "estimated_hours": self.estimated_hours,
+            "actual_hours": self.actual_hours
+        }
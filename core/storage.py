@@ -1,89 +1,545 @@
 import json
+import os
+import tempfile
 from pathlib import Path
-from typing import List, Dict, Any
-from config import TASKS_DIR
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Callable, TextIO
+from config import TASKS_DIR, STORAGE_ENGINE
 from .models import Task, TimeBlock
+from .statistics import TaskStatistics, compute_totals, totals_drift, HOURS_TOLERANCE
+from .intervals import block_hours
+from .locking import FileLock
+
+# 时间块已写入而工时汇总遇到版本冲突时，按最新的任务重新计算的次数
+ROLLUP_RETRIES = 3
+
+
+class VersionConflictError(Exception):
+    """保存的任务已被其他进程修改 (版本号不一致)"""
+
+    def __init__(self, task_ids: List[str]):
+        super().__init__(f"任务已被其他程序修改，请刷新后重试: {', '.join(task_ids)}")
+        self.task_ids = task_ids
+
+
+def write_json_atomic(file_path: Path, data: Any, indent: Optional[int] = 2):
+    """先写临时文件并落盘，再替换目标文件，避免留下写到一半的文件"""
+    _replace_atomic(file_path, lambda f: f.write(json.dumps(data, ensure_ascii=False, indent=indent)))
+
+
+def write_json_records_atomic(file_path: Path, records: Iterable[Dict[str, Any]]):
+    """原子地写入 JSON 数组，每条记录一行
+
+    json.dump 以及带缩进的 json.dumps 只能使用纯 Python 编码器，
+    逐条用 json.dumps 编码可以使用 C 编码器，文件仍可按行阅读和比较。
+    """
+    def write(f: TextIO):
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(record, ensure_ascii=False) for record in records))
+        f.write("\n]\n")
+    _replace_atomic(file_path, write)
+
+
+def _replace_atomic(file_path: Path, write: Callable[[TextIO], Any]):
+    """写入临时文件并落盘后替换目标文件
+
+    临时文件名各不相同，多个进程同时写同一文件时不会互相覆盖临时文件；
+    替换后同步目录，使改名本身在断电后也能保留。
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=str(file_path.parent), prefix=file_path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(file_path.parent)
+
+
+def _fsync_dir(directory: Path):
+    """同步目录项；Windows 不支持打开目录，跳过"""
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def iter_json_array(file_path: Path, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """逐个读取 JSON 数组中的元素，不把整个文件读入内存"""
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+        while True:
+            # 跳过空白和分隔符，必要时继续读取
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                chunk = f.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            if pos >= len(buffer):
+                return
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{file_path} 不是 JSON 数组")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+            yield item
+            pos = end
+
 
 class TaskStorage:
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, tasks_dir: Optional[Path] = None):
         self.user_id = user_id
-        self.task_file = TASKS_DIR / f"{user_id}_tasks.json"
-        self.timeblock_file = TASKS_DIR / f"{user_id}_timeblocks.json"
+        # 数据目录，默认为 config.TASKS_DIR
+        self.tasks_dir = tasks_dir = tasks_dir or TASKS_DIR
+        self.task_file = tasks_dir / f"{user_id}_tasks.json"
+        self.timeblock_file = tasks_dir / f"{user_id}_timeblocks.json"
+        # 同一用户的各进程在读-改-写期间持有的锁，只在写入时短暂持有
+        self.lock = FileLock(tasks_dir / f"{user_id}.lock")
+        # 常驻内存缓存：按ID索引，写操作直接写穿到文件
+        self._tasks: Dict[str, Task] = {}
+        self._timeblocks: Dict[str, TimeBlock] = {}
+        # 缓存对应的文件状态 (mtime_ns, size)，为 None 表示缓存失效
+        self._task_stamp: Optional[Tuple[int, int]] = None
+        self._timeblock_stamp: Optional[Tuple[int, int]] = None
+        # 为 True 时读取不检查数据文件是否被外部修改，由 AsyncTaskManager 在并发读取期间设置，
+        # 以免一个读取重新加载缓存和重建索引时另一个读取正在使用它们
+        self.refresh_paused = False
+        # 二级索引，需实现 rebuild(tasks) / put(task) / remove(task_id)
+        self.statistics = TaskStatistics()
+        self._indexes: List[Any] = [self.statistics]
+        # 时间块索引，接口相同：rebuild(timeblocks) / put(timeblock) / remove(block_id)
+        self._timeblock_indexes: List[Any] = []
         self._ensure_files_exist()
-    
+
     def _ensure_files_exist(self):
         """确保数据文件存在"""
         for file_path in [self.task_file, self.timeblock_file]:
             if not file_path.exists():
                 with open(file_path, 'w', encoding='utf-8') as f:
                     json.dump([], f, ensure_ascii=False, indent=2)
-    
+
+    @staticmethod
+    def _file_stamp(file_path: Path) -> Optional[Tuple[int, int]]:
+        """获取文件的 (修改时间, 大小)，文件不存在时返回 None"""
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh_tasks(self):
+        """任务文件被外部修改时重新加载缓存"""
+        if self.refresh_paused:
+            return
+        stamp = self._file_stamp(self.task_file)
+        if stamp is not None and stamp == self._task_stamp:
+            return
+        self._tasks = {task.task_id: task for task in self._read_tasks()}
+        self._task_stamp = stamp
+        self._rebuild_indexes(list(self._tasks.values()))
+
+    def _refresh_timeblocks(self):
+        """时间块文件被外部修改时重新加载缓存"""
+        if self.refresh_paused:
+            return
+        stamp = self._file_stamp(self.timeblock_file)
+        if stamp is not None and stamp == self._timeblock_stamp:
+            return
+        self._timeblocks = {block.block_id: block for block in self._read_timeblocks()}
+        self._timeblock_stamp = stamp
+        self._rebuild_timeblock_indexes(list(self._timeblocks.values()))
+
+    def refresh(self):
+        """检查数据文件是否被外部修改，必要时重新加载并重建索引"""
+        self._refresh_tasks()
+        if self._timeblock_indexes:
+            self._refresh_timeblocks()
+
+    def add_index(self, index):
+        """注册二级索引，之后每次写入和重新加载都会同步到索引"""
+        self.refresh()
+        index.rebuild(self.load_tasks())
+        self._indexes.append(index)
+
+    def add_timeblock_index(self, index):
+        """注册时间块索引，之后每次写入和重新加载都会同步到索引"""
+        self.refresh()
+        index.rebuild(self.load_timeblocks())
+        self._timeblock_indexes.append(index)
+
+    def _rebuild_timeblock_indexes(self, timeblocks: List[TimeBlock]):
+        for index in self._timeblock_indexes:
+            index.rebuild(timeblocks)
+
+    def _notify_timeblock_put(self, timeblock: TimeBlock):
+        for index in self._timeblock_indexes:
+            index.put(timeblock)
+
+    def _notify_timeblock_remove(self, block_id: str):
+        for index in self._timeblock_indexes:
+            index.remove(block_id)
+
+    def _rebuild_indexes(self, tasks: List[Task]):
+        for index in self._indexes:
+            index.rebuild(tasks)
+
+    def _notify_put(self, task: Task):
+        for index in self._indexes:
+            index.put(task)
+
+    def _notify_remove(self, task_id: str):
+        for index in self._indexes:
+            index.remove(task_id)
+
+    def _notify_commit(self):
+        """写入成功后通知需要知道写入结果的索引 (实现了 commit/rollback，如 ChangeFeed)"""
+        for index in self._indexes:
+            if hasattr(index, "commit"):
+                index.commit()
+
+    def _notify_rollback(self):
+        """写入失败，撤销本次 put/remove 的通知，随后重新加载时重建"""
+        for index in self._indexes:
+            if hasattr(index, "rollback"):
+                index.rollback()
+
+    def invalidate(self):
+        """丢弃缓存，下次访问时从文件重新加载"""
+        self._task_stamp = None
+        self._timeblock_stamp = None
+
     def save_task(self, task: Task) -> bool:
         """保存任务"""
+        return self.save_tasks([task])
+
+    def _stamp_versions(self, tasks: List[Task]) -> List[int]:
+        """在锁内检查并递增版本号，返回原版本号用于写入失败时恢复
+
+        任务的版本号与当前保存的不一致，说明读取之后已被其他进程修改，
+        抛出 VersionConflictError 且不修改任何任务；不存在的任务 (新建或已被删除) 视为新建。
+        """
+        current: Dict[str, int] = {}
+        conflicts = []
+        for task in tasks:
+            stored = self._tasks.get(task.task_id)
+            if stored is None:
+                continue
+            if stored.version != task.version:
+                conflicts.append(task.task_id)
+            current[task.task_id] = stored.version
+        if conflicts:
+            raise VersionConflictError(conflicts)
+        return self._bump_versions(tasks, current)
+
+    @staticmethod
+    def _bump_versions(tasks: List[Task], current: Dict[str, int]) -> List[int]:
+        previous = [task.version for task in tasks]
+        for task in tasks:
+            task.version = current.get(task.task_id, task.version) + 1
+        return previous
+
+    @staticmethod
+    def _restore_versions(tasks: List[Task], previous: List[int]):
+        for task, version in zip(tasks, previous):
+            task.version = version
+
+    def save_tasks(self, tasks: Iterable[Task]) -> bool:
+        """批量保存任务，只写一次文件；失败时全部不生效，见 write_tasks"""
+        return self.write_tasks(tasks, ())
+
+    def write_tasks(self, tasks: Iterable[Task], delete_ids: Iterable[str]) -> bool:
+        """保存 tasks 并删除 delete_ids，只写一次文件；失败时全部不生效
+
+        在文件锁内重新读取最新数据后再写入，其他进程的修改不会丢失；
+        要保存的任务已被其他进程修改时抛出 VersionConflictError。
+        先更新索引再写入文件，索引无法接受的数据 (如非数值的工时) 不会被写入；
+        失败时丢弃缓存，下次访问时从文件重新加载并重建全部索引。
+        """
+        tasks = list(tasks)
+        previous = None
         try:
-            tasks = self.load_tasks()
-            
-            # 查找是否已存在该任务
-            existing_index = None
-            for i, t in enumerate(tasks):
-                if t.task_id == task.task_id:
-                    existing_index = i
-                    break
-            
-            if existing_index is not None:
-                tasks[existing_index] = task
-            else:
-                tasks.append(task)
-            
-            self._save_tasks(tasks)
-            return True
+            with self.lock:
+                self._refresh_tasks()
+                previous = self._stamp_versions(tasks)
+                # 已存在的任务原位替换，保持文件中的顺序
+                for task in tasks:
+                    self._tasks[task.task_id] = task
+                removed = [task_id for task_id in delete_ids if self._tasks.pop(task_id, None) is not None]
+                if not tasks and not removed:
+                    return True
+                for task in tasks:
+                    self._notify_put(task)
+                for task_id in removed:
+                    self._notify_remove(task_id)
+                self._save_tasks(list(self._tasks.values()))
+        except VersionConflictError:
+            raise
         except Exception:
+            # 缓存和索引已被修改，丢弃后从文件重新加载
+            if previous is not None:
+                self._restore_versions(tasks, previous)
+            self._task_stamp = None
+            self._notify_rollback()
             return False
-    
+        self._notify_commit()
+        return True
+
+    def get_task(self, task_id: str) -> Optional[Task]:
+        """根据ID获取任务"""
+        self._refresh_tasks()
+        return self._tasks.get(task_id)
+
     def load_tasks(self) -> List[Task]:
         """加载所有任务"""
+        self._refresh_tasks()
+        return list(self._tasks.values())
+
+    def find_tasks(self, status: Optional[str] = None, priority: Optional[str] = None) -> List[Task]:
+        """按状态和优先级筛选任务"""
+        tasks = self.load_tasks()
+        if status:
+            tasks = [task for task in tasks if task.status == status]
+        if priority:
+            tasks = [task for task in tasks if task.priority == priority]
+        return tasks
+
+    def count_tasks(self, status: Optional[str] = None, priority: Optional[str] = None) -> int:
+        """统计符合条件的任务数"""
+        return len(self.find_tasks(status, priority))
+
+    def task_totals(self) -> Dict[str, Any]:
+        """汇总任务数量和工时: total, by_status, estimated_hours, actual_hours
+
+        统计作为索引随写入增量维护，只在内存中，读取为 O(1)；
+        TaskManager 打开时注册索引已加载全部任务，不再另存统计快照。
+        """
+        self._refresh_tasks()
+        return self.statistics.totals()
+
+    def check_task_totals(self, repair: bool = True) -> Dict[str, Tuple[Any, Any]]:
+        """从头重新统计并与增量统计比较，返回偏差 {字段: (记录值, 实际值)}"""
+        self._refresh_tasks()
+        tasks = self.load_tasks()
+        drift = totals_drift(self.statistics.totals(), compute_totals(tasks))
+        if drift and repair:
+            self.statistics.rebuild(tasks)
+        return drift
+
+    def _read_tasks(self) -> List[Task]:
+        """从文件读取所有任务"""
         try:
             with open(self.task_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 return [Task.from_dict(task_data) for task_data in data]
         except (json.JSONDecodeError, FileNotFoundError):
             return []
-    
+
     def delete_task(self, task_id: str) -> bool:
         """删除任务"""
-        try:
-            tasks = self.load_tasks()
-            tasks = [task for task in tasks if task.task_id != task_id]
-            self._save_tasks(tasks)
-            return True
-        except Exception:
-            return False
-    
+        return self.delete_tasks([task_id])
+
+    def delete_tasks(self, task_ids: Iterable[str]) -> bool:
+        """批量删除任务，只写一次文件；失败时全部不生效"""
+        return self.write_tasks((), task_ids)
+
     def _save_tasks(self, tasks: List[Task]):
         """保存任务列表"""
-        with open(self.task_file, 'w', encoding='utf-8') as f:
-            json.dump([task.to_dict() for task in tasks], f, ensure_ascii=False, indent=2)
-    
+        write_json_records_atomic(self.task_file, (task.to_dict() for task in tasks))
+        self._task_stamp = self._file_stamp(self.task_file)
+
     def save_timeblock(self, timeblock: TimeBlock) -> bool:
-        """保存时间块"""
-        try:
-            timeblocks = self.load_timeblocks()
-            timeblocks.append(timeblock)
-            self._save_timeblocks(timeblocks)
-            return True
-        except Exception:
+        """保存时间块，工时的变化同时计入所属任务的 actual_hours"""
+        return self.save_timeblocks([timeblock])
+
+    def save_timeblocks(self, timeblocks: Iterable[TimeBlock]) -> bool:
+        """批量保存时间块，只写一次文件"""
+        return self._write_timeblocks([(block.block_id, block) for block in timeblocks])
+
+    def delete_timeblock(self, block_id: str) -> bool:
+        """删除时间块，并从所属任务的 actual_hours 中扣除其工时"""
+        return self.delete_timeblocks([block_id])
+
+    def delete_timeblocks(self, block_ids: Iterable[str]) -> bool:
+        """批量删除时间块，只写一次文件"""
+        return self._write_timeblocks([(block_id, None) for block_id in block_ids])
+
+    def get_timeblock(self, block_id: str) -> Optional[TimeBlock]:
+        """根据ID获取时间块"""
+        self._refresh_timeblocks()
+        return self._timeblocks.get(block_id)
+
+    def _rolled_up_tasks(self, changes: List[Tuple[Optional[TimeBlock], Optional[TimeBlock]]]) -> List[Task]:
+        """时间块依次由 previous 变为 current 后，actual_hours 已调整的任务副本
+
+        只按差值调整涉及的任务，每个时间块为 O(1)；缓存中的任务在写入成功后才被替换。
+        """
+        deltas: Dict[str, float] = {}
+        for previous, current in changes:
+            if previous is not None:
+                deltas[previous.task_id] = deltas.get(previous.task_id, 0.0) - block_hours(previous)
+            if current is not None:
+                deltas[current.task_id] = deltas.get(current.task_id, 0.0) + block_hours(current)
+        tasks = []
+        for task_id, delta in deltas.items():
+            if abs(delta) <= HOURS_TOLERANCE:
+                continue
+            task = self.get_task(task_id)
+            if task is None:
+                continue
+            task = Task.from_dict(task.to_dict())
+            task.actual_hours = round(task.actual_hours + delta, 6)
+            tasks.append(task)
+        return tasks
+
+    def _notify_timeblock_changes(self, changes: List[Tuple[Optional[TimeBlock], Optional[TimeBlock]]]):
+        for previous, current in changes:
+            if current is None:
+                self._notify_timeblock_remove(previous.block_id)
+            else:
+                self._notify_timeblock_put(current)
+
+    def _write_timeblocks(self, changes: List[Tuple[str, Optional[TimeBlock]]]) -> bool:
+        """依次保存 (时间块不为 None) 或删除时间块，并更新任务工时
+
+        json 引擎的时间块和任务分属两个文件，两次写入之间中断时
+        工时可能不一致，可用 rebuild_actual_hours 修复。时间块写入之后保存工时遇到
+        版本冲突 (任务文件被未持有文件锁的程序修改) 时，重新读取任务并按最新版本
+        重新计算后再保存，不把只写了一半的修改作为冲突交给调用方。
+        """
+        with self.lock:
+            try:
+                self._refresh_timeblocks()
+                applied = []
+                for block_id, timeblock in changes:
+                    previous = self._timeblocks.get(block_id)
+                    if timeblock is None and previous is None:
+                        continue
+                    applied.append((previous, timeblock))
+                    if timeblock is None:
+                        del self._timeblocks[block_id]
+                    else:
+                        self._timeblocks[block_id] = timeblock
+                if not applied:
+                    return True
+                tasks = self._rolled_up_tasks(applied)
+                self._notify_timeblock_changes(applied)
+                self._save_timeblocks(list(self._timeblocks.values()))
+            except Exception:
+                self._timeblock_stamp = None
+                return False
+            for attempt in range(ROLLUP_RETRIES):
+                if not tasks:
+                    return True
+                try:
+                    return self.save_tasks(tasks)
+                except VersionConflictError:
+                    self._task_stamp = None
+                    tasks = self._rolled_up_tasks(applied)
             return False
-    
+
+    def rebuild_actual_hours(self) -> Optional[Dict[str, Tuple[float, float]]]:
+        """按时间块重新计算任务的 actual_hours
+
+        顺序读取一遍全部时间块累加工时，再一次写入有变化的任务；
+        没有实际时间块 (没有时间块或只有计划时段) 的任务保留原值 (手工填写的工时)。
+        返回 {任务ID: (原值, 新值)}，写入失败时返回 None。
+        """
+        with self.lock:
+            return self._rebuild_actual_hours()
+
+    def _rebuild_actual_hours(self) -> Optional[Dict[str, Tuple[float, float]]]:
+        totals: Dict[str, float] = {}
+        try:
+            for block in self._iter_timeblocks():
+                if block.planned:
+                    continue
+                totals[block.task_id] = totals.get(block.task_id, 0.0) + block_hours(block)
+        except (OSError, ValueError):
+            return None
+        tasks = {task.task_id: task for task in self.load_tasks()}
+        changes = {}
+        updated = []
+        for task_id, hours in totals.items():
+            task = tasks.get(task_id)
+            hours = round(hours, 6)
+            if task is None or abs(task.actual_hours - hours) <= HOURS_TOLERANCE:
+                continue
+            changes[task_id] = (task.actual_hours, hours)
+            task = Task.from_dict(task.to_dict())
+            task.actual_hours = hours
+            updated.append(task)
+        if updated and not self.save_tasks(updated):
+            return None
+        return changes
+
+    def _iter_timeblocks(self) -> Iterator[TimeBlock]:
+        """逐个读取全部时间块；缓存未加载时从文件流式读取"""
+        stamp = self._file_stamp(self.timeblock_file)
+        if stamp is None:
+            return iter(())
+        if stamp == self._timeblock_stamp:
+            return iter(list(self._timeblocks.values()))
+        return (TimeBlock.from_dict(record) for record in iter_json_array(self.timeblock_file))
+
     def load_timeblocks(self) -> List[TimeBlock]:
         """加载所有时间块"""
+        self._refresh_timeblocks()
+        return list(self._timeblocks.values())
+
+    def _read_timeblocks(self) -> List[TimeBlock]:
+        """从文件读取所有时间块"""
         try:
             with open(self.timeblock_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 return [TimeBlock.from_dict(block_data) for block_data in data]
         except (json.JSONDecodeError, FileNotFoundError):
             return []
-    
+
     def _save_timeblocks(self, timeblocks: List[TimeBlock]):
         """保存时间块列表"""
-        with open(self.timeblock_file, 'w', encoding='utf-8') as f:
-            json.dump([block.to_dict() for block in timeblocks], f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        write_json_records_atomic(self.timeblock_file, (block.to_dict() for block in timeblocks))
+        self._timeblock_stamp = self._file_stamp(self.timeblock_file)
+
+
+def create_storage(user_id: str, engine: Optional[str] = None) -> TaskStorage:
+    """按配置创建存储引擎"""
+    engine = engine or STORAGE_ENGINE
+    if engine == "json":
+        return TaskStorage(user_id)
+    if engine == "journal":
+        from .journal import JournalTaskStorage
+        return JournalTaskStorage(user_id)
+    if engine == "sqlite":
+        from .sqlite_storage import SQLiteTaskStorage
+        return SQLiteTaskStorage(user_id)
+    raise ValueError(f"未知的存储引擎: {engine}")
@@ -1,12 +1,58 @@
-from typing import List, Optional, Dict, Any
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from typing import List, Optional, Dict, Any, Callable, Iterable, Tuple
 import uuid
+from config import ALLOW_OVERLAPPING_TIMEBLOCKS
 from .models import Task, TimeBlock
-from .storage import TaskStorage
+from .storage import create_storage, VersionConflictError
+from .query import TaskIndex, TaskQuery, QueryResult
+from .search import SearchIndex
+from .due_dates import DueDateIndex, normalize_due_date, to_date_key, today_key
+from .intervals import IntervalIndex, TimeBlockOverlapError, parse_time, to_timestamp, format_time
+from .reports import TimeRollups
+from .scheduler import PlanConstraints, SchedulePlan, plan_schedule
+from .dependencies import DependencyGraph, DependencyCycleError
+from .work_queue import WorkQueue, score
+from .history import OperationLog
+from .changes import ChangeFeed, TaskChange
+from .recurrence import RecurrenceRule, RecurrenceIndex, iter_occurrences, make_occurrence, occurrence_id, parse_occurrence_id
+
+# 未指定 expected_version 的修改遇到并发冲突时，在最新版本上重试的次数
+UPDATE_RETRIES = 3
+
+
+@dataclass
+class BatchItemResult:
+    """批量操作中单项的结果，index 为该项在输入中的位置"""
+    index: int
+    task_id: Optional[str]
+    ok: bool
+    error: str = ""
+    task: Optional[Task] = None
 
 class TaskManager:
     def __init__(self, user_id: str):
         self.user_id = user_id
-        self.storage = TaskStorage(user_id)
+        self.storage = create_storage(user_id)
+        self.index = TaskIndex()
+        self.storage.add_index(self.index)
+        self.search_index = SearchIndex()
+        self.storage.add_index(self.search_index)
+        self.due_index = DueDateIndex()
+        self.storage.add_index(self.due_index)
+        self.dependencies = DependencyGraph()
+        self.storage.add_index(self.dependencies)
+        self.work_queue = WorkQueue()
+        self.storage.add_index(self.work_queue)
+        self.recurrence = RecurrenceIndex()
+        self.storage.add_index(self.recurrence)
+        self.timeblock_index = IntervalIndex()
+        self.storage.add_timeblock_index(self.timeblock_index)
+        self.rollups = TimeRollups()
+        self.storage.add_timeblock_index(self.rollups)
+        self.history = OperationLog(user_id, self.storage)
+        self.changes = ChangeFeed()
+        self.storage.add_index(self.changes)
     
     def create_task(self, title: str, **kwargs) -> Task:
         """创建新任务"""
@@ -17,45 +63,343 @@ class TaskManager:
             title=title,
             **kwargs
         )
-        self.storage.save_task(task)
+        with self.history.record(f"新建任务 {title}"):
+            self.history.track(task_ids=[task_id])
+            self.storage.save_task(task)
+        return task
+    
+    def create_recurring_task(self, title: str, freq: str, start=None, interval: int = 1,
+                              until=None, count: Optional[int] = None, **kwargs) -> Task:
+        """创建重复任务系列，freq 为 daily/weekly/monthly，start 默认为今天
+
+        只保存系列本身，实例在查询日期范围时才生成；规则无效时抛出 ValueError。
+        """
+        rule = RecurrenceRule(freq=freq, start=to_date_key(start) if start else today_key(),
+                              interval=interval, until=until, count=count)
+        kwargs["due_date"] = rule.start
+        return self.create_task(title, recurrence=rule.to_dict(), **kwargs)
+    
+    def occurrences(self, start, end) -> List[Task]:
+        """[start, end] 内重复任务的全部实例（含已完成、已跳过的），按日期排序
+
+        未保存的实例ID为 <系列ID>@<日期>，可直接传给 update_task / delete_task。
+        """
+        self.storage.refresh()
+        return self.recurrence.occurrences(date.fromisoformat(to_date_key(start)),
+                                           date.fromisoformat(to_date_key(end)))
+    
+    @staticmethod
+    def _is_virtual(task: Task) -> bool:
+        """是否为尚未保存的重复任务实例"""
+        return (task.series_id is not None
+                and task.task_id == occurrence_id(task.series_id, task.occurrence_date))
+    
+    def _materialize(self, task: Task) -> Task:
+        """未保存的实例换成新ID，以便作为普通任务保存"""
+        if self._is_virtual(task):
+            task.task_id = str(uuid.uuid4())
         return task
     
+    def create_tasks(self, items: Iterable[Dict[str, Any]]) -> List[BatchItemResult]:
+        """批量创建任务，每项为 create_task 的参数字典（需含 title）
+
+        全部校验通过后一次写入；任一项失败则全部不创建。
+        """
+        results = []
+        tasks = []
+        for i, item in enumerate(items):
+            data = dict(item)
+            title = data.pop("title", None)
+            if not title:
+                results.append(BatchItemResult(i, None, False, "标题不能为空"))
+                continue
+            try:
+                task = Task(task_id=str(uuid.uuid4()), user_id=self.user_id, title=title, **data)
+            except TypeError as e:
+                results.append(BatchItemResult(i, None, False, f"无效的任务字段: {e}"))
+                continue
+            tasks.append(task)
+            results.append(BatchItemResult(i, task.task_id, True, task=task))
+        return self._commit_batch(results, lambda: self._save_recorded(f"批量新建 {len(tasks)} 个任务", tasks))
+    
+    def update_tasks(self, changes: Dict[str, Dict[str, Any]]) -> List[BatchItemResult]:
+        """批量更新任务，changes 为 {任务ID: 要更新的字段}
+
+        在副本上修改，全部成功后一次写入；任一项失败则全部不更新。
+        各项修改的 blocked_by 合在一起检查依赖环，批量内互为前置的任务同样会被拒绝。
+        """
+        results = []
+        tasks = []
+        blockers: Dict[str, List[str]] = {}
+        for i, (task_id, fields) in enumerate(changes.items()):
+            task = self.get_task(task_id)
+            if not task or task.user_id != self.user_id:
+                results.append(BatchItemResult(i, task_id, False, "任务不存在"))
+                continue
+            if "blocked_by" in fields:
+                blockers[task_id] = fields["blocked_by"]
+            updated = self._materialize(Task.from_dict(task.to_dict()))
+            updated.update(**fields)
+            tasks.append(updated)
+            results.append(BatchItemResult(i, task_id, True, task=updated))
+        if blockers:
+            self.storage.refresh()
+            cycle = self.dependencies.find_batch_cycle(blockers)
+            if cycle:
+                error = str(DependencyCycleError(cycle))
+                for result in results:
+                    if result.task_id in cycle:
+                        result.ok = False
+                        result.error = error
+        return self._commit_batch(results, lambda: self._save_recorded(f"批量修改 {len(tasks)} 个任务", tasks))
+    
+    def _save_recorded(self, label: str, tasks: List[Task]) -> bool:
+        """保存任务并记入操作日志"""
+        with self.history.record(label):
+            self.history.track(task_ids=[task.task_id for task in tasks])
+            return self.storage.save_tasks(tasks)
+    
+    def delete_tasks(self, task_ids: Iterable[str]) -> List[BatchItemResult]:
+        """批量删除任务；任一项不存在则全部不删除。重复任务的实例标记为已取消
+
+        标记实例和删除其他任务在同一次写入中完成，失败时全部不生效。
+        """
+        results = []
+        skipped = []
+        ids = []
+        for i, task_id in enumerate(task_ids):
+            task = self.get_task(task_id)
+            if not task or task.user_id != self.user_id:
+                results.append(BatchItemResult(i, task_id, False, "任务不存在"))
+                continue
+            results.append(BatchItemResult(i, task_id, True, task=task))
+            if task.series_id:
+                skipped.append(self._skipped(task))
+            else:
+                ids.append(task_id)
+
+        def write() -> bool:
+            with self.history.record(f"批量删除 {len(results)} 个任务"):
+                self.history.track(task_ids=[task.task_id for task in skipped] + ids)
+                return self.storage.write_tasks(skipped, ids)
+        return self._commit_batch(results, write)
+    
+    @staticmethod
+    def _commit_batch(results: List[BatchItemResult], write: Callable[[], bool]) -> List[BatchItemResult]:
+        """全部校验通过时执行写入，否则把其余项标记为未执行"""
+        if all(result.ok for result in results):
+            try:
+                if not results or write():
+                    return results
+                reason = "写入失败"
+            except VersionConflictError as e:
+                reason = str(e)
+        else:
+            reason = "批量中有其他项失败，未执行"
+        for result in results:
+            if result.ok:
+                result.ok = False
+                result.error = reason
+        return results
+    
+    def subscribe(self, callback: Callable[[TaskChange], None],
+                  kinds: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """订阅任务变更 (created/updated/deleted/reloaded，见 core.changes)，返回取消订阅的函数
+
+        每次写入成功后以 TaskChange 同步回调，只包含受影响的任务。
+        """
+        return self.changes.subscribe(callback, kinds)
+    
+    def undo(self) -> Optional[str]:
+        """撤销最近一次操作，返回操作名称；没有可撤销的操作或写入失败时返回 None"""
+        return self.history.undo()
+    
+    def redo(self) -> Optional[str]:
+        """重做最近一次撤销的操作，返回操作名称；没有可重做的操作或写入失败时返回 None"""
+        return self.history.redo()
+    
+    def tasks_as_of(self, when: datetime) -> Optional[List[Task]]:
+        """还原某一时刻的任务列表，早于操作日志开始时返回 None"""
+        return self.history.tasks_as_of(when)
+    
     def get_task(self, task_id: str) -> Optional[Task]:
-        """根据ID获取任务"""
-        tasks = self.storage.load_tasks()
-        for task in tasks:
-            if task.task_id == task_id:
-                return task
-        return None
+        """根据ID获取任务，也接受未保存的重复任务实例ID (<系列ID>@<日期>)"""
+        task = self.storage.get_task(task_id)
+        if task is not None:
+            return task
+        parsed = parse_occurrence_id(task_id)
+        if parsed is None:
+            return None
+        series_id, day = parsed
+        self.storage.refresh()
+        stored = self.recurrence.instances.get(parsed)
+        if stored is not None:
+            return stored
+        rule = self.recurrence.rules.get(series_id)
+        when = date.fromisoformat(day)
+        if rule is None or next(iter_occurrences(rule, when, when), None) is None:
+            return None
+        return make_occurrence(self.recurrence.series[series_id], day)
     
     def list_tasks(self, status: str = None, priority: str = None) -> List[Task]:
         """列出任务，可筛选"""
-        tasks = self.storage.load_tasks()
-        
-        if status:
-            tasks = [task for task in tasks if task.status == status]
-        if priority:
-            tasks = [task for task in tasks if task.priority == priority]
-        
-        return tasks
+        return self.storage.find_tasks(status=status, priority=priority)
     
-    def update_task(self, task_id: str, **kwargs) -> bool:
-        """更新任务"""
-        task = self.get_task(task_id)
-        if task and task.user_id == self.user_id:
-            task.update(**kwargs)
-            return self.storage.save_task(task)
+    def query(self, query: Optional[TaskQuery] = None, **criteria) -> QueryResult:
+        """按组合条件查询任务，支持排序、分页和字段投影
+
+        可以传入 TaskQuery，也可以直接传入其字段，例如
+        query(status=["todo", "in_progress"], min_priority="high", order_by=["due_date"], limit=50)
+        """
+        if query is None:
+            query = TaskQuery(**criteria)
+        self.storage.refresh()
+        return self.index.execute(query)
+    
+    def search(self, query: str, limit: int = 20) -> List[Task]:
+        """全文搜索标题、描述和标签，按相关度排序"""
+        self.storage.refresh()
+        return [task for _, task in self.search_index.search(query, limit)]
+    
+    def tasks_due_between(self, start, end) -> List[Task]:
+        """截止日期在 [start, end] 内的未完成任务，按截止日期排序
+
+        包括重复任务在该范围内尚未保存的实例，已保存的实例由截止日期索引给出。
+        """
+        start, end = to_date_key(start), to_date_key(end)
+        self.storage.refresh()
+        tasks = self.due_index.between(start, end)
+        pending = [task for task in self.recurrence.occurrences(date.fromisoformat(start), date.fromisoformat(end))
+                   if self._is_virtual(task)]
+        if not pending:
+            return tasks
+        return sorted(tasks + pending, key=lambda task: normalize_due_date(task.due_date))
+    
+    def overdue(self, today=None) -> List[Task]:
+        """已过截止日期仍未完成的任务"""
+        self.storage.refresh()
+        return self.due_index.before(to_date_key(today) if today else today_key())
+    
+    def next_due(self, n: int = 10, today=None) -> List[Task]:
+        """从今天起最近到期的 n 个未完成任务"""
+        self.storage.refresh()
+        return self.due_index.first_from(to_date_key(today) if today else today_key(), n)
+    
+    def next_tasks(self, k: int = 5, include_blocked: bool = False) -> List[Task]:
+        """接下来最应该做的 k 个未完成任务，按优先级、截止日期紧迫程度和存在时间综合排序
+
+        默认跳过前置任务尚未完成的任务。
+        """
+        self.storage.refresh()
+        if include_blocked:
+            return self.work_queue.top(k)
+        ready = self.dependencies.ready
+        return self.work_queue.top(k, lambda task: task.task_id in ready)
+    
+    def task_score(self, task: Task) -> float:
+        """任务今天的得分，见 core.work_queue.score"""
+        return score(task)
+    
+    def update_task(self, task_id: str, expected_version: Optional[int] = None, **kwargs) -> bool:
+        """更新任务；修改 blocked_by 形成依赖环时抛出 DependencyCycleError
+
+        未保存的重复任务实例在此时才作为新任务保存。
+        expected_version 为修改所依据的版本号 (如界面打开编辑窗口时的 task.version)，
+        任务已被其他程序修改时抛出 VersionConflictError；不指定时在最新版本上重试。
+        """
+        for attempt in range(UPDATE_RETRIES):
+            task = self.get_task(task_id)
+            if not task or task.user_id != self.user_id:
+                return False
+            if expected_version is not None and task.version != expected_version:
+                raise VersionConflictError([task_id])
+            if "blocked_by" in kwargs:
+                self._check_blockers(task_id, kwargs["blocked_by"])
+            # 在副本上修改，冲突时缓存中的任务保持不变
+            task = self._materialize(Task.from_dict(task.to_dict()))
+            try:
+                with self.history.record(f"修改任务 {task.title}"):
+                    self.history.track(task_ids=[task.task_id])
+                    task.update(**kwargs)
+                    return self.storage.save_task(task)
+            except VersionConflictError:
+                if expected_version is not None or attempt == UPDATE_RETRIES - 1:
+                    raise
         return False
     
+    def _check_blockers(self, task_id: str, blocker_ids: Iterable[str]):
+        """新的前置任务会形成环时抛出 DependencyCycleError"""
+        self.storage.refresh()
+        current = self.dependencies.blockers.get(task_id, set())
+        for blocker_id in set(blocker_ids or ()) - current:
+            cycle = self.dependencies.find_cycle(task_id, blocker_id)
+            if cycle:
+                raise DependencyCycleError(cycle)
+    
+    def add_dependency(self, task_id: str, blocker_id: str) -> bool:
+        """task_id 在 blocker_id 完成后才能开始；形成依赖环时抛出 DependencyCycleError"""
+        task = self.get_task(task_id)
+        blocker = self.get_task(blocker_id)
+        if not task or not blocker or task.user_id != self.user_id:
+            return False
+        if blocker_id in task.blocked_by:
+            return True
+        return self.update_task(task_id, blocked_by=task.blocked_by + [blocker_id])
+    
+    def remove_dependency(self, task_id: str, blocker_id: str) -> bool:
+        """移除前置任务"""
+        task = self.get_task(task_id)
+        if not task or task.user_id != self.user_id or blocker_id not in task.blocked_by:
+            return False
+        return self.update_task(task_id, blocked_by=[b for b in task.blocked_by if b != blocker_id])
+    
+    def ready_tasks(self) -> List[Task]:
+        """未完成且前置任务都已完成、可以开始的任务，按拓扑序"""
+        self.storage.refresh()
+        return self.dependencies.ready_tasks()
+    
+    def blocking_tasks(self, task_id: str) -> List[Task]:
+        """阻塞该任务的未完成前置任务"""
+        self.storage.refresh()
+        return self.dependencies.unfinished_blockers(task_id)
+    
+    def topological_order(self) -> List[Task]:
+        """全部任务按依赖的拓扑序排列，前置任务在前"""
+        self.storage.refresh()
+        return self.dependencies.topological_order()
+    
+    def critical_path(self) -> Tuple[float, List[Task]]:
+        """未完成任务中按预估工时加权的关键路径，返回 (总工时, 任务链)"""
+        self.storage.refresh()
+        return self.dependencies.critical_path()
+    
     def delete_task(self, task_id: str) -> bool:
-        """删除任务"""
+        """删除任务；重复任务的实例标记为已取消，以免再次生成"""
         task = self.get_task(task_id)
         if task and task.user_id == self.user_id:
-            return self.storage.delete_task(task_id)
+            with self.history.record(f"删除任务 {task.title}"):
+                if task.series_id:
+                    skipped = self._skipped(task)
+                    self.history.track(task_ids=[skipped.task_id])
+                    return self.storage.save_task(skipped)
+                self.history.track(task_ids=[task_id])
+                return self.storage.delete_task(task_id)
         return False
     
-    def create_timeblock(self, task_id: str, start_time: str, end_time: str, **kwargs) -> TimeBlock:
-        """创建时间块"""
+    def _skipped(self, task: Task) -> Task:
+        """跳过的重复任务实例"""
+        task = self._materialize(Task.from_dict(task.to_dict()))
+        task.update(status="cancelled")
+        return task
+    
+    def create_timeblock(self, task_id: str, start_time: str, end_time: str,
+                         allow_overlap: Optional[bool] = None, **kwargs) -> TimeBlock:
+        """创建时间块，其工时自动计入任务的 actual_hours
+
+        时间可解析时结束时间必须晚于开始时间；allow_overlap 为 False（默认取
+        ALLOW_OVERLAPPING_TIMEBLOCKS）时，与已有时间块重叠会抛出 TimeBlockOverlapError。
+        """
+        self._check_timeblock(start_time, end_time, allow_overlap)
         block_id = str(uuid.uuid4())
         timeblock = TimeBlock(
             block_id=block_id,
@@ -65,20 +409,136 @@ class TaskManager:
             end_time=end_time,
             **kwargs
         )
-        self.storage.save_timeblock(timeblock)
+        with self.history.record("新建时间块"):
+            self.history.track(block_ids=[block_id], derived_task_ids=[task_id])
+            self.storage.save_timeblock(timeblock)
         return timeblock
     
+    def _check_timeblock(self, start_time: str, end_time: str,
+                         allow_overlap: Optional[bool], block_id: Optional[str] = None):
+        """校验时间块的起止时间和重叠，block_id 为正在修改的时间块"""
+        start, end = parse_time(start_time), parse_time(end_time)
+        timed = start is not None and end is not None
+        if timed and end <= start:
+            raise ValueError("结束时间必须晚于开始时间")
+        if allow_overlap is None:
+            allow_overlap = ALLOW_OVERLAPPING_TIMEBLOCKS
+        if timed and not allow_overlap:
+            overlaps = [block for block in self.find_overlaps(start_time, end_time)
+                        if block.block_id != block_id]
+            if overlaps:
+                raise TimeBlockOverlapError(overlaps)
+    
+    def get_timeblock(self, block_id: str) -> Optional[TimeBlock]:
+        """获取时间块"""
+        return self.storage.get_timeblock(block_id)
+    
+    def update_timeblock(self, block_id: str, allow_overlap: Optional[bool] = None, **kwargs) -> bool:
+        """修改时间块，任务的 actual_hours 按前后工时之差调整；校验同 create_timeblock"""
+        block = self.get_timeblock(block_id)
+        if not block or block.user_id != self.user_id:
+            return False
+        data = block.to_dict()
+        data.update((key, value) for key, value in kwargs.items() if key in data and key != "block_id")
+        updated = TimeBlock.from_dict(data)
+        self._check_timeblock(updated.start_time, updated.end_time, allow_overlap, block_id)
+        with self.history.record("修改时间块"):
+            self.history.track(block_ids=[block_id], derived_task_ids=[updated.task_id])
+            return self.storage.save_timeblock(updated)
+    
+    def delete_timeblock(self, block_id: str) -> bool:
+        """删除时间块，并从任务的 actual_hours 中扣除其工时"""
+        block = self.get_timeblock(block_id)
+        if block and block.user_id == self.user_id:
+            with self.history.record("删除时间块"):
+                self.history.track(block_ids=[block_id])
+                return self.storage.delete_timeblock(block_id)
+        return False
+    
+    def plan(self, date_range: Tuple[Any, Any], constraints: Optional[PlanConstraints] = None) -> SchedulePlan:
+        """为未完成任务的剩余工时 (预估 - 已记录 - 已排程) 生成排程预览
+
+        date_range 为 (开始日期, 结束日期)，包含两端；只使用工作时间内
+        未被已有时间块占用的时段。结果需经 commit_plan 才会保存。
+        已保存的排程中尚未结束的部分视为已安排，已过去的计划时段不再计算，其工时重新排程。
+        """
+        start, end = (date.fromisoformat(to_date_key(value)) for value in date_range)
+        constraints = constraints or PlanConstraints()
+        self.storage.refresh()
+        not_before = (constraints.not_before or datetime.now()).timestamp()
+        planned: Dict[str, float] = {}
+        for block in self.storage.load_timeblocks():
+            if not block.planned:
+                continue
+            block_start, block_end = parse_time(block.start_time), parse_time(block.end_time)
+            if block_start is None or block_end is None or block_end <= not_before:
+                continue
+            hours = (block_end - max(block_start, not_before)) / 3600.0
+            planned[block.task_id] = planned.get(block.task_id, 0.0) + hours
+        return plan_schedule(self.storage.load_tasks(), self.timeblock_index, start, end,
+                             constraints, self.user_id, planned)
+    
+    def commit_plan(self, plan: SchedulePlan) -> bool:
+        """一次写入排程中的全部时间块
+
+        预览之后若有新的时间块占用了排程时段，抛出 TimeBlockOverlapError 且不写入。
+        保存的时间块标记为计划时段 (planned)，占用时段但不计入任务的 actual_hours 和工时报表；
+        实际完成后把 planned 改为 False 即按实际工时计入。再次排程时扣除尚未进行的计划时段。
+        """
+        if not plan.blocks:
+            return True
+        overlaps = {}
+        for block in plan.blocks:
+            for existing in self.find_overlaps(block.start_time, block.end_time):
+                overlaps[existing.block_id] = existing
+        if overlaps:
+            raise TimeBlockOverlapError(list(overlaps.values()))
+        with self.history.record(f"自动排程 {len(plan.blocks)} 个时间块"):
+            self.history.track(block_ids=[block.block_id for block in plan.blocks],
+                               derived_task_ids={block.task_id for block in plan.blocks})
+            return self.storage.save_timeblocks(plan.blocks)
+    
+    def rebuild_actual_hours(self) -> Optional[Dict[str, Tuple[float, float]]]:
+        """按全部时间块重新计算任务的 actual_hours，返回 {任务ID: (原值, 新值)}"""
+        changes = self.storage.rebuild_actual_hours()
+        if changes:
+            # 工时由时间块决定，记入日志供按时间点还原，但不可撤销
+            self.history.log_changes("重算实际工时", [
+                {"type": "task", "id": task_id, "before": {"actual_hours": old},
+                 "after": {"actual_hours": new}, "derived": True}
+                for task_id, (old, new) in changes.items()])
+        return changes
+    
+    def find_overlaps(self, start_time, end_time) -> List[TimeBlock]:
+        """与 [start_time, end_time) 重叠的已有时间块"""
+        return self.timeblocks_between(start_time, end_time)
+    
+    def timeblocks_between(self, start, end) -> List[TimeBlock]:
+        """与 [start, end) 相交的时间块，按开始时间排序"""
+        self.storage.refresh()
+        return self.timeblock_index.overlapping(to_timestamp(start), to_timestamp(end))
+    
+    def free_gaps(self, day, work_start: str = "00:00", work_end: Optional[str] = None) -> List[Tuple[str, str]]:
+        """某天 work_start ~ work_end (HH:MM，默认到次日零点) 内的空闲时段"""
+        day = date.fromisoformat(to_date_key(day))
+        start = datetime.combine(day, datetime.strptime(work_start, "%H:%M").time())
+        if work_end is None:
+            end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        else:
+            end = datetime.combine(day, datetime.strptime(work_end, "%H:%M").time())
+        self.storage.refresh()
+        gaps = self.timeblock_index.gaps(start.timestamp(), end.timestamp())
+        return [(format_time(gap_start), format_time(gap_end)) for gap_start, gap_end in gaps]
+    
     def get_task_statistics(self) -> Dict[str, Any]:
         """获取任务统计信息"""
-        tasks = self.storage.load_tasks()
+        totals = self.storage.task_totals()
+        by_status = totals["by_status"]
         
-        total_tasks = len(tasks)
-        completed_tasks = len([t for t in tasks if t.status == "done"])
-        in_progress_tasks = len([t for t in tasks if t.status == "in_progress"])
-        todo_tasks = len([t for t in tasks if t.status == "todo"])
-        
-        total_estimated_hours = sum(t.estimated_hours for t in tasks)
-        total_actual_hours = sum(t.actual_hours for t in tasks)
+        total_tasks = totals["total"]
+        completed_tasks = by_status.get("done", 0)
+        in_progress_tasks = by_status.get("in_progress", 0)
+        todo_tasks = by_status.get("todo", 0)
         
         return {
             "total_tasks": total_tasks,
@@ -86,6 +546,30 @@ class TaskManager:
             "in_progress_tasks": in_progress_tasks,
             "todo_tasks": todo_tasks,
             "completion_rate": completed_tasks / total_tasks if total_tasks > 0 else 0,
-            "total_estimated_hours": total_estimated_hours,
-            "total_actual_hours": total_actual_hours
-        }
\ No newline at end of file
+            "total_estimated_hours": totals["estimated_hours"],
+            "total_actual_hours": totals["actual_hours"]
+        }
+    
+    def check_statistics(self, repair: bool = True) -> Dict[str, Any]:
+        """从头重新统计并与增量统计比较，返回偏差 {字段: (记录值, 实际值)}，一致时为空"""
+        return self.storage.check_task_totals(repair=repair)
+    
+    def hours_by_period(self, period: str = "day", start=None, end=None) -> List[Tuple[str, float]]:
+        """按日 (day)、ISO 周 (week) 或月 (month) 汇总时间块工时，需要 NumPy"""
+        self.storage.refresh()
+        return self.rollups.by_period(self.storage.load_tasks(), period, start, end)
+    
+    def hours_by_task(self) -> List[Tuple[Task, float]]:
+        """每个任务的时间块工时，按工时降序"""
+        self.storage.refresh()
+        return self.rollups.by_task(self.storage.load_tasks())
+    
+    def hours_by_tag(self) -> List[Tuple[str, float]]:
+        """每个标签的时间块工时，按工时降序"""
+        self.storage.refresh()
+        return self.rollups.by_tag(self.storage.load_tasks())
+    
+    def hours_variance(self) -> Dict[str, Any]:
+        """预估工时与时间块工时的偏差，格式见 TimeRollups.variance"""
+        self.storage.refresh()
+        return self.rollups.variance(self.storage.load_tasks())
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+from config import TASKS_DIR, STORAGE_ENGINE
+from .storage import create_storage
+
+# 各存储引擎的数据文件，用于找出已有数据的用户
+_USER_FILE_SUFFIXES = {
+    "json": ("_tasks.json",),
+    "journal": ("_tasks.json", "_journal.jsonl"),
+    "sqlite": (".sqlite3",),
+}
+
+
+def find_user_ids(tasks_dir: Path = TASKS_DIR, engine: Optional[str] = None) -> List[str]:
+    """数据目录中在当前存储引擎下有数据的用户ID"""
+    user_ids = set()
+    for suffix in _USER_FILE_SUFFIXES[engine or STORAGE_ENGINE]:
+        for path in tasks_dir.glob(f"*{suffix}"):
+            user_ids.add(path.name[:-len(suffix)])
+    return sorted(user_ids)
+
+
+def rebuild_actual_hours(user_ids: Optional[List[str]] = None) -> Dict[str, Optional[Dict[str, Tuple[float, float]]]]:
+    """按时间块重新计算各用户任务的 actual_hours，返回 {用户ID: 变化 (失败时为 None)}"""
+    results = {}
+    for user_id in user_ids or find_user_ids():
+        storage = create_storage(user_id)
+        try:
+            results[user_id] = storage.rebuild_actual_hours()
+        finally:
+            close = getattr(storage, "close", None)
+            if close is not None:
+                close()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m core.tracking [用户ID ...]
+    for rebuilt_user, changes in rebuild_actual_hours(sys.argv[1:]).items():
+        if changes is None:
+            print(f"{rebuilt_user}: 重算失败")
+        else:
+            print(f"{rebuilt_user}: 更新 {len(changes)} 个任务的实际工时")
@@ -0,0 +1,151 @@
+import heapq
+from datetime import date, datetime
+from typing import List, Dict, Iterable, Optional, Callable, Tuple
+from .models import Task
+from .due_dates import OPEN_STATUSES, normalize_due_date
+from .query import PRIORITY_RANK
+
+# 得分以“天”为单位：每高一级优先级相当于截止日期提前 3 天，
+# 截止日期每近一天加 1 分，任务每存在一天加 0.1 分
+PRIORITY_WEIGHT = 3.0
+URGENCY_WEIGHT = 1.0
+AGE_WEIGHT = 0.1
+# 没有截止日期的任务视为创建后 30 天到期
+NO_DUE_DAYS = 30
+
+
+def _created_days(task: Task) -> float:
+    try:
+        created = datetime.fromisoformat(task.created_at)
+    except (TypeError, ValueError):
+        return 0.0
+    return created.toordinal() + (created.hour * 3600 + created.minute * 60 + created.second) / 86400.0
+
+
+def base_score(task: Task) -> float:
+    """与日期无关的部分得分
+
+    score(today) = 优先级 x 3 + (today - 截止日期) + (today - 创建日期) x 0.1，
+    其中含 today 的项对所有任务相同，排序只取决于此部分，因此堆不必每天重建。
+    """
+    created = _created_days(task)
+    due = normalize_due_date(task.due_date)
+    due_days = date.fromisoformat(due).toordinal() if due else int(created) + NO_DUE_DAYS
+    return (PRIORITY_WEIGHT * PRIORITY_RANK.get(task.priority, 0)
+            - URGENCY_WEIGHT * due_days - AGE_WEIGHT * created)
+
+
+def score(task: Task, today: Optional[date] = None) -> float:
+    """任务在 today 的得分，越高越应该先做"""
+    today = (today or date.today()).toordinal()
+    return base_score(task) + (URGENCY_WEIGHT + AGE_WEIGHT) * today
+
+
+class WorkQueue:
+    """未完成任务的索引堆 (按得分的最大堆)
+
+    作为二级索引挂在 TaskStorage 上，pos 记录每个任务在堆数组中的位置，
+    更新任务时原位调整键值并上浮或下沉 (decrease-key)，增删改均为 O(log n)。
+    top(k) 在堆上做最佳优先遍历，为 O(k log k)，不需要排序全部任务。
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._pos: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def rebuild(self, tasks: Iterable[Task]):
+        """从全部任务重建"""
+        self.__init__()
+        for task in tasks:
+            if self._queued(task):
+                self.tasks[task.task_id] = task
+                self._heap.append((-base_score(task), task.task_id))
+        heapq.heapify(self._heap)
+        self._pos = {task_id: i for i, (_, task_id) in enumerate(self._heap)}
+
+    def put(self, task: Task):
+        """新增或更新任务，已完成/取消的任务移出队列"""
+        if not self._queued(task):
+            self.remove(task.task_id)
+            return
+        self.tasks[task.task_id] = task
+        entry = (-base_score(task), task.task_id)
+        i = self._pos.get(task.task_id)
+        if i is None:
+            self._heap.append(entry)
+            self._pos[task.task_id] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        old = self._heap[i]
+        self._heap[i] = entry
+        if entry < old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    @staticmethod
+    def _queued(task: Task) -> bool:
+        # 重复任务的系列本身不是一项待做的工作
+        return task.status in OPEN_STATUSES and not task.recurrence
+
+    def remove(self, task_id: str):
+        """删除任务"""
+        self.tasks.pop(task_id, None)
+        i = self._pos.pop(task_id, None)
+        if i is None:
+            return
+        last = self._heap.pop()
+        if i == len(self._heap):
+            return
+        self._heap[i] = last
+        self._pos[last[1]] = i
+        self._sift_up(i)
+        self._sift_down(self._pos[last[1]])
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._pos[heap[i][1]] = i
+        self._pos[heap[j][1]] = j
+
+    def _sift_up(self, i: int):
+        heap = self._heap
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[i] >= heap[parent]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int):
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and heap[child] < heap[smallest]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def top(self, k: int, accept: Optional[Callable[[Task], bool]] = None) -> List[Task]:
+        """得分最高的 k 个任务，accept 为额外的筛选条件"""
+        result: List[Task] = []
+        if not self._heap or k <= 0:
+            return result
+        frontier = [(self._heap[0], 0)]
+        while frontier and len(result) < k:
+            (_, task_id), i = heapq.heappop(frontier)
+            task = self.tasks[task_id]
+            if accept is None or accept(task):
+                result.append(task)
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self._heap):
+                    heapq.heappush(frontier, (self._heap[child], child))
+        return result
@@ -5,16 +5,35 @@ from datetime import datetime
 from auth.user_manager import UserManager
 from core.task_manager import TaskManager
 from core.models import Task
+from core.due_dates import today_key, days_from_today
+from core.scheduler import PlanConstraints
+from core.intervals import TimeBlockOverlapError
+from core.storage import VersionConflictError
+from core.changes import TASK_CREATED, TASK_DELETED, TASKS_RELOADED
+from core.recurrence import occurrence_id
 
 # 设置主题
 sg.theme('LightBlue2')
 
+# 任务表格每页显示的行数
+PAGE_SIZE = 100
+
 class TimeManagementGUI:
     def __init__(self):
         self.user_manager = UserManager()
         self.current_user = None
         self.current_session = None
         self.task_manager = None
+        # 当前视图：状态筛选、各页游标和表格中显示的任务
+        self.view_status = None
+        self.page_cursors = [None]
+        self.next_cursor = None
+        self.displayed_tasks = []
+        # 表格的本地模型：任务ID -> 行号，按任务变更通知逐行更新
+        self.row_of = {}
+        self.row_start = 0
+        # 分页视图 (page) 或搜索结果等固定列表 (list)
+        self.view_mode = 'page'
         
     def safe_update(self, window, key, value):
         """安全更新窗口元素，避免 None 引用错误"""
@@ -124,9 +143,10 @@ class TimeManagementGUI:
         """主窗口"""
         # 创建菜单
         menu_def = [
-            ['任务', ['添加任务', '编辑任务', '删除任务', '标记状态']],
-            ['查看', ['所有任务', '待办任务', '进行中', '已完成']],
-            ['统计', ['任务统计']],
+            ['任务', ['添加任务', '编辑任务', '删除任务', '标记状态', '自动排程']],
+            ['编辑', ['撤销', '重做']],
+            ['查看', ['所有任务', '待办任务', '进行中', '已完成', '即将到期', '已逾期', '接下来做什么']],
+            ['统计', ['任务统计', '工时报表']],
             ['帮助', ['关于']]
         ]
         
@@ -136,6 +156,7 @@ class TimeManagementGUI:
         layout = [
             [sg.Menu(menu_def)],
             [sg.Text(f'欢迎, {self.current_user.username if self.current_user else "未知用户"}', font=('Arial', 14))],
+            [sg.InputText(key='-SEARCH-', size=(30, 1)), sg.Button('搜索')],
             [sg.Table(values=[], headings=headers, 
                      auto_size_columns=False,
                      justification='left',
@@ -143,12 +164,17 @@ class TimeManagementGUI:
                      key='-TASK-TABLE-',
                      enable_events=True,
                      col_widths=[5, 25, 10, 10, 12, 10])],
+            [sg.Button('上一页'), sg.Text('', key='-PAGE-', size=(10, 1)), sg.Button('下一页')],
             [sg.Button('刷新'), sg.Button('添加任务'), sg.Button('编辑任务'), 
-             sg.Button('标记状态'), sg.Button('删除任务'), sg.Button('统计'), sg.Button('退出')]
+             sg.Button('标记状态'), sg.Button('删除任务'), sg.Button('撤销'), sg.Button('重做'),
+             sg.Button('统计'), sg.Button('退出')]
         ]
         
         window = sg.Window('时间管理系统', layout, finalize=True)
         self.refresh_task_table(window)
+        # 增删改之后只更新受影响的行，不重新查询整页
+        unsubscribe = (self.task_manager.subscribe(lambda change: self.apply_task_change(window, change))
+                       if self.task_manager else None)
         
         while True:
             event, values = window.read()
@@ -159,18 +185,44 @@ class TimeManagementGUI:
             elif event == '刷新':
                 self.refresh_task_table(window)
                 
-            elif event in ('添加任务', '任务::添加任务'):
-                if self.add_task_window():
+            elif event == '搜索':
+                keyword = values['-SEARCH-'].strip()
+                if not keyword:
+                    self.show_view(window, self.view_status)
+                elif self.task_manager:
+                    tasks = self.task_manager.search(keyword, limit=PAGE_SIZE)
+                    self.show_task_list(window, tasks, f'搜索结果 {len(tasks)} 条')
+                
+            elif event == '上一页':
+                if len(self.page_cursors) > 1:
+                    self.page_cursors.pop()
+                    self.refresh_task_table(window)
+                    
+            elif event == '下一页':
+                if self.next_cursor:
+                    self.page_cursors.append(self.next_cursor)
                     self.refresh_task_table(window)
+                
+            elif event in ('撤销', '编辑::撤销'):
+                if self.task_manager:
+                    if not self.task_manager.undo():
+                        sg.popup('没有可撤销的操作')
+                    
+            elif event in ('重做', '编辑::重做'):
+                if self.task_manager:
+                    if not self.task_manager.redo():
+                        sg.popup('没有可重做的操作')
+                    
+            elif event in ('添加任务', '任务::添加任务'):
+                self.add_task_window()
                     
             elif event in ('编辑任务', '任务::编辑任务'):
                 selected_tasks = values['-TASK-TABLE-']
                 if selected_tasks and self.task_manager:
                     task_index = selected_tasks[0]
-                    tasks = self.task_manager.list_tasks()
+                    tasks = self.displayed_tasks
                     if 0 <= task_index < len(tasks):
-                        if self.edit_task_window(tasks[task_index]):
-                            self.refresh_task_table(window)
+                        self.edit_task_window(tasks[task_index])
                 else:
                     sg.popup('请先选择一个任务')
                     
@@ -178,10 +230,9 @@ class TimeManagementGUI:
                 selected_tasks = values['-TASK-TABLE-']
                 if selected_tasks and self.task_manager:
                     task_index = selected_tasks[0]
-                    tasks = self.task_manager.list_tasks()
+                    tasks = self.displayed_tasks
                     if 0 <= task_index < len(tasks):
-                        if self.mark_status_window(tasks[task_index]):
-                            self.refresh_task_table(window)
+                        self.mark_status_window(tasks[task_index])
                 else:
                     sg.popup('请先选择一个任务')
                     
@@ -189,81 +240,197 @@ class TimeManagementGUI:
                 selected_tasks = values['-TASK-TABLE-']
                 if selected_tasks and self.task_manager:
                     task_index = selected_tasks[0]
-                    tasks = self.task_manager.list_tasks()
+                    tasks = self.displayed_tasks
                     if 0 <= task_index < len(tasks):
                         task = tasks[task_index]
                         if sg.popup_yes_no(f'确认删除任务 "{task.title}"?') == 'Yes':
                             if self.task_manager.delete_task(task.task_id):
                                 sg.popup('任务已删除')
-                                self.refresh_task_table(window)
                             else:
                                 sg.popup('删除失败')
                 else:
                     sg.popup('请先选择一个任务')
                     
+            elif event in ('自动排程', '任务::自动排程'):
+                if self.task_manager:
+                    self.plan_window()
+                    
             elif event in ('所有任务', '查看::所有任务'):
-                self.refresh_task_table(window)
+                self.show_view(window, None)
                 
             elif event in ('待办任务', '查看::待办任务'):
-                if self.task_manager:
-                    tasks = self.task_manager.list_tasks(status='todo')
-                    self.update_task_table(window, tasks)
+                self.show_view(window, 'todo')
                 
             elif event in ('进行中', '查看::进行中'):
-                if self.task_manager:
-                    tasks = self.task_manager.list_tasks(status='in_progress')
-                    self.update_task_table(window, tasks)
+                self.show_view(window, 'in_progress')
                 
             elif event in ('已完成', '查看::已完成'):
+                self.show_view(window, 'done')
+                
+            elif event in ('即将到期', '查看::即将到期'):
+                if self.task_manager:
+                    tasks = self.task_manager.tasks_due_between(today_key(), days_from_today(7))
+                    self.show_task_list(window, tasks, f'7天内到期 {len(tasks)} 条')
+                
+            elif event in ('已逾期', '查看::已逾期'):
                 if self.task_manager:
-                    tasks = self.task_manager.list_tasks(status='done')
-                    self.update_task_table(window, tasks)
+                    tasks = self.task_manager.overdue()
+                    self.show_task_list(window, tasks, f'已逾期 {len(tasks)} 条')
+                
+            elif event in ('接下来做什么', '查看::接下来做什么'):
+                if self.task_manager:
+                    tasks = self.task_manager.next_tasks(15)
+                    self.show_task_list(window, tasks, f'接下来 {len(tasks)} 条')
                 
             elif event in ('统计', '统计::任务统计'):
                 self.show_statistics_window()
                 
+            elif event in ('工时报表', '统计::工时报表'):
+                if self.task_manager:
+                    self.show_time_report_window()
+                
             elif event == '关于':
                 sg.popup('时间管理系统 v1.0\n\n一个功能完整的时间管理工具\n支持任务管理和时间追踪')
                 
+        if unsubscribe:
+            unsubscribe()
         window.close()
         if self.current_session:
             self.user_manager.logout(self.current_session)
         
+    def show_view(self, window, status):
+        """切换状态筛选并回到第一页"""
+        self.view_status = status
+        self.page_cursors = [None]
+        self.refresh_task_table(window)
+        
+    def show_task_list(self, window, tasks, caption):
+        """在表格中显示不分页的任务列表（搜索结果、截止日期等）"""
+        self.view_mode = 'list'
+        self.next_cursor = None
+        self.update_task_table(window, tasks)
+        self.safe_update(window, '-PAGE-', caption)
+        
     def refresh_task_table(self, window):
-        """刷新任务表格"""
+        """按当前视图和页码刷新任务表格"""
         if self.task_manager:
-            tasks = self.task_manager.list_tasks()
-            self.update_task_table(window, tasks)
+            result = self.task_manager.query(status=self.view_status, limit=PAGE_SIZE,
+                                             cursor=self.page_cursors[-1])
+            if not result.items and len(self.page_cursors) > 1:
+                # 当前页的任务已全部删除，退回上一页
+                self.page_cursors.pop()
+                return self.refresh_task_table(window)
+            self.view_mode = 'page'
+            self.next_cursor = result.next_cursor
+            start = (len(self.page_cursors) - 1) * PAGE_SIZE
+            self.update_task_table(window, result.items, start)
+            self.safe_update(window, '-PAGE-', f'第 {len(self.page_cursors)} 页')
         
-    def update_task_table(self, window, tasks):
+    def update_task_table(self, window, tasks, start=0):
         """更新任务表格数据"""
-        table_data = []
-        for i, task in enumerate(tasks):
-            status_text = {
-                'todo': '待办',
-                'in_progress': '进行中', 
-                'done': '已完成',
-                'cancelled': '已取消'
-            }.get(task.status, task.status)
-            
-            priority_text = {
-                'low': '低',
-                'medium': '中',
-                'high': '高',
-                'urgent': '紧急'
-            }.get(task.priority, task.priority)
-            
-            table_data.append([
-                str(i+1),
-                task.title,
-                status_text,
-                priority_text,
-                task.due_date or '无',
-                f"{task.estimated_hours}h"
-            ])
-            
+        self.displayed_tasks = list(tasks)
+        self.row_start = start
+        self.row_of = {task.task_id: i for i, task in enumerate(self.displayed_tasks)}
+        table_data = [self.task_row(i, task) for i, task in enumerate(self.displayed_tasks, start)]
         self.safe_update(window, '-TASK-TABLE-', table_data)
         
+    @staticmethod
+    def task_row(i, task):
+        """表格中的一行"""
+        status_text = {
+            'todo': '待办',
+            'in_progress': '进行中', 
+            'done': '已完成',
+            'cancelled': '已取消'
+        }.get(task.status, task.status)
+        
+        priority_text = {
+            'low': '低',
+            'medium': '中',
+            'high': '高',
+            'urgent': '紧急'
+        }.get(task.priority, task.priority)
+        
+        return [
+            str(i+1),
+            task.title,
+            status_text,
+            priority_text,
+            task.due_date or '无',
+            f"{task.estimated_hours}h"
+        ]
+        
+    def in_view(self, task):
+        """任务是否属于当前分页视图的状态筛选"""
+        return self.view_mode == 'list' or self.view_status is None or task.status == self.view_status
+        
+    def apply_task_change(self, window, change):
+        """按任务变更通知更新本地模型和表格中受影响的行"""
+        if change.kind == TASKS_RELOADED:
+            if self.view_mode == 'page':
+                self.refresh_task_table(window)
+            return
+        row = self.row_of.get(change.task_id)
+        if row is None and change.task is not None and change.task.series_id:
+            # 重复任务的实例保存后换了ID，替换表格中原来的未保存实例
+            row = self.row_of.pop(occurrence_id(change.task.series_id, change.task.occurrence_date), None)
+            if row is not None:
+                self.row_of[change.task_id] = row
+        if change.kind == TASK_DELETED or (row is not None and not self.in_view(change.task)):
+            if row is not None:
+                self.remove_table_row(window, row)
+                if not self.displayed_tasks and self.view_mode == 'page' and len(self.page_cursors) > 1:
+                    # 当前页的任务已全部删除，退回上一页
+                    self.refresh_task_table(window)
+        elif row is not None:
+            self.displayed_tasks[row] = change.task
+            self.patch_table_rows(window, row, row + 1)
+        elif self.view_mode == 'page' and self.in_view(change.task):
+            if (change.kind == TASK_CREATED and self.next_cursor is None
+                    and len(self.displayed_tasks) < PAGE_SIZE):
+                # 新任务排在存储顺序末尾，即最后一页的末尾
+                self.append_table_row(window, change.task)
+            else:
+                # 任务进入当前状态筛选，位置需要查询才能确定
+                self.refresh_task_table(window)
+        
+    def patch_table_rows(self, window, start, end):
+        """重绘表格中 [start, end) 行，失败时按本地模型重绘整个表格"""
+        try:
+            table = window['-TASK-TABLE-']
+            for row in range(start, end):
+                values = self.task_row(self.row_start + row, self.displayed_tasks[row])
+                table.Widget.item(table.tree_ids[row], values=values)
+                table.Values[row] = values
+        except Exception:
+            self.update_task_table(window, self.displayed_tasks, self.row_start)
+        
+    def remove_table_row(self, window, row):
+        """删除一行，其后各行的序号随之前移"""
+        del self.displayed_tasks[row]
+        self.row_of = {task.task_id: i for i, task in enumerate(self.displayed_tasks)}
+        try:
+            table = window['-TASK-TABLE-']
+            table.Widget.delete(table.tree_ids[row])
+            del table.tree_ids[row]
+            del table.Values[row]
+        except Exception:
+            self.update_task_table(window, self.displayed_tasks, self.row_start)
+            return
+        self.patch_table_rows(window, row, len(self.displayed_tasks))
+        
+    def append_table_row(self, window, task):
+        """在表格末尾添加一行"""
+        self.row_of[task.task_id] = len(self.displayed_tasks)
+        self.displayed_tasks.append(task)
+        values = self.task_row(self.row_start + len(self.displayed_tasks) - 1, task)
+        try:
+            table = window['-TASK-TABLE-']
+            table.tree_ids.append(table.Widget.insert('', 'end', text=values, values=values))
+            table.Values.append(values)
+        except Exception:
+            self.update_task_table(window, self.displayed_tasks, self.row_start)
+        
     def add_task_window(self):
         """添加任务窗口"""
         layout = [
@@ -276,6 +443,8 @@ class TimeManagementGUI:
              sg.CalendarButton('选择日期', target='-DUE_DATE-', format='%Y-%m-%d')],
             [sg.Text('预估小时:'), sg.InputText(key='-ESTIMATED-', size=(10, 1))],
             [sg.Text('标签 (逗号分隔):'), sg.InputText(key='-TAGS-', size=(30, 1))],
+            [sg.Text('重复:'),
+             sg.Combo(['不重复', '每天', '每周', '每月'], default_value='不重复', key='-REPEAT-', readonly=True)],
             [sg.Button('保存'), sg.Button('取消')],
             [sg.Text('', key='-MSG-', text_color='red')]
         ]
@@ -319,7 +488,20 @@ class TimeManagementGUI:
                     'tags': tags
                 }
                 
-                task = self.task_manager.create_task(**task_data) if self.task_manager else None
+                # 重复任务从截止日期 (默认今天) 开始
+                repeat_map = {'每天': 'daily', '每周': 'weekly', '每月': 'monthly'}
+                repeat = repeat_map.get(values['-REPEAT-'])
+                try:
+                    if not self.task_manager:
+                        task = None
+                    elif repeat:
+                        task = self.task_manager.create_recurring_task(
+                            freq=repeat, start=task_data.pop('due_date'), **task_data)
+                    else:
+                        task = self.task_manager.create_task(**task_data)
+                except ValueError as e:
+                    self.safe_update(window, '-MSG-', str(e))
+                    continue
                 if task:
                     sg.popup(f'任务 "{task.title}" 创建成功!')
                     result = True
@@ -397,7 +579,14 @@ class TimeManagementGUI:
                     'tags': tags
                 }
                 
-                if self.task_manager and self.task_manager.update_task(task.task_id, **update_data):
+                try:
+                    updated = self.task_manager and self.task_manager.update_task(
+                        task.task_id, expected_version=task.version, **update_data)
+                except VersionConflictError as e:
+                    # 不覆盖其他程序的修改，关闭窗口后表格已显示最新内容
+                    sg.popup(str(e))
+                    break
+                if updated:
                     sg.popup('任务更新成功!')
                     result = True
                     break
@@ -407,6 +596,71 @@ class TimeManagementGUI:
         window.close()
         return result
         
+    def plan_window(self):
+        """自动排程窗口：预览把未完成任务排入空闲时段的结果，确认后一次保存"""
+        layout = [
+            [sg.Text('自动排程', font=('Arial', 16))],
+            [sg.Text('开始日期:'), sg.InputText(today_key(), key='-FROM-', size=(12, 1)),
+             sg.Text('结束日期:'), sg.InputText(days_from_today(6), key='-TO-', size=(12, 1))],
+            [sg.Text('工作时间:'), sg.InputText('09:00', key='-WORK-START-', size=(6, 1)),
+             sg.Text('-'), sg.InputText('18:00', key='-WORK-END-', size=(6, 1)),
+             sg.Text('单任务每天上限(小时):'), sg.InputText('', key='-CAP-', size=(6, 1))],
+            [sg.Button('预览')],
+            [sg.Table(values=[], headings=['开始', '结束', '任务'], auto_size_columns=False,
+                      col_widths=[16, 16, 25], justification='left', num_rows=15, key='-PLAN-TABLE-')],
+            [sg.Text('', key='-PLAN-INFO-', size=(60, 2))],
+            [sg.Button('保存排程'), sg.Button('关闭')]
+        ]
+        
+        window = sg.Window('自动排程', layout, finalize=True)
+        plan = None
+        result = False
+        while True:
+            event, values = window.read()
+            
+            if event in (sg.WIN_CLOSED, '关闭'):
+                break
+                
+            elif event == '预览':
+                try:
+                    cap = float(values['-CAP-']) if values['-CAP-'].strip() else None
+                    constraints = PlanConstraints(work_start=values['-WORK-START-'].strip(),
+                                                  work_end=values['-WORK-END-'].strip(),
+                                                  max_task_hours_per_day=cap)
+                    plan = self.task_manager.plan((values['-FROM-'], values['-TO-']), constraints)
+                except ValueError as e:
+                    plan = None
+                    self.safe_update(window, '-PLAN-INFO-', f'参数错误: {e}')
+                    continue
+                titles = {task.task_id: task.title for task in self.task_manager.storage.load_tasks()}
+                rows = [[block.start_time.replace('T', ' '), block.end_time.replace('T', ' '),
+                         titles.get(block.task_id, block.task_id)] for block in plan.blocks]
+                self.safe_update(window, '-PLAN-TABLE-', rows)
+                info = f'共 {len(plan.blocks)} 个时间块，{plan.planned_hours:.1f} 小时'
+                if plan.unscheduled:
+                    info += f'；{len(plan.unscheduled)} 个任务未能排入'
+                if plan.late:
+                    info += f'；{len(plan.late)} 个任务将晚于截止日期完成'
+                self.safe_update(window, '-PLAN-INFO-', info)
+                
+            elif event == '保存排程':
+                if not plan or not plan.blocks:
+                    sg.popup('请先预览排程')
+                    continue
+                try:
+                    saved = self.task_manager.commit_plan(plan)
+                except TimeBlockOverlapError:
+                    sg.popup('预览后时间块有变化，请重新预览')
+                    continue
+                if saved:
+                    sg.popup(f'已保存 {len(plan.blocks)} 个时间块')
+                    result = True
+                    break
+                sg.popup('保存失败')
+                
+        window.close()
+        return result
+        
     def mark_status_window(self, task):
         """标记状态窗口"""
         layout = [
@@ -439,7 +693,13 @@ class TimeManagementGUI:
                 else:
                     status = task.status
                     
-                if self.task_manager and self.task_manager.update_task(task.task_id, status=status):
+                try:
+                    updated = self.task_manager and self.task_manager.update_task(
+                        task.task_id, expected_version=task.version, status=status)
+                except VersionConflictError as e:
+                    sg.popup(str(e))
+                    break
+                if updated:
                     sg.popup('状态更新成功!')
                     result = True
                     break
@@ -470,10 +730,59 @@ class TimeManagementGUI:
             [sg.Text(f'完成率: {stats["completion_rate"]:.1%}')],
             [sg.Text(f'总预估时间: {stats["total_estimated_hours"]:.1f}h')],
             [sg.Text(f'总实际时间: {stats["total_actual_hours"]:.1f}h')],
-            [sg.Button('关闭')]
+            [sg.Button('校验'), sg.Button('工时报表'), sg.Button('关闭')]
         ]
         
         window = sg.Window('任务统计', layout)
+        event, _ = window.read()
+        window.close()
+        if event == '校验' and self.task_manager:
+            drift = self.task_manager.check_statistics(repair=True)
+            if drift:
+                lines = [f'{key}: 记录 {recorded} -> 实际 {actual}' for key, (recorded, actual) in drift.items()]
+                sg.popup('发现统计偏差，已按实际数据修复:\n\n' + '\n'.join(lines))
+            else:
+                sg.popup('统计数据一致')
+        elif event == '工时报表' and self.task_manager:
+            self.show_time_report_window()
+    
+    def show_time_report_window(self):
+        """工时报表窗口，按日/周/月、任务、标签汇总时间块工时"""
+        try:
+            periods = {period: self.task_manager.hours_by_period(period) for period in ('day', 'week', 'month')}
+        except ImportError as e:
+            sg.popup(str(e))
+            return
+        by_task = self.task_manager.hours_by_task()
+        by_tag = self.task_manager.hours_by_tag()
+        variance = self.task_manager.hours_variance()
+        
+        def table(headings, rows, widths):
+            return sg.Table(values=rows, headings=headings, auto_size_columns=False,
+                            col_widths=widths, justification='left', num_rows=15)
+        
+        def period_tab(title, rows):
+            return sg.Tab(title, [[table(['时间', '工时'], [[label, f'{hours:.1f}'] for label, hours in reversed(rows)], [12, 10])]])
+        
+        variance_rows = [[item['task'].title, f"{item['estimated_hours']:.1f}", f"{item['tracked_hours']:.1f}",
+                          f"{item['variance']:+.1f}"] for item in variance['items']]
+        layout = [
+            [sg.TabGroup([[
+                period_tab('按日', periods['day']),
+                period_tab('按周', periods['week']),
+                period_tab('按月', periods['month']),
+                sg.Tab('按任务', [[table(['任务', '工时'], [[task.title, f'{hours:.1f}'] for task, hours in by_task], [30, 10])]]),
+                sg.Tab('按标签', [[table(['标签', '工时'], [[tag, f'{hours:.1f}'] for tag, hours in by_tag], [20, 10])]]),
+                sg.Tab('预估偏差', [
+                    [sg.Text(f"预估 {variance['estimated_hours']:.1f}h，记录 {variance['tracked_hours']:.1f}h，"
+                             f"偏差 {variance['variance']:+.1f}h")],
+                    [table(['任务', '预估', '记录', '偏差'], variance_rows, [30, 8, 8, 8])]
+                ])
+            ]])],
+            [sg.Button('关闭')]
+        ]
+        
+        window = sg.Window('工时报表', layout)
         window.read()
         window.close()
 
@@ -58,6 +58,7 @@ def main():
         else:
             # 已登录状态 - 延迟导入以避免循环依赖
             from core.task_manager import TaskManager
+            from core.storage import VersionConflictError
             from ui.cli import CLIInterface
             
             task_manager = TaskManager(current_user.user_id)
@@ -69,103 +70,108 @@ def main():
                 
                 if choice == "1":
                     # 查看所有任务
-                    tasks = task_manager.list_tasks()
-                    cli.display_header("所有任务")
-                    cli.display_tasks(tasks, show_details=True)
-                    input("按回车键继续...")
+                    cli.browse_tasks("所有任务")
                 
                 elif choice == "2":
                     # 添加任务
                     cli.display_header("添加任务")
                     task_data = cli.get_task_input()
                     if task_data:
-                        task = task_manager.create_task(**task_data)
-                        print(f"任务 '{task.title}' 已创建!")
+                        repeat = task_data.pop("repeat", None)
+                        if repeat:
+                            try:
+                                task = task_manager.create_recurring_task(
+                                    freq=repeat, start=task_data.pop("due_date") or None, **task_data)
+                            except ValueError as e:
+                                task = None
+                                print(f"创建失败: {e}")
+                        else:
+                            task = task_manager.create_task(**task_data)
+                        if task:
+                            print(f"任务 '{task.title}' 已创建!")
                     input("按回车键继续...")
                 
                 elif choice == "3":
                     # 编辑任务
-                    tasks = task_manager.list_tasks()
-                    cli.display_header("编辑任务")
-                    cli.display_tasks(tasks)
-                    
-                    try:
-                        task_num = int(cli.get_user_choice("选择要编辑的任务编号: "))
-                        if 1 <= task_num <= len(tasks):
-                            task = tasks[task_num - 1]
-                            cli.display_header(f"编辑任务: {task.title}")
-                            task_data = cli.get_task_input(task)
-                            if task_data:
-                                if task_manager.update_task(task.task_id, **task_data):
+                    task = cli.select_task("编辑任务", "选择要编辑的任务编号")
+                    if task:
+                        cli.display_header(f"编辑任务: {task.title}")
+                        task_data = cli.get_task_input(task)
+                        if task_data:
+                            try:
+                                if task_manager.update_task(task.task_id, expected_version=task.version,
+                                                            **task_data):
                                     print("任务更新成功!")
                                 else:
                                     print("更新失败!")
-                        else:
-                            print("无效的任务编号!")
-                    except ValueError:
-                        print("请输入有效的数字!")
-                    input("按回车键继续...")
+                            except VersionConflictError as e:
+                                print(e)
+                        input("按回车键继续...")
                 
                 elif choice == "4":
                     # 标记任务状态
-                    tasks = task_manager.list_tasks()
-                    cli.display_header("标记任务状态")
-                    cli.display_tasks(tasks)
-                    
-                    try:
-                        task_num = int(cli.get_user_choice("选择任务编号: "))
-                        if 1 <= task_num <= len(tasks):
-                            task = tasks[task_num - 1]
-                            print(f"\n任务: {task.title}")
-                            print("1. 标记为待办")
-                            print("2. 标记为进行中")
-                            print("3. 标记为完成")
-                            
-                            status_choice = cli.get_user_choice("选择状态: ")
-                            status_map = {"1": "todo", "2": "in_progress", "3": "done"}
-                            
-                            if status_choice in status_map:
-                                if task_manager.update_task(task.task_id, status=status_map[status_choice]):
+                    task = cli.select_task("标记任务状态")
+                    if task:
+                        print(f"\n任务: {task.title}")
+                        print("1. 标记为待办")
+                        print("2. 标记为进行中")
+                        print("3. 标记为完成")
+                        
+                        status_choice = cli.get_user_choice("选择状态: ")
+                        status_map = {"1": "todo", "2": "in_progress", "3": "done"}
+                        
+                        if status_choice in status_map:
+                            try:
+                                if task_manager.update_task(task.task_id, expected_version=task.version,
+                                                            status=status_map[status_choice]):
                                     print("状态更新成功!")
                                 else:
                                     print("更新失败!")
-                            else:
-                                print("无效选择!")
+                            except VersionConflictError as e:
+                                print(e)
                         else:
-                            print("无效的任务编号!")
-                    except ValueError:
-                        print("请输入有效的数字!")
-                    input("按回车键继续...")
+                            print("无效选择!")
+                        input("按回车键继续...")
                 
                 elif choice == "5":
                     # 删除任务
-                    tasks = task_manager.list_tasks()
-                    cli.display_header("删除任务")
-                    cli.display_tasks(tasks)
-                    
-                    try:
-                        task_num = int(cli.get_user_choice("选择要删除的任务编号: "))
-                        if 1 <= task_num <= len(tasks):
-                            task = tasks[task_num - 1]
-                            confirm = cli.get_user_choice(f"确认删除任务 '{task.title}'? (y/N): ")
-                            if confirm.lower() == 'y':
-                                if task_manager.delete_task(task.task_id):
-                                    print("任务已删除!")
-                                else:
-                                    print("删除失败!")
+                    task = cli.select_task("删除任务", "选择要删除的任务编号")
+                    if task:
+                        confirm = cli.get_user_choice(f"确认删除任务 '{task.title}'? (y/N): ")
+                        if confirm.lower() == 'y':
+                            if task_manager.delete_task(task.task_id):
+                                print("任务已删除!")
                             else:
-                                print("取消删除。")
+                                print("删除失败!")
                         else:
-                            print("无效的任务编号!")
-                    except ValueError:
-                        print("请输入有效的数字!")
-                    input("按回车键继续...")
+                            print("取消删除。")
+                        input("按回车键继续...")
                 
                 elif choice == "6":
                     # 查看统计
                     cli.show_statistics()
                 
                 elif choice == "7":
+                    # 搜索任务
+                    cli.show_search()
+                
+                elif choice == "8":
+                    # 截止日期提醒
+                    cli.show_deadlines()
+                
+                elif choice == "9":
+                    # 接下来做什么
+                    cli.show_next_tasks()
+                
+                elif choice.lower() == "u":
+                    # 撤销
+                    cli.undo()
+                
+                elif choice.lower() == "r":
+                    # 重做
+                    cli.redo()
+                
+                elif choice == "0":
                     # 退出
                     user_manager.logout(current_session)
                     current_user = None
@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.history
+import core.journal
+import core.sqlite_storage
+import core.storage
+import core.tracking
+
+ENGINES = ("json", "journal", "sqlite")
+
+# 各模块在导入时复制了 config.TASKS_DIR，需要逐个替换
+_TASKS_DIR_MODULES = (core.storage, core.journal, core.sqlite_storage, core.history, core.tracking)
+
+
+@pytest.fixture(autouse=True)
+def tasks_dir(tmp_path, monkeypatch):
+    """数据文件写入临时目录，不触碰 data/tasks"""
+    path = tmp_path / "tasks"
+    path.mkdir()
+    for module in _TASKS_DIR_MODULES:
+        monkeypatch.setattr(module, "TASKS_DIR", path)
+    return path
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request, monkeypatch):
+    """依次在三种存储引擎下运行，TaskManager 按 STORAGE_ENGINE 创建存储"""
+    monkeypatch.setattr(core.storage, "STORAGE_ENGINE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def open_storage():
+    """创建存储并在测试结束时关闭 (SQLite 连接、journal 的后台压缩)"""
+    opened = []
+
+    def factory(user_id, engine):
+        storage = core.storage.create_storage(user_id, engine)
+        opened.append(storage)
+        return storage
+
+    yield factory
+    for storage in opened:
+        wait = getattr(storage, "wait_for_compaction", None)
+        if wait is not None:
+            wait()
+        close = getattr(storage, "close", None)
+        if close is not None:
+            close()
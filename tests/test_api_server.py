@@ -0,0 +1,207 @@
+"""HTTP 接口的输入校验和错误处理"""
+import http.client
+import json
+import threading
+
+import pytest
+
+from auth.security import HashParams, SecurityManager
+from auth.sessions import SessionStore
+from auth.user_manager import UserManager
+from auth.user_store import UserStore
+from core.manager_cache import ManagerCache
+from ui.api_server import ApiServer
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, engine):
+    # 测试不需要高强度的密码哈希
+    monkeypatch.setattr(SecurityManager, "hash_params", HashParams(iterations=1000))
+    store = UserStore(db_file=tmp_path / "users.sqlite3", legacy_file=None)
+    server = ApiServer(("127.0.0.1", 0), user_manager=UserManager(store=store, sessions=SessionStore()),
+                       managers=ManagerCache(), max_workers=2)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    store.close()
+
+
+@pytest.fixture
+def call(server):
+    def request(method, path, body=None, token=None):
+        connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+    return request
+
+
+@pytest.fixture
+def token(call):
+    assert call("POST", "/register", {"username": "alice", "password": "secret1"})[0] == 201
+    status, body = call("POST", "/login", {"username": "alice", "password": "secret1"})
+    assert status == 200
+    return body["token"]
+
+
+@pytest.fixture
+def task(call, token):
+    status, body = call("POST", "/tasks", {"title": "写周报", "estimated_hours": 2}, token)
+    assert status == 201
+    return body
+
+
+@pytest.mark.parametrize("fields", [
+    {"estimated_hours": "abc"},
+    {"estimated_hours": -1},
+    {"estimated_hours": True},
+    {"actual_hours": None},
+    {"status": "finished"},
+    {"priority": "HIGH"},
+    {"due_date": "下周"},
+    {"due_date": 20260105},
+    {"tags": "a,b"},
+    {"tags": ["a", 1]},
+    {"blocked_by": [None]},
+    {"description": 3},
+    {"recurrence": {"freq": "hourly", "start": "2026-01-01"}},
+    {"recurrence": {"every": "day"}},
+    {"recurrence": "daily"},
+    {"recurrence": {"freq": "daily"}},
+    {"recurrence": {"freq": "daily", "start": 20260101}},
+    {"recurrence": {"freq": "daily", "start": "2026-01-01", "count": "3"}},
+    {"title": ""},
+    {"title": None},
+    {"version": 3},
+    {"task_id": "x"},
+])
+def test_invalid_task_fields_rejected(call, token, task, fields):
+    status, body = call("POST", "/tasks", {"title": "新任务", **fields}, token)
+    assert status == 400 and "error" in body
+    status, body = call("PATCH", f"/tasks/{task['task_id']}", fields, token)
+    assert status == 400 and "error" in body
+    # 不符合的取值没有写入
+    status, page = call("GET", "/tasks", None, token)
+    assert [item["task_id"] for item in page["items"]] == [task["task_id"]]
+    assert page["items"][0] == task and page["next_cursor"] is None
+    assert call("GET", "/stats", None, token)[1]["total_estimated_hours"] == 2
+
+
+@pytest.mark.parametrize("title", [None, "", 3])
+def test_title_required(call, token, title):
+    assert call("POST", "/tasks", {"title": title}, token)[0] == 400
+
+
+def test_valid_fields_normalised(call, token):
+    status, body = call("POST", "/tasks", {"title": "t", "due_date": "2026/1/5", "estimated_hours": 3,
+                                           "priority": "urgent", "tags": ["a"],
+                                           "recurrence": {"freq": "weekly", "start": "2026年1月5日"}}, token)
+    assert status == 201
+    assert body["due_date"] == "2026-01-05"
+    assert body["estimated_hours"] == 3.0
+    assert body["recurrence"]["start"] == "2026-01-05"
+
+
+@pytest.mark.parametrize("version", ["1", 1.0, True, [1]])
+def test_expected_version_must_be_int(call, token, task, version):
+    status, _ = call("PATCH", f"/tasks/{task['task_id']}", {"expected_version": version, "title": "x"}, token)
+    assert status == 400
+
+
+def test_expected_version_conflict(call, token, task):
+    path = f"/tasks/{task['task_id']}"
+    status, updated = call("PATCH", path, {"expected_version": task["version"], "title": "改名"}, token)
+    assert status == 200 and updated["title"] == "改名"
+    assert call("PATCH", path, {"expected_version": task["version"], "title": "再改"}, token)[0] == 409
+
+
+def test_tasks_paged(call, token):
+    created = [call("POST", "/tasks", {"title": f"任务 {i}", "priority": "high" if i % 2 else "low"}, token)[1]
+               for i in range(7)]
+    seen = []
+    cursor = None
+    while True:
+        path = "/tasks?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        status, page = call("GET", path, None, token)
+        assert status == 200 and len(page["items"]) <= 3
+        seen += [item["task_id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [task["task_id"] for task in created]
+    status, page = call("GET", "/tasks?priority=high", None, token)
+    assert [item["task_id"] for item in page["items"]] == [task["task_id"] for task in created[1::2]]
+
+
+@pytest.mark.parametrize("path", ["/tasks?limit=0", "/tasks?limit=-1", "/tasks?limit=abc",
+                                  "/tasks?limit=100000", "/tasks?cursor=%%%"])
+def test_bad_paging_rejected(call, token, path):
+    assert call("GET", path, None, token)[0] == 400
+
+
+@pytest.mark.parametrize("fields", [
+    {"start_time": "明天", "end_time": "2026-01-05T10:00"},
+    {"start_time": 1767600000, "end_time": "2026-01-05T10:00"},
+    {"start_time": "2026-01-05T09:00", "end_time": "2026-01-05T10:00", "actual_hours": "1"},
+    {"start_time": "2026-01-05T09:00", "end_time": "2026-01-05T10:00", "planned": 1},
+    {"start_time": "2026-01-05T10:00", "end_time": "2026-01-05T09:00"},
+    {"start_time": "2026-01-05T09:00", "end_time": "2026-01-05T10:00", "block_id": "x"},
+])
+def test_invalid_timeblock_fields_rejected(call, token, task, fields):
+    status, body = call("POST", "/timeblocks", {"task_id": task["task_id"], **fields}, token)
+    assert status == 400 and "error" in body
+    assert call("GET", "/timeblocks", None, token)[1] == []
+    assert call("GET", f"/tasks/{task['task_id']}", None, token)[1]["actual_hours"] == 0
+
+
+def test_timeblock_rolls_up_hours(call, token, task):
+    status, block = call("POST", "/timeblocks", {"task_id": task["task_id"], "start_time": "2026-01-05T09:00",
+                                                 "end_time": "2026-01-05T10:30"}, token)
+    assert status == 201
+    assert call("GET", f"/tasks/{task['task_id']}", None, token)[1]["actual_hours"] == pytest.approx(1.5)
+    assert call("PATCH", f"/timeblocks/{block['block_id']}", {"planned": True}, token)[0] == 200
+    assert call("GET", f"/tasks/{task['task_id']}", None, token)[1]["actual_hours"] == pytest.approx(0)
+
+
+def test_malformed_requests(call, server, token):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request("POST", "/tasks", b"{not json", {"Authorization": f"Bearer {token}"})
+    assert connection.getresponse().status == 400
+    connection.close()
+    assert call("POST", "/tasks", ["title"], token)[0] == 400
+    assert call("GET", "/tasks", None, "wrong-token")[0] == 401
+    assert call("GET", "/nothing", None, token)[0] == 404
+    assert call("DELETE", "/tasks", None, token)[0] == 405
+
+
+@pytest.mark.parametrize("length, status", [("-1", 400), ("abc", 400), (str(10 * 1024 * 1024), 413)])
+def test_bad_content_length(server, token, length, status):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.putrequest("POST", "/tasks")
+    connection.putheader("Authorization", f"Bearer {token}")
+    connection.putheader("Content-Length", length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == status and "error" in json.loads(response.read())
+    connection.close()
+
+
+def test_unexpected_error_returns_500(call, server, token, monkeypatch, capsys):
+    def broken(user_id):
+        raise KeyError(user_id)
+    lease = server.managers.lease
+    monkeypatch.setattr(server.managers, "lease", broken)
+    status, body = call("GET", "/stats", None, token)
+    assert status == 500 and body == {"error": "服务器内部错误"}
+    assert "KeyError" in capsys.readouterr().err
+    monkeypatch.setattr(server.managers, "lease", lease)
+    # 服务器继续处理之后的请求
+    assert call("GET", "/tasks", None, token)[0] == 200
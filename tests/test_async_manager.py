@@ -0,0 +1,151 @@
+"""asyncio 接口：并发读取、独占写入和相同读取的合并"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+from core.async_manager import AsyncTaskManager, _freeze
+from core.models import Task
+from core.scheduler import PlanConstraints
+from core.task_manager import TaskManager
+
+CREATED = "2026-01-01T08:00:00"
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=8)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def tasks(engine, executor):
+    return AsyncTaskManager("async", executor)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_reads_run_concurrently(tasks):
+    barrier = threading.Barrier(3, timeout=5)
+
+    async def main():
+        manager = await tasks.open()
+
+        def waiting_read(status=None):
+            # 三个读取都进入后才能继续，依次执行时会超时
+            barrier.wait()
+            return status
+
+        manager.list_tasks = waiting_read
+        return await asyncio.gather(tasks.list_tasks("todo"), tasks.list_tasks("done"),
+                                    tasks.list_tasks("in_progress"))
+
+    assert run(main()) == ["todo", "done", "in_progress"]
+
+
+def test_write_waits_for_reads(tasks):
+    events = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    async def main():
+        manager = await tasks.open()
+        list_tasks = manager.list_tasks
+
+        def slow_read(*args):
+            events.append("read start")
+            reading.set()
+            release.wait(5)
+            events.append("read end")
+            return list_tasks(*args)
+
+        manager.list_tasks = slow_read
+        read = asyncio.ensure_future(tasks.list_tasks())
+        await asyncio.get_running_loop().run_in_executor(None, reading.wait, 5)
+        write = asyncio.ensure_future(tasks.create_task("新任务"))
+        # 写入等待时新的读取排在写入之后
+        later_read = asyncio.ensure_future(tasks.get_task_statistics())
+        await asyncio.sleep(0.05)
+        assert not write.done() and not later_read.done()
+        release.set()
+        created = await write
+        events.append("write end")
+        assert (await later_read)["total_tasks"] == 1
+        assert await read == []
+        return created
+
+    created = run(main())
+    assert events == ["read start", "read end", "write end"]
+    assert created.title == "新任务"
+
+
+def test_reads_see_other_process_writes(tasks):
+    async def main():
+        assert await tasks.list_tasks() == []
+        # 另一个进程 (这里是另一个 TaskManager) 写入
+        TaskManager("async").create_task("外部任务")
+        titles = [task.title for task in await tasks.list_tasks()]
+        manager = await tasks.open()
+        return titles, manager.storage.refresh_paused
+
+    titles, paused = run(main())
+    assert titles == ["外部任务"]
+    # 读取全部结束后恢复自动重新加载，同步调用仍能看到外部修改
+    assert not paused
+
+
+def test_unhashable_arguments_coalesced(tasks):
+    calls = []
+
+    async def main():
+        manager = await tasks.open()
+
+        def plan(date_range, constraints=None):
+            calls.append((date_range, constraints))
+            return len(calls)
+
+        manager.plan = plan
+        first = PlanConstraints(workdays=(0, 1, 2))
+        same = PlanConstraints(workdays=(0, 1, 2))
+        other = PlanConstraints(workdays=(0, 1))
+        return await asyncio.gather(
+            tasks.plan(["2030-01-01", "2030-01-07"], first),
+            tasks.plan(["2030-01-01", "2030-01-07"], constraints=same),
+            tasks.plan(["2030-01-01", "2030-01-07"], constraints=same),
+            tasks.plan(["2030-01-01", "2030-01-07"], other))
+
+    results = run(main())
+    # 位置参数与关键字参数的键不同；内容相同的数据类合并为一次
+    assert len(calls) == 3
+    assert results[1] == results[2] and len(set(results)) == 3
+
+
+def test_freeze_compares_by_content():
+    assert _freeze([1, {"a": [2]}]) == _freeze([1, {"a": [2]}])
+    assert _freeze([1, 2]) != _freeze((1, 2))
+    assert _freeze({"a": 1, "b": 2}) == _freeze({"b": 2, "a": 1})
+    fields = dict(task_id="t", user_id="u", title="a", created_at=CREATED, updated_at=CREATED)
+    assert _freeze(Task(tags=["x"], **fields)) == _freeze(Task(tags=["x"], **fields))
+    assert _freeze(Task(tags=["x"], **fields)) != _freeze(Task(tags=["y"], **fields))
+    hash(_freeze(PlanConstraints()))
+    with pytest.raises(TypeError):
+        _freeze([bytearray(b"x")])
+
+
+def test_concurrent_queries_with_different_orders(tasks):
+    async def main():
+        await tasks.create_tasks([{"title": f"任务 {i}", "priority": ("low", "medium", "high")[i % 3],
+                                   "due_date": date(2030, 1, i % 28 + 1).isoformat()} for i in range(60)])
+        orders = [["-priority"], ["due_date"], ["title"], ["-due_date", "title"]] * 5
+        results = await asyncio.gather(*(tasks.query(order_by=order, limit=10) for order in orders))
+        return orders, results
+
+    orders, results = run(main())
+    for order, result in zip(orders, results):
+        assert len(result.items) == 10
+        assert result.items == results[orders.index(order)].items
@@ -0,0 +1,67 @@
+"""批量新建、修改和删除：全部生效或全部不生效"""
+import pytest
+
+from core.task_manager import TaskManager
+
+
+@pytest.fixture
+def manager(engine):
+    return TaskManager("batch")
+
+
+def test_create_tasks_all_or_nothing(manager):
+    results = manager.create_tasks([{"title": "a"}, {"title": ""}, {"title": "c"}])
+    assert [result.ok for result in results] == [False, False, False]
+    assert results[1].error == "标题不能为空"
+    assert manager.list_tasks() == []
+    results = manager.create_tasks([{"title": "a", "priority": "high"}, {"title": "b"}])
+    assert all(result.ok for result in results)
+    assert sorted(task.title for task in manager.list_tasks()) == ["a", "b"]
+
+
+def test_update_tasks_missing_id_rejects_batch(manager):
+    task = manager.create_task("a")
+    results = manager.update_tasks({task.task_id: {"title": "改名"}, "missing": {"title": "x"}})
+    assert [result.ok for result in results] == [False, False]
+    assert manager.get_task(task.task_id).title == "a"
+
+
+def test_delete_tasks_mixes_instances_and_tasks(manager):
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    plain = manager.create_task("普通任务")
+    instance_id = f"{series.task_id}@2030-01-02"
+    results = manager.delete_tasks([instance_id, plain.task_id])
+    assert all(result.ok for result in results)
+    assert manager.get_task(plain.task_id) is None
+    assert [task.status for task in manager.occurrences("2030-01-01", "2030-01-03")] == ["todo", "cancelled", "todo"]
+    # 一次操作，一次撤销
+    assert manager.undo() == "批量删除 2 个任务"
+    assert manager.get_task(plain.task_id) is not None
+    assert [task.status for task in manager.occurrences("2030-01-01", "2030-01-03")] == ["todo"] * 3
+
+
+def test_delete_tasks_failed_write_changes_nothing(monkeypatch):
+    manager = TaskManager("batch")
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    plain = manager.create_task("普通任务")
+    write = manager.storage._save_tasks
+
+    def fail_when_deleting(tasks):
+        if all(task.task_id != plain.task_id for task in tasks):
+            raise OSError("磁盘已满")
+        write(tasks)
+
+    monkeypatch.setattr(manager.storage, "_save_tasks", fail_when_deleting)
+    results = manager.delete_tasks([f"{series.task_id}@2030-01-02", plain.task_id])
+    assert [result.error for result in results] == ["写入失败", "写入失败"]
+    # 实例没有被标记为已取消，普通任务也没有被删除
+    assert manager.get_task(plain.task_id) is not None
+    assert [task.status for task in manager.occurrences("2030-01-01", "2030-01-03")] == ["todo"] * 3
+    assert TaskManager("batch").get_task(plain.task_id) is not None
+
+
+def test_delete_tasks_missing_id_rejects_batch(manager):
+    task = manager.create_task("a")
+    results = manager.delete_tasks([task.task_id, "missing"])
+    assert [result.ok for result in results] == [False, False]
+    assert manager.get_task(task.task_id) is not None
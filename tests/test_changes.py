@@ -0,0 +1,107 @@
+"""任务变更通知：写入成功后才发出，失败时不发出"""
+import logging
+
+import pytest
+
+from core.changes import TASKS_RELOADED, TaskChange
+from core.models import Task
+from core.storage import create_storage
+from core.task_manager import TaskManager
+
+ENGINES = ("json", "journal", "sqlite")
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}")
+    data.update(fields)
+    return Task(**data)
+
+
+class RejectingIndex:
+    """拒绝标题为 "bad" 的任务，模拟索引无法接受的数据"""
+
+    def rebuild(self, tasks):
+        self.ids = {task.task_id for task in tasks}
+
+    def put(self, task):
+        if task.title == "bad":
+            raise TypeError("rejected")
+        self.ids.add(task.task_id)
+
+    def remove(self, task_id):
+        self.ids.discard(task_id)
+
+
+@pytest.fixture
+def manager(engine):
+    return TaskManager("feed")
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_rejected_write_is_not_persisted(engine, open_storage):
+    storage = open_storage("reject", engine)
+    index = RejectingIndex()
+    storage.add_index(index)
+    assert storage.save_task(make_task(1))
+    assert not storage.save_tasks([make_task(2), make_task(1, title="bad", version=1)])
+
+    assert [task.task_id for task in open_storage("reject", engine).load_tasks()] == ["t001"]
+    assert storage.get_task("t001").title == "任务 1"
+    assert storage.get_task("t002") is None
+    storage.refresh()
+    assert index.ids == {"t001"}
+    assert storage.task_totals()["total"] == 1
+
+
+def test_changes_emitted_after_durable_write(manager):
+    seen = []
+
+    def check_persisted(change: TaskChange):
+        # 通知发出时其他连接已能读到这次修改
+        reader = create_storage("feed")
+        seen.append((change.kind, reader.get_task(change.task_id) is not None))
+        getattr(reader, "close", lambda: None)()
+
+    manager.subscribe(check_persisted)
+    task = manager.create_task("a")
+    assert manager.update_task(task.task_id, title="b")
+    assert manager.delete_task(task.task_id)
+    assert seen == [("created", True), ("updated", True), ("deleted", False)]
+
+
+def test_failed_write_emits_only_reloaded(manager):
+    task = manager.create_task("a")
+    seen = []
+    manager.subscribe(lambda change: seen.append(change.kind))
+    manager.storage.add_index(RejectingIndex())
+    results = manager.create_tasks([{"title": "b"}, {"title": "bad"}])
+    assert not any(result.ok for result in results)
+    assert "created" not in seen
+    manager.storage.refresh()
+    assert seen == [TASKS_RELOADED]
+    assert manager.update_task(task.task_id, title="c")
+    assert seen == [TASKS_RELOADED, "updated"]
+
+
+def test_subscriber_errors_are_logged(manager, caplog):
+    seen = []
+
+    def broken(change):
+        raise RuntimeError("订阅方出错")
+
+    manager.subscribe(broken)
+    manager.subscribe(lambda change: seen.append(change.kind), kinds=["created"])
+    with caplog.at_level(logging.ERROR, logger="core.changes"):
+        task = manager.create_task("a")
+    assert manager.get_task(task.task_id) is not None
+    assert seen == ["created"]
+    assert any(record.exc_info and "订阅方出错" in str(record.exc_info[1]) for record in caplog.records)
+
+
+def test_unsubscribe(manager):
+    seen = []
+    unsubscribe = manager.subscribe(lambda change: seen.append(change.kind))
+    manager.create_task("a")
+    unsubscribe()
+    manager.create_task("b")
+    assert seen == ["created"]
@@ -0,0 +1,74 @@
+"""依赖图的环检测和批量修改"""
+import pytest
+
+from core.dependencies import DependencyCycleError, DependencyGraph
+from core.models import Task
+from core.task_manager import TaskManager
+
+
+def make_task(task_id: str, *blockers: str) -> Task:
+    return Task(task_id=task_id, user_id="u", title=task_id, blocked_by=list(blockers))
+
+
+@pytest.fixture
+def manager(engine):
+    return TaskManager("deps")
+
+
+def test_batch_cycle_between_two_tasks(manager):
+    a = manager.create_task("A")
+    b = manager.create_task("B")
+    results = manager.update_tasks({a.task_id: {"blocked_by": [b.task_id]},
+                                    b.task_id: {"blocked_by": [a.task_id]}})
+    assert not any(result.ok for result in results)
+    assert all("环" in result.error for result in results)
+    # 两项都没有写入，数据与依赖图一致
+    assert manager.get_task(a.task_id).blocked_by == []
+    assert manager.get_task(b.task_id).blocked_by == []
+    assert not manager.dependencies.rejected
+    assert {task.task_id for task in manager.ready_tasks()} == {a.task_id, b.task_id}
+
+
+def test_batch_cycle_through_existing_edge(manager):
+    a = manager.create_task("A")
+    b = manager.create_task("B")
+    c = manager.create_task("C")
+    manager.add_dependency(b.task_id, a.task_id)
+    # C 依赖 B，同时 A 改为依赖 C: A -> B -> C -> A
+    results = manager.update_tasks({c.task_id: {"blocked_by": [b.task_id]},
+                                    a.task_id: {"blocked_by": [c.task_id], "title": "A2"}})
+    assert not any(result.ok for result in results)
+    assert manager.get_task(a.task_id).title == "A"
+    assert manager.get_task(c.task_id).blocked_by == []
+
+
+def test_batch_replacing_edges_is_allowed(manager):
+    a = manager.create_task("A")
+    b = manager.create_task("B")
+    manager.add_dependency(b.task_id, a.task_id)
+    # 同一批中反转依赖方向：B 不再依赖 A，A 改为依赖 B
+    results = manager.update_tasks({b.task_id: {"blocked_by": []},
+                                    a.task_id: {"blocked_by": [b.task_id]}})
+    assert all(result.ok for result in results)
+    assert [task.task_id for task in manager.topological_order()] == [b.task_id, a.task_id]
+    assert not manager.dependencies.rejected
+
+
+def test_single_update_rejects_cycle(manager):
+    a = manager.create_task("A")
+    b = manager.create_task("B")
+    manager.add_dependency(b.task_id, a.task_id)
+    with pytest.raises(DependencyCycleError):
+        manager.add_dependency(a.task_id, b.task_id)
+    with pytest.raises(DependencyCycleError):
+        manager.update_task(a.task_id, blocked_by=[a.task_id])
+
+
+def test_find_batch_cycle():
+    graph = DependencyGraph()
+    graph.rebuild([make_task("a"), make_task("b", "a"), make_task("c", "b")])
+    assert graph.find_batch_cycle({"d": ["c"], "e": ["d"]}) is None
+    assert graph.find_batch_cycle({"a": ["c"]}) == ["a", "b", "c", "a"]
+    assert graph.find_batch_cycle({"x": ["y"], "y": ["x"]}) in (["x", "y", "x"], ["y", "x", "y"])
+    assert graph.find_batch_cycle({"b": [], "a": ["c"]}) is None
+    assert graph.find_batch_cycle({"a": ["a"]}) == ["a", "a"]
@@ -0,0 +1,112 @@
+"""操作日志：撤销/重做、检查点和按时间点还原"""
+from datetime import datetime
+
+import pytest
+
+import core.history
+from core.task_manager import TaskManager
+
+
+@pytest.fixture
+def manager(engine):
+    return TaskManager("hist")
+
+
+def titles(manager):
+    return sorted(task.title for task in manager.list_tasks())
+
+
+def test_undo_redo_create_update_delete(manager):
+    task = manager.create_task("a", estimated_hours=1.0)
+    assert manager.update_task(task.task_id, title="b", estimated_hours=2.0)
+    assert manager.delete_task(task.task_id)
+    assert titles(manager) == []
+    assert manager.undo() == "删除任务 b"
+    assert titles(manager) == ["b"]
+    assert manager.undo() == "修改任务 a"
+    restored = manager.get_task(task.task_id)
+    assert (restored.title, restored.estimated_hours) == ("a", 1.0)
+    assert manager.undo() == "新建任务 a"
+    assert manager.undo() is None
+    assert titles(manager) == []
+    assert [manager.redo() for _ in range(3)] == ["新建任务 a", "修改任务 a", "删除任务 b"]
+    assert manager.redo() is None
+    assert titles(manager) == []
+
+
+def test_undo_keeps_later_changes_to_other_fields(manager):
+    task = manager.create_task("a")
+    assert manager.update_task(task.task_id, title="b")
+    assert manager.update_task(task.task_id, priority="high")
+    assert manager.undo() == "修改任务 b"
+    assert manager.undo() == "修改任务 a"
+    restored = manager.get_task(task.task_id)
+    assert (restored.title, restored.priority) == ("a", "medium")
+
+
+def test_new_operation_clears_redo(manager):
+    manager.create_task("a")
+    assert manager.undo() == "新建任务 a"
+    manager.create_task("b")
+    assert manager.redo() is None
+    assert titles(manager) == ["b"]
+
+
+def test_undo_timeblock_restores_hours(manager):
+    task = manager.create_task("a")
+    manager.create_timeblock(task.task_id, "2026-01-05T09:00", "2026-01-05T11:00")
+    assert manager.get_task(task.task_id).actual_hours == pytest.approx(2.0)
+    assert manager.undo() == "新建时间块"
+    assert manager.get_task(task.task_id).actual_hours == pytest.approx(0.0)
+    assert manager.storage.load_timeblocks() == []
+    assert manager.redo() == "新建时间块"
+    assert manager.get_task(task.task_id).actual_hours == pytest.approx(2.0)
+
+
+def test_undo_stack_bounded(manager, monkeypatch):
+    history = manager.history
+    for i in range(history.undo_stack.maxlen + 5):
+        manager.create_task(f"t{i}")
+    undone = 0
+    while manager.undo() is not None:
+        undone += 1
+    assert undone == history.undo_stack.maxlen
+    assert len(manager.list_tasks()) == 5
+
+
+def test_seq_read_from_file_only_after_other_writers(manager, monkeypatch):
+    history = manager.history
+    reads = []
+    read_last_seq = history._read_last_seq
+    monkeypatch.setattr(history, "_read_last_seq", lambda: reads.append(1) or read_last_seq())
+    manager.create_task("a")
+    reads.clear()
+    for i in range(5):
+        manager.create_task(f"b{i}")
+    assert reads == []
+    # 其他进程追加后，序号按文件末尾继续
+    other = TaskManager("hist")
+    other.create_task("c")
+    manager.create_task("d")
+    assert reads
+    seqs = [entry["seq"] for entry in history.entries()]
+    assert seqs == list(range(1, len(seqs) + 1))
+
+
+def test_tasks_as_of_replays_from_checkpoints(manager, monkeypatch, tasks_dir):
+    monkeypatch.setattr(core.history, "HISTORY_CHECKPOINT_INTERVAL", 3)
+    monkeypatch.setattr(core.history, "HISTORY_MAX_CHECKPOINTS", 2)
+    moments = []
+    task = manager.create_task("v0")
+    moments.append(datetime.now())
+    for i in range(1, 12):
+        assert manager.update_task(task.task_id, title=f"v{i}")
+        moments.append(datetime.now())
+    # 第一个检查点和最近两个检查点
+    manifest = manager.history._read_manifest()
+    assert [item[0] for item in manifest] == [0, 9, 12]
+    assert sorted(path.name for path in tasks_dir.glob("hist_checkpoint_*.json")) == [
+        "hist_checkpoint_0.json", "hist_checkpoint_12.json", "hist_checkpoint_9.json"]
+    for i, moment in enumerate(moments):
+        assert [t.title for t in manager.tasks_as_of(moment)] == [f"v{i}"]
+    assert manager.tasks_as_of(datetime(2000, 1, 1)) is None
@@ -0,0 +1,171 @@
+"""追加日志引擎：重放、残缺的行和压缩"""
+import json
+import threading
+
+import pytest
+
+import core.journal
+from core.models import Task, TimeBlock
+from core.query import TaskIndex, TaskQuery
+
+CREATED = "2026-01-01T08:00:00"
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}", created_at=CREATED, updated_at=CREATED)
+    data.update(fields)
+    return Task(**data)
+
+
+def make_block(i: int, task_id: str) -> TimeBlock:
+    return TimeBlock(block_id=f"b{i:03d}", user_id="u", task_id=task_id,
+                     start_time=f"2026-01-{i % 28 + 1:02d}T09:00", end_time=f"2026-01-{i % 28 + 1:02d}T10:00")
+
+
+def state(storage):
+    tasks = {task.task_id: task.to_dict() for task in storage.load_tasks()}
+    blocks = {block.block_id: block.to_dict() for block in storage.load_timeblocks()}
+    return tasks, blocks
+
+
+def journal_lines(storage):
+    return storage.journal_file.read_bytes().split(b"\n")[:-1]
+
+
+def append_raw(storage, record):
+    """模拟其他进程追加一行日志"""
+    with open(storage.journal_file, "ab") as f:
+        f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+@pytest.fixture
+def journal(open_storage):
+    return lambda user_id="j": open_storage(user_id, "journal")
+
+
+def test_compaction_keeps_state(journal, open_storage):
+    storage = journal("compact")
+    assert storage.save_tasks([make_task(i) for i in range(20)])
+    assert storage.save_timeblocks([make_block(i, f"t{i:03d}") for i in range(10)])
+    assert storage.delete_tasks(["t005"])
+    assert storage.delete_timeblock("b002")
+    expected = state(storage)
+    assert storage.compact(background=False)
+    assert not storage.journal_file.exists()
+    assert not storage.compacting_file.exists()
+    assert state(journal("compact")) == expected
+    # 快照与 json 引擎的文件格式相同
+    assert state(open_storage("compact", "json")) == expected
+
+
+def test_other_writer_replayed_incrementally(journal):
+    writer = journal()
+    reader = journal()
+    index = TaskIndex()
+    reader.add_index(index)
+    assert writer.save_tasks([make_task(i) for i in range(5)])
+    assert writer.save_task(make_task(1, title="改名", version=1))
+    assert writer.delete_task("t002")
+    # 只是日志变长，读取方只重放新增的行并逐条通知索引
+    assert reader.get_task("t001").title == "改名"
+    assert reader.get_task("t002") is None
+    assert {task.task_id for task in index.execute(TaskQuery()).items} == {"t000", "t001", "t003", "t004"}
+    assert state(reader) == state(writer)
+
+
+def test_torn_last_line_skipped_and_closed(journal):
+    storage = journal()
+    assert storage.save_task(make_task(1))
+    # 其他进程写到一半崩溃，留下没有换行的半行
+    with open(storage.journal_file, "ab") as f:
+        f.write(b'{"op":"task","data":{"task_id":"t0')
+    reopened = journal()
+    assert [task.task_id for task in reopened.load_tasks()] == ["t001"]
+    assert reopened.save_task(make_task(2))
+    # 半行之后先换行，新记录独占一行，半行作为坏记录被跳过
+    lines = journal_lines(reopened)
+    assert lines[-2].startswith(b'{"op":"task","data":{"task_id":"t0') and lines[-1].startswith(b'{"op":"task"')
+    assert sorted(task.task_id for task in journal().load_tasks()) == ["t001", "t002"]
+    assert sorted(task.task_id for task in storage.load_tasks()) == ["t001", "t002"]
+
+
+def test_partial_line_replayed_when_completed(journal):
+    reader = journal()
+    reader.load_tasks()
+    record = json.dumps({"op": "task", "data": make_task(1).to_dict()}).encode("utf-8")
+    with open(reader.journal_file, "ab") as f:
+        f.write(record[:10])
+    # 写到一半的行留到下次
+    assert reader.load_tasks() == []
+    with open(reader.journal_file, "ab") as f:
+        f.write(record[10:] + b"\n")
+    assert [task.task_id for task in reader.load_tasks()] == ["t001"]
+
+
+def test_append_during_snapshot_swap_is_replayed(journal, monkeypatch):
+    storage = journal()
+    assert storage.save_tasks([make_task(i) for i in range(3)])
+    original = core.journal.write_json_records_atomic
+
+    def write_then_append(path, records):
+        original(path, records)
+        if path == storage.timeblock_file:
+            # 快照替换期间其他进程追加了一条记录
+            append_raw(storage, {"op": "task", "data": make_task(9).to_dict()})
+
+    monkeypatch.setattr(core.journal, "write_json_records_atomic", write_then_append)
+    assert storage.compact(background=False)
+    assert storage.get_task("t009") is not None
+    assert storage.get_task("t009").title == "任务 9"
+
+
+def test_resumed_compaction_keeps_journal_offset(journal):
+    storage = journal()
+    assert storage.save_tasks([make_task(i) for i in range(3)])
+    # 上次压缩在改名之后中断，留下 .compacting
+    storage.journal_file.rename(storage.compacting_file)
+    resumed = journal()
+    assert resumed.save_task(make_task(3))
+    assert resumed.compact()
+    assert not resumed.compacting_file.exists()
+    assert resumed.journal_file.exists()
+    assert resumed.save_task(make_task(4))
+    # 日志中没有多出的空行
+    assert all(journal_lines(resumed))
+    assert sorted(task.task_id for task in journal().load_tasks()) == [f"t{i:03d}" for i in range(5)]
+
+
+def test_background_compaction_races_with_appends(journal):
+    storage = journal()
+    other = journal()
+    assert storage.save_tasks([make_task(i) for i in range(200)])
+    assert storage.save_timeblocks([make_block(i, f"t{i:03d}") for i in range(50)])
+    stop = threading.Event()
+    failed = []
+
+    def keep_writing():
+        i = 200
+        while not stop.is_set() and i < 400:
+            if not other.save_task(make_task(i)):
+                failed.append(i)
+            i += 1
+
+    writer = threading.Thread(target=keep_writing)
+    writer.start()
+    try:
+        for round_ in range(5):
+            assert storage.compact()
+            for i in range(round_ * 10, round_ * 10 + 10):
+                task = storage.get_task(f"t{i:03d}")
+                task = Task.from_dict(task.to_dict())
+                task.title = f"第 {round_} 轮"
+                assert storage.save_task(task)
+            storage.wait_for_compaction()
+    finally:
+        stop.set()
+        writer.join()
+    assert not failed
+    expected = state(journal())
+    assert state(storage) == expected
+    assert state(other) == expected
+    assert all(expected[0][f"t{i:03d}"]["title"] == f"第 {i // 10} 轮" for i in range(50))
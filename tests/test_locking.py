@@ -0,0 +1,161 @@
+"""跨进程的文件锁和版本冲突检测"""
+import subprocess
+import sys
+import textwrap
+import threading
+from pathlib import Path
+
+import pytest
+
+from core.locking import FileLock
+from core.models import Task
+from core.storage import VersionConflictError
+
+ENGINES = ("json", "journal", "sqlite")
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_children(script: str, *args, count: int = 4):
+    """同时启动 count 个子进程运行 script，等待全部成功退出"""
+    code = f"import sys\nsys.path.insert(0, {str(ROOT)!r})\n" + textwrap.dedent(script)
+    children = [subprocess.Popen([sys.executable, "-c", code, *map(str, args)],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE) for _ in range(count)]
+    outputs = []
+    for child in children:
+        out, err = child.communicate(timeout=120)
+        assert child.returncode == 0, err.decode()
+        outputs.append(out.decode())
+    return outputs
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}")
+    data.update(fields)
+    return Task(**data)
+
+
+def test_file_lock_serialises_processes(tmp_path):
+    counter = tmp_path / "counter"
+    counter.write_text("0")
+    run_children("""
+        import time
+        from pathlib import Path
+        from core.locking import FileLock
+        counter = Path(sys.argv[1])
+        lock = FileLock(counter.with_suffix(".lock"), timeout=60)
+        for _ in range(50):
+            with lock:
+                value = int(counter.read_text())
+                time.sleep(0.0005)
+                counter.write_text(str(value + 1))
+    """, counter)
+    assert counter.read_text() == "200"
+
+
+def test_file_lock_times_out_while_other_process_holds_it(tmp_path):
+    path = tmp_path / "held.lock"
+    code = textwrap.dedent(f"""
+        import sys, time
+        sys.path.insert(0, {str(ROOT)!r})
+        from pathlib import Path
+        from core.locking import FileLock
+        with FileLock(Path({str(path)!r})):
+            print("locked", flush=True)
+            sys.stdin.readline()
+    """)
+    child = subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        assert child.stdout.readline().strip() == b"locked"
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.2).acquire()
+    finally:
+        child.communicate(b"\n", timeout=30)
+    with FileLock(path, timeout=5):
+        pass
+
+
+def test_file_lock_reentrant_and_shared_between_threads(tmp_path):
+    lock = FileLock(tmp_path / "t.lock")
+    other = FileLock(tmp_path / "t.lock", timeout=0.2)
+    with lock:
+        with lock:
+            pass
+        # 同一进程中的另一个实例同样等待
+        failed = []
+        thread = threading.Thread(target=lambda: failed.append(pytest.raises(TimeoutError, other.acquire)))
+        thread.start()
+        thread.join()
+        assert failed
+    with other:
+        pass
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_concurrent_processes_do_not_lose_updates(engine, tasks_dir, open_storage):
+    storage = open_storage("shared", engine)
+    assert storage.save_task(make_task(1, estimated_hours=0.0))
+    outputs = run_children("""
+        from pathlib import Path
+        from core.journal import JournalTaskStorage
+        from core.models import Task
+        from core.sqlite_storage import SQLiteTaskStorage
+        from core.storage import TaskStorage, VersionConflictError
+        engines = {"json": TaskStorage, "journal": JournalTaskStorage, "sqlite": SQLiteTaskStorage}
+        storage = engines[sys.argv[1]]("shared", Path(sys.argv[2]))
+        conflicts = 0
+        for _ in range(25):
+            while True:
+                # 读-改-写不在锁内，其他进程在读取之后保存时发生冲突，重新读取后重试
+                task = Task.from_dict(storage.get_task("t001").to_dict())
+                task.estimated_hours += 1
+                try:
+                    assert storage.save_task(task)
+                    break
+                except VersionConflictError:
+                    conflicts += 1
+        getattr(storage, "wait_for_compaction", lambda: None)()
+        getattr(storage, "close", lambda: None)()
+        print(conflicts)
+    """, engine, tasks_dir)
+    task = open_storage("shared", engine).get_task("t001")
+    assert task.estimated_hours == 100
+    assert task.version == 101
+    assert all(int(out) >= 0 for out in outputs)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_stale_version_conflicts(engine, open_storage):
+    storage = open_storage("conflict", engine)
+    assert storage.save_task(make_task(1))
+    stale = make_task(1, title="过期的修改")
+    with pytest.raises(VersionConflictError):
+        storage.save_task(stale)
+    assert storage.get_task("t001").title == "任务 1"
+    assert stale.version == 0
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_conflict_with_other_instance(engine, open_storage):
+    mine = open_storage("conflict", engine)
+    theirs = open_storage("conflict", engine)
+    assert mine.save_tasks([make_task(1), make_task(2)])
+    read = Task.from_dict(mine.get_task("t001").to_dict())
+    other = Task.from_dict(theirs.get_task("t001").to_dict())
+    other.title = "对方的修改"
+    assert theirs.save_task(other)
+    read.title = "我的修改"
+    untouched = Task.from_dict(mine.get_task("t002").to_dict())
+    untouched.title = "一起保存"
+    with pytest.raises(VersionConflictError) as raised:
+        mine.save_tasks([untouched, read])
+    assert raised.value.task_ids == ["t001"]
+    # 整批都没有写入，版本号没有被改动
+    assert (read.version, untouched.version) == (1, 1)
+    assert mine.get_task("t001").title == "对方的修改"
+    assert mine.get_task("t002").title == "任务 2"
+    assert open_storage("conflict", engine).get_task("t001").version == 2
+    # 按最新版本重试即可保存
+    retry = Task.from_dict(mine.get_task("t001").to_dict())
+    retry.title = "我的修改"
+    assert mine.save_task(retry)
+    assert theirs.get_task("t001").title == "我的修改"
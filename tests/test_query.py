@@ -0,0 +1,133 @@
+"""组合查询：索引给出的结果与逐个检查全部任务一致"""
+import random
+
+import pytest
+
+from core.models import Task
+from core.query import MAX_SORT_INDEXES, PRIORITY_RANK, TaskIndex, TaskQuery, encode_cursor, task_sort_key
+
+ENGINES = ("json", "journal", "sqlite")
+
+STATUSES = ("todo", "in_progress", "done")
+PRIORITIES = ("low", "medium", "high", "urgent")
+
+
+def make_task(i: int, rng: random.Random) -> Task:
+    return Task(task_id=f"t{i:04d}", user_id="u", title=f"任务 {rng.randint(0, 30)}",
+                created_at="2026-01-01T08:00:00", updated_at="2026-01-01T08:00:00",
+                status=rng.choice(STATUSES), priority=rng.choice(PRIORITIES),
+                due_date=f"2026-03-{rng.randint(1, 28):02d}" if rng.random() < 0.8 else None,
+                estimated_hours=float(rng.randint(0, 5)), tags=rng.sample(["a", "b", "c"], rng.randint(0, 2)))
+
+
+def brute_force(tasks, query: TaskQuery):
+    matched = [task for task in tasks if query.matches(task)]
+    if query.order_by:
+        matched.sort(key=lambda task: task_sort_key(task, query.order_by))
+    return [task.task_id for task in matched]
+
+
+def all_pages(index: TaskIndex, **criteria):
+    ids = []
+    cursor = None
+    while True:
+        result = index.execute(TaskQuery(cursor=cursor, **criteria))
+        ids += [task.task_id for task in result.items]
+        cursor = result.next_cursor
+        if cursor is None:
+            return ids
+
+
+QUERIES = [
+    dict(order_by=["-priority"]),
+    dict(order_by=["-priority", "title"]),
+    dict(status="todo", order_by=["-priority", "-due_date"]),
+    dict(min_priority="high", order_by=["due_date"]),
+    dict(order_by=["-due_date"], due_after="2026-03-05", due_before="2026-03-12"),
+    dict(order_by=["due_date", "-estimated_hours"], due_before="2026-03-10"),
+    dict(order_by=["due_date"], due_after="2026-03-20"),
+    dict(tags=["a"], order_by=["title"]),
+    dict(order_by=["-estimated_hours"], max_estimated_hours=3),
+    dict(status=["todo", "done"]),
+]
+
+
+@pytest.mark.parametrize("criteria", QUERIES)
+def test_index_matches_brute_force(criteria):
+    rng = random.Random(7)
+    tasks = {f"t{i:04d}": make_task(i, rng) for i in range(600)}
+    index = TaskIndex()
+    index.rebuild(tasks.values())
+    expected = brute_force(tasks.values(), TaskQuery(**criteria))
+    assert all_pages(index, limit=25, **criteria) == expected
+    assert [task.task_id for task in index.execute(TaskQuery(**criteria)).items] == expected
+    # 建立排序键索引之后的修改和删除同样反映在结果中
+    for i in rng.sample(range(600), 150):
+        task = make_task(i, rng)
+        tasks[task.task_id] = task
+        index.put(task)
+    for task_id in rng.sample(sorted(tasks), 50):
+        del tasks[task_id]
+        index.remove(task_id)
+    expected = brute_force(tasks.values(), TaskQuery(**criteria))
+    assert all_pages(index, limit=40, **criteria) == expected
+
+
+def test_sort_indexes_bounded():
+    rng = random.Random(3)
+    tasks = [make_task(i, rng) for i in range(50)]
+    index = TaskIndex()
+    index.rebuild(tasks)
+    orders = [["title"], ["-title"], ["priority"], ["-priority"], ["due_date"], ["-due_date"],
+              ["estimated_hours"], ["-estimated_hours"], ["created_at"], ["status", "title"]]
+    for order_by in orders:
+        result = index.execute(TaskQuery(order_by=order_by, limit=5))
+        assert [task.task_id for task in result.items] == brute_force(tasks, TaskQuery(order_by=order_by))[:5]
+    assert len(index._orders) == MAX_SORT_INDEXES
+
+
+def test_allowed_priorities_computed_once():
+    query = TaskQuery(priority=["low", "high", "urgent"], min_priority="high")
+    assert query.allowed_priorities() == {"high", "urgent"}
+    assert TaskQuery(min_priority="medium").allowed_priorities() == {p for p, r in PRIORITY_RANK.items() if r >= 1}
+    assert TaskQuery().allowed_priorities() is None
+
+
+@pytest.mark.parametrize("criteria", [dict(min_priority="HIGH"), dict(min_priority="critical"),
+                                      dict(fields=["title", "nope"]), dict(order_by=["owner"])])
+def test_invalid_query_rejected_when_built(criteria):
+    with pytest.raises(ValueError):
+        TaskQuery(**criteria)
+
+
+@pytest.mark.parametrize("cursor", ["不是游标", encode_cursor({}), encode_cursor({"key": [1, 2]}),
+                                    encode_cursor({"key": [["x", "y"], "t0001"]}), encode_cursor([1])])
+def test_invalid_cursor_rejected(cursor):
+    index = TaskIndex()
+    index.rebuild([make_task(i, random.Random(i)) for i in range(5)])
+    with pytest.raises(ValueError):
+        index.execute(TaskQuery(order_by=["title"], cursor=cursor))
+    with pytest.raises(ValueError):
+        index.execute(TaskQuery(cursor=encode_cursor({"offset": -1})))
+
+
+def test_projected_fields():
+    index = TaskIndex()
+    index.rebuild([make_task(1, random.Random(1))])
+    assert index.execute(TaskQuery(fields=["task_id", "status"])).items[0].keys() == {"task_id", "status"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_secondary_index_follows_writes(engine, open_storage):
+    storage = open_storage("index", engine)
+    index = TaskIndex()
+    storage.add_index(index)
+    rng = random.Random(5)
+    assert storage.save_tasks([make_task(i, rng) for i in range(40)])
+    query = TaskQuery(status="todo", order_by=["-priority", "title"])
+    assert [task.task_id for task in index.execute(query).items] == brute_force(storage.load_tasks(), query)
+    renamed = Task.from_dict(storage.get_task("t0003").to_dict())
+    renamed.update(title="改名", status="todo")
+    assert storage.save_task(renamed)
+    assert storage.delete_tasks(["t0005", "t0006", "missing"])
+    assert [task.task_id for task in index.execute(query).items] == brute_force(storage.load_tasks(), query)
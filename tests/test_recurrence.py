@@ -0,0 +1,116 @@
+"""重复任务：规则展开、实例的修改、跳过和删除"""
+from datetime import date
+
+import pytest
+
+from core.recurrence import RecurrenceRule, iter_occurrences, parse_occurrence_id
+from core.task_manager import TaskManager
+
+
+def days(rule: RecurrenceRule, start: str, end: str):
+    return [day.isoformat() for day in iter_occurrences(rule, date.fromisoformat(start), date.fromisoformat(end))]
+
+
+@pytest.fixture
+def manager(engine):
+    return TaskManager("recur")
+
+
+def statuses(manager, start="2030-01-01", end="2030-01-03"):
+    return [task.status for task in manager.occurrences(start, end)]
+
+
+def test_daily_and_weekly_expansion():
+    rule = RecurrenceRule(freq="daily", start="2030-01-01", interval=2)
+    assert days(rule, "2030-01-01", "2030-01-07") == ["2030-01-01", "2030-01-03", "2030-01-05", "2030-01-07"]
+    # 窗口从中间开始时直接跳到窗口内的第一次
+    assert days(rule, "2030-01-02", "2030-01-05") == ["2030-01-03", "2030-01-05"]
+    assert days(rule, "2029-12-01", "2029-12-31") == []
+    weekly = RecurrenceRule(freq="weekly", start="2030-01-01", until="2030-01-20")
+    assert days(weekly, "2030-01-01", "2030-12-31") == ["2030-01-01", "2030-01-08", "2030-01-15"]
+
+
+def test_monthly_expansion_clamps_to_month_end():
+    rule = RecurrenceRule(freq="monthly", start="2030-01-31", count=4)
+    assert days(rule, "2030-01-01", "2030-12-31") == ["2030-01-31", "2030-02-28", "2030-03-31", "2030-04-30"]
+    assert days(rule, "2030-03-01", "2030-03-31") == ["2030-03-31"]
+    leap = RecurrenceRule(freq="monthly", start="2032-01-31")
+    assert days(leap, "2032-02-01", "2032-02-29") == ["2032-02-29"]
+
+
+def test_count_limits_windows_past_the_start():
+    rule = RecurrenceRule(freq="daily", start="2030-01-01", count=3)
+    assert days(rule, "2030-01-02", "2030-01-10") == ["2030-01-02", "2030-01-03"]
+    assert days(rule, "2030-01-04", "2030-01-10") == []
+
+
+@pytest.mark.parametrize("fields", [dict(freq="yearly"), dict(interval=0), dict(count=0),
+                                    dict(start="不是日期"), dict(until="不是日期")])
+def test_invalid_rule_rejected(fields):
+    data = dict(freq="daily", start="2030-01-01")
+    data.update(fields)
+    with pytest.raises(ValueError):
+        RecurrenceRule(**data)
+
+
+def test_occurrence_ids():
+    assert parse_occurrence_id("abc@2030-01-02") == ("abc", "2030-01-02")
+    assert parse_occurrence_id("abc") is None
+    assert parse_occurrence_id("abc@昨天") is None
+
+
+def test_virtual_instance_materialized_on_update(manager):
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    instance_id = f"{series.task_id}@2030-01-02"
+    assert manager.get_task(instance_id).title == "晨会"
+    assert manager.get_task(f"{series.task_id}@2030-01-05") is None
+    assert manager.update_task(instance_id, status="done")
+    saved = manager.get_task(instance_id)
+    assert saved.task_id != instance_id and saved.series_id == series.task_id
+    assert statuses(manager) == ["todo", "done", "todo"]
+    # 已保存的实例不再作为未保存的实例出现在到期列表中
+    assert [task.occurrence_date for task in manager.tasks_due_between("2030-01-01", "2030-01-03")
+            if task.series_id] == ["2030-01-01", "2030-01-03"]
+
+
+def test_delete_instance_skips_it(manager):
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    assert manager.delete_task(f"{series.task_id}@2030-01-01")
+    assert statuses(manager) == ["cancelled", "todo", "todo"]
+    # 已保存的实例同样标记为已取消
+    assert manager.update_task(f"{series.task_id}@2030-01-03", title="改期")
+    assert manager.delete_task(f"{series.task_id}@2030-01-03")
+    assert statuses(manager) == ["cancelled", "todo", "cancelled"]
+    assert manager.undo() == "删除任务 改期"
+    assert statuses(manager) == ["cancelled", "todo", "todo"]
+
+
+def test_deleting_series_removes_virtual_instances(manager):
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    assert manager.delete_task(series.task_id)
+    assert manager.occurrences("2030-01-01", "2030-01-03") == []
+    assert manager.get_task(f"{series.task_id}@2030-01-02") is None
+
+
+def test_undo_batch_delete_in_one_write(manager):
+    series = manager.create_recurring_task("晨会", "daily", start="2030-01-01", count=3)
+    plain = manager.create_task("普通任务")
+    assert all(result.ok for result in manager.delete_tasks([f"{series.task_id}@2030-01-02", plain.task_id]))
+    written = []
+    write_tasks = manager.storage.write_tasks
+
+    def record_writes(tasks, delete_ids):
+        tasks, delete_ids = list(tasks), list(delete_ids)
+        written.append(({task.task_id for task in tasks}, set(delete_ids)))
+        return write_tasks(tasks, delete_ids)
+
+    manager.storage.write_tasks = record_writes
+    # 撤销时恢复普通任务和删除跳过的实例一次写入，不会出现只恢复了一半的状态
+    assert manager.undo() == "批量删除 2 个任务"
+    assert len(written) == 1 and plain.task_id in written[0][0] and len(written[0][1]) == 1
+    assert manager.get_task(plain.task_id) is not None
+    assert statuses(manager) == ["todo"] * 3
+    assert manager.redo() == "批量删除 2 个任务"
+    assert len(written) == 2
+    assert manager.get_task(plain.task_id) is None
+    assert statuses(manager) == ["todo", "cancelled", "todo"]
@@ -0,0 +1,123 @@
+"""自动排程的约束校验和边界情况"""
+from datetime import date, datetime
+
+import pytest
+
+from core.intervals import IntervalIndex, block_hours
+from core.models import Task, TimeBlock
+from core.scheduler import PlanConstraints, plan_schedule, remaining_hours
+from core.task_manager import TaskManager
+
+# 2030-01-07 是星期一
+MONDAY = date(2030, 1, 7)
+NOT_BEFORE = datetime(2030, 1, 1)
+
+
+def make_task(task_id: str, hours: float, **fields) -> Task:
+    return Task(task_id=task_id, user_id="u", title=task_id, estimated_hours=hours, **fields)
+
+
+def plan(tasks, start=MONDAY, end=MONDAY, busy=(), planned_hours=None, **constraints):
+    index = IntervalIndex()
+    index.rebuild(list(busy))
+    constraints.setdefault("not_before", NOT_BEFORE)
+    return plan_schedule(tasks, index, start, end, PlanConstraints(**constraints), "u", planned_hours)
+
+
+@pytest.mark.parametrize("fields", [
+    {"min_block_minutes": 0},
+    {"min_block_minutes": -5},
+    {"work_start": "18:00", "work_end": "09:00"},
+    {"work_start": "09:00", "work_end": "09:00"},
+    {"max_task_hours_per_day": 0},
+    {"max_task_hours_per_day": -1},
+    {"max_task_hours_per_day": 0.25, "min_block_minutes": 30},
+    {"work_start": "9 点"},
+])
+def test_invalid_constraints_rejected(fields):
+    with pytest.raises(ValueError):
+        PlanConstraints(**fields)
+
+
+def test_long_task_fills_days_and_reports_rest():
+    result = plan([make_task("long", 100)], end=date(2030, 1, 13))
+    # 工作日 5 天 x 9 小时，周末不安排
+    assert result.planned_hours == pytest.approx(45)
+    assert {datetime.fromisoformat(block.start_time).weekday() for block in result.blocks} <= set(range(5))
+    assert [(task.task_id, hours) for task, hours in result.unscheduled] == [("long", pytest.approx(55))]
+    assert all(block.planned for block in result.blocks)
+
+
+def test_one_minute_blocks_terminate():
+    result = plan([make_task("long", 50)], min_block_minutes=1, max_task_hours_per_day=1)
+    assert result.planned_hours == pytest.approx(1)
+    assert result.unscheduled[0][1] == pytest.approx(49)
+
+
+def test_daily_cap_spreads_task_over_days():
+    result = plan([make_task("a", 3)], end=date(2030, 1, 9), max_task_hours_per_day=1)
+    days = [datetime.fromisoformat(block.start_time).date() for block in result.blocks]
+    assert days == [date(2030, 1, 7), date(2030, 1, 8), date(2030, 1, 9)]
+    assert not result.unscheduled
+
+
+def test_earliest_due_first_and_priority_lead():
+    tasks = [make_task("later", 2, due_date="2030-01-20"),
+             make_task("sooner", 2, due_date="2030-01-10"),
+             make_task("urgent", 2, due_date="2030-01-11", priority="urgent")]
+    result = plan(tasks)
+    # urgent 提前 2 天，视为 01-09 到期
+    assert [block.task_id for block in result.blocks] == ["urgent", "sooner", "later"]
+
+
+def test_busy_blocks_and_short_gaps_skipped():
+    busy = [TimeBlock("x1", "u", "other", "2030-01-07T09:00", "2030-01-07T12:00"),
+            TimeBlock("x2", "u", "other", "2030-01-07T12:20", "2030-01-07T18:00")]
+    result = plan([make_task("a", 1)], busy=busy, min_block_minutes=30)
+    # 12:00-12:20 短于最短时间块
+    assert result.blocks == []
+    assert result.unscheduled[0][1] == pytest.approx(1)
+
+
+def test_late_tasks_reported():
+    result = plan([make_task("a", 12, due_date="2030-01-07")], end=date(2030, 1, 8))
+    assert [task.task_id for task in result.late] == ["a"]
+
+
+def test_nothing_to_schedule():
+    tasks = [make_task("done", 5, status="done"), make_task("zero", 0),
+             make_task("tracked", 2, actual_hours=2), make_task("series", 5, recurrence={"freq": "daily"})]
+    result = plan(tasks)
+    assert result.blocks == [] and result.unscheduled == [] and result.late == []
+
+
+def test_remaining_hours_subtracts_planned():
+    task = make_task("a", 10, actual_hours=3)
+    assert remaining_hours(task) == pytest.approx(7)
+    assert remaining_hours(task, 5) == pytest.approx(2)
+    assert remaining_hours(task, 9) == 0.0
+    result = plan([task], planned_hours={"a": 6})
+    assert result.planned_hours == pytest.approx(1)
+
+
+def test_committed_plan_is_not_actual_work(engine):
+    manager = TaskManager("planner")
+    task = manager.create_task("写报告", estimated_hours=12, due_date="2030-01-20")
+    constraints = PlanConstraints(not_before=NOT_BEFORE)
+    first = manager.plan(("2030-01-07", "2030-01-08"), constraints)
+    assert first.planned_hours == pytest.approx(12)
+    assert manager.commit_plan(first)
+
+    assert manager.get_task(task.task_id).actual_hours == 0
+    assert manager.get_task_statistics()["total_actual_hours"] == 0
+    assert all(block_hours(block) == 0 for block in manager.storage.load_timeblocks())
+    # 已排程的部分不再重复安排
+    assert manager.plan(("2030-01-07", "2030-01-20"), constraints).blocks == []
+    # 第一天过去后只剩第二天的计划，第一天的 9 小时需要重新安排
+    replanned = manager.plan(("2030-01-08", "2030-01-20"), PlanConstraints(not_before=datetime(2030, 1, 8)))
+    assert replanned.planned_hours == pytest.approx(9)
+
+    # 计划时段完成后改为实际工时
+    block = first.blocks[0]
+    assert manager.update_timeblock(block.block_id, planned=False)
+    assert manager.get_task(task.task_id).actual_hours == pytest.approx(9)
@@ -0,0 +1,83 @@
+"""全文检索：切分、中日韩 bigram 和单词前缀"""
+import pytest
+
+from core.models import Task
+from core.search import SearchIndex, tokenize
+from core.task_manager import TaskManager
+
+
+def make_task(task_id: str, title: str, **fields) -> Task:
+    return Task(task_id=task_id, user_id="u", title=title, **fields)
+
+
+def found(index: SearchIndex, query: str):
+    return [task.task_id for _, task in index.search(query)]
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.rebuild([make_task("a", "项目会议纪要"), make_task("b", "Quarterly report"),
+                   make_task("c", "Café crème", tags=["Ελληνικά"]), make_task("d", "report"),
+                   make_task("e", "会议室预订")])
+    return index
+
+
+def test_tokenize_keeps_accented_letters():
+    assert tokenize("Café CRÈME naïve") == ["café", "crème", "naïve"]
+    assert tokenize("Ελληνικά snake_case 2030") == ["ελληνικά", "snake_case", "2030"]
+
+
+def test_tokenize_splits_cjk_from_words():
+    assert tokenize("abc中文def") == ["abc", "中", "文", "中文", "def"]
+    # 查询时多字片段只用 bigram，单字片段用单字
+    assert tokenize("项目会议", for_query=True) == ["项目", "目会", "会议"]
+    assert tokenize("会 report", for_query=True) == ["会", "report"]
+
+
+def test_cjk_bigrams(index):
+    assert sorted(found(index, "会议")) == ["a", "e"]
+    assert found(index, "议纪") == ["a"]
+    assert found(index, "项目会议") == ["a"]
+    # 不相邻的两个字不构成 bigram
+    assert found(index, "会纪") == []
+    assert sorted(found(index, "会")) == ["a", "e"]
+
+
+def test_accented_words_searchable(index):
+    assert found(index, "crème") == ["c"]
+    assert found(index, "CAFÉ") == ["c"]
+    assert found(index, "ελληνικά") == ["c"]
+
+
+def test_latin_prefix(index):
+    assert found(index, "quart") == ["b"]
+    assert found(index, "quarterly rep") == ["b"]
+    assert found(index, "crè") == ["c"]
+    # 不是单词开头的片段和过短的前缀都不命中
+    assert found(index, "eport") == []
+    assert found(index, "q") == []
+
+
+def test_exact_word_ranks_above_prefix():
+    index = SearchIndex()
+    index.rebuild([make_task("long", "reports"), make_task("exact", "report")])
+    assert found(index, "report") == ["exact", "long"]
+    assert found(index, "reports") == ["long"]
+
+
+def test_prefix_terms_removed_with_task(index):
+    index.remove("b")
+    assert found(index, "quart") == []
+    assert "qu" not in index.postings
+    index.put(make_task("b", "quarter"))
+    assert found(index, "quart") == ["b"]
+    assert found(index, "quarterly") == []
+
+
+def test_manager_search(engine):
+    manager = TaskManager("search")
+    task = manager.create_task("Préparer la réunion", description="季度会议")
+    manager.create_task("其他")
+    assert [found.task_id for found in manager.search("réu")] == [task.task_id]
+    assert [found.task_id for found in manager.search("会议")] == [task.task_id]
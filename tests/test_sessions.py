@@ -0,0 +1,97 @@
+"""会话的过期、顺延和淘汰"""
+import pytest
+
+from auth.sessions import REFRESH_INTERVAL, SessionStore, SQLiteSessionBackend
+
+
+class Clock:
+    def __init__(self, now: int = 1_000_000):
+        self.now = now
+
+    def __call__(self) -> int:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteSessionBackend(tmp_path / "users.sqlite3")
+    yield backend
+    backend.close()
+
+
+def test_session_expires(clock):
+    sessions = SessionStore(timeout=100, sliding=False, clock=clock)
+    session = sessions.create("alice", "u1")
+    clock.now += 99
+    assert sessions.get(session.token) is session
+    clock.now += 1
+    assert sessions.get(session.token) is None
+    assert len(sessions) == 0
+
+
+def test_sliding_expiry_extends_session(clock):
+    sessions = SessionStore(timeout=100, sliding=True, clock=clock)
+    session = sessions.create("alice", "u1")
+    created_expiry = session.expires_at
+    # 距上次顺延不足 REFRESH_INTERVAL 秒时不顺延
+    clock.now += REFRESH_INTERVAL - 1
+    assert sessions.get(session.token).expires_at == created_expiry
+    clock.now += 1
+    assert sessions.get(session.token).expires_at == clock.now + 100
+    # 旧的堆条目到期时不会删除已顺延的会话
+    clock.now += 99
+    assert sessions.get(session.token) is session
+    clock.now += 100
+    assert sessions.get(session.token) is None
+
+
+def test_least_recently_used_evicted(clock):
+    sessions = SessionStore(timeout=100, max_sessions=2, clock=clock)
+    first = sessions.create("alice", "u1")
+    second = sessions.create("bob", "u2")
+    assert sessions.get(first.token) is first
+    third = sessions.create("carol", "u3")
+    # 最久未使用的是 bob
+    assert len(sessions) == 2
+    assert sessions.get(second.token) is None
+    assert sessions.get(first.token) is first
+    assert sessions.get(third.token) is third
+
+
+def test_evicted_session_reloaded_from_backend(clock, backend):
+    sessions = SessionStore(timeout=100, max_sessions=1, backend=backend, clock=clock)
+    first = sessions.create("alice", "u1")
+    sessions.create("bob", "u2")
+    assert len(sessions) == 1
+    reloaded = sessions.get(first.token)
+    assert reloaded is not None and (reloaded.username, reloaded.user_id) == ("alice", "u1")
+    # 重启后从磁盘读回，过期的会话不再有效
+    restarted = SessionStore(timeout=100, backend=backend, clock=clock)
+    assert restarted.get(first.token).username == "alice"
+    clock.now += 100
+    assert SessionStore(timeout=100, backend=backend, clock=clock).get(first.token) is None
+    assert backend.load(first.token) is None
+
+
+def test_logout_removes_backend_session(clock, backend):
+    sessions = SessionStore(timeout=100, backend=backend, clock=clock)
+    session = sessions.create("alice", "u1")
+    sessions.delete(session.token)
+    assert sessions.get(session.token) is None
+    assert backend.load(session.token) is None
+
+
+def test_stale_heap_entries_rebuilt(clock):
+    sessions = SessionStore(timeout=1000, sliding=True, clock=clock)
+    tokens = [sessions.create(f"user{i}", f"u{i}").token for i in range(10)]
+    for _ in range(50):
+        clock.now += REFRESH_INTERVAL
+        for token in tokens:
+            assert sessions.get(token) is not None
+    # 每次顺延留下的旧条目不会让堆无限增长
+    assert len(sessions._expiry) <= 2 * len(sessions) + 64
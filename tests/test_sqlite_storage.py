@@ -0,0 +1,138 @@
+"""SQLite 引擎：迁移、发现其他连接的修改并增量更新索引"""
+import json
+
+import pytest
+
+import core.sqlite_storage
+from core.changes import ChangeFeed
+from core.models import Task, TimeBlock
+from core.sqlite_storage import SQLiteTaskStorage, migrate_json_to_sqlite
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}")
+    data.update(fields)
+    return Task(**data)
+
+
+class RecordingIndex:
+    """记录收到的通知"""
+
+    def __init__(self):
+        self.rebuilds = 0
+        self.events = []
+        self.ids = set()
+
+    def rebuild(self, records):
+        self.rebuilds += 1
+        self.ids = {getattr(record, "task_id", None) or record.block_id for record in records}
+
+    def put(self, record):
+        record_id = record.block_id if isinstance(record, TimeBlock) else record.task_id
+        self.events.append(("put", record_id))
+        self.ids.add(record_id)
+
+    def remove(self, record_id):
+        self.events.append(("remove", record_id))
+        self.ids.discard(record_id)
+
+
+@pytest.fixture
+def pair(open_storage):
+    """同一数据库的两个连接，reader 挂着索引"""
+    writer = open_storage("u", "sqlite")
+    reader = open_storage("u", "sqlite")
+    index = RecordingIndex()
+    reader.add_index(index)
+    return writer, reader, index
+
+
+def test_migrate_uses_given_directory(tmp_path, tasks_dir):
+    source = tmp_path / "exported"
+    source.mkdir()
+    (source / "bob_tasks.json").write_text(json.dumps([make_task(1).to_dict(), make_task(2).to_dict()]))
+    (source / "bob_timeblocks.json").write_text(json.dumps([]))
+    assert migrate_json_to_sqlite(source) == {"bob": (2, 0)}
+    assert (source / "bob.sqlite3").exists()
+    assert not (tasks_dir / "bob.sqlite3").exists()
+    storage = SQLiteTaskStorage("bob", source)
+    try:
+        assert [task.task_id for task in storage.load_tasks()] == ["t001", "t002"]
+    finally:
+        storage.close()
+
+
+def test_external_changes_applied_incrementally(pair):
+    writer, reader, index = pair
+    assert writer.save_tasks([make_task(i) for i in range(3)])
+    # get_task 发现外部修改，索引与返回的数据一致
+    assert reader.get_task("t001").title == "任务 1"
+    assert index.ids == {"t000", "t001", "t002"}
+    rebuilds = index.rebuilds
+    index.events.clear()
+    renamed = writer.get_task("t001")
+    renamed.update(title="改名")
+    assert writer.save_task(renamed)
+    assert writer.delete_task("t002")
+    assert [task.task_id for task in reader.find_tasks()] == ["t000", "t001"]
+    # 只通知改动的记录，不整体重建
+    assert index.rebuilds == rebuilds
+    assert index.events == [("put", "t001"), ("remove", "t002")]
+
+
+def test_own_writes_not_replayed(pair):
+    writer, reader, index = pair
+    assert reader.save_task(make_task(1))
+    assert writer.save_task(make_task(2))
+    index.events.clear()
+    reader.refresh()
+    assert index.events == [("put", "t002")]
+    # 写入前先追上其他连接的修改
+    assert writer.save_task(make_task(3))
+    assert reader.save_task(make_task(4))
+    assert index.events == [("put", "t002"), ("put", "t003"), ("put", "t004")]
+    assert index.ids == {"t001", "t002", "t003", "t004"}
+
+
+def test_pruned_change_log_falls_back_to_rebuild(pair, monkeypatch):
+    writer, reader, index = pair
+    monkeypatch.setattr(core.sqlite_storage, "CHANGE_LOG_KEEP", 2)
+    reader.refresh()
+    rebuilds = index.rebuilds
+    for i in range(5):
+        assert writer.save_task(make_task(i))
+    reader.refresh()
+    assert index.rebuilds == rebuilds + 1
+    assert index.ids == {f"t{i:03d}" for i in range(5)}
+
+
+def test_change_feed_sees_external_update(pair):
+    writer, reader, _ = pair
+    feed = ChangeFeed()
+    reader.add_index(feed)
+    seen = []
+    feed.subscribe(lambda change: seen.append((change.kind, change.task_id)))
+    assert writer.save_task(make_task(1))
+    assert writer.delete_task("t001")
+    reader.load_tasks()
+    # 在同一次刷新中先新建后删除，只读取最终状态
+    assert seen == []
+    assert writer.save_task(make_task(2))
+    assert reader.count_tasks() == 1
+    assert seen == [("created", "t002")]
+
+
+def test_external_timeblock_changes(pair):
+    writer, reader, _ = pair
+    blocks = RecordingIndex()
+    reader.add_timeblock_index(blocks)
+    assert writer.save_task(make_task(1))
+    block = TimeBlock(block_id="b1", user_id="u", task_id="t001",
+                      start_time="2026-01-05T09:00", end_time="2026-01-05T10:00")
+    assert writer.save_timeblock(block)
+    reader.refresh()
+    assert blocks.ids == {"b1"} and blocks.events == [("put", "b1")]
+    assert writer.delete_timeblock("b1")
+    reader.refresh()
+    assert blocks.ids == set()
+    assert reader.get_task("t001").actual_hours == 0
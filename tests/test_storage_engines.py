@@ -0,0 +1,70 @@
+"""三种存储引擎对同一组操作给出相同的结果"""
+import pytest
+
+from core.models import Task, TimeBlock
+
+ENGINES = ("json", "journal", "sqlite")
+
+CREATED = "2026-01-01T08:00:00"
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}", created_at=CREATED, updated_at=CREATED,
+                status=("todo", "in_progress", "done")[i % 3], priority=("low", "medium", "high", "urgent")[i % 4],
+                due_date=f"2026-02-{i % 28 + 1:02d}" if i % 5 else None, estimated_hours=float(i % 7),
+                tags=["a"] if i % 2 else ["b"])
+    data.update(fields)
+    return Task(**data)
+
+
+def make_block(i: int, task_id: str, hours: int = 1, **fields) -> TimeBlock:
+    return TimeBlock(block_id=f"b{i:03d}", user_id="u", task_id=task_id,
+                     start_time=f"2026-01-{i % 28 + 1:02d}T09:00", end_time=f"2026-01-{i % 28 + 1:02d}T{9 + hours:02d}:00",
+                     **fields)
+
+
+def run_operations(storage):
+    """新建、修改、删除任务和时间块，返回最终状态"""
+    assert storage.save_tasks([make_task(i) for i in range(40)])
+    assert storage.save_task(make_task(3, title="改名", version=1))
+    assert storage.delete_tasks(["t005", "t006", "missing"])
+    assert storage.save_timeblocks([make_block(i, f"t{i % 10:03d}") for i in range(20)])
+    assert storage.save_timeblock(make_block(0, "t000", hours=3))
+    assert storage.save_timeblock(make_block(30, "t001", planned=True))
+    assert storage.delete_timeblock("b002")
+    return snapshot(storage)
+
+
+def assert_same_totals(actual, expected):
+    assert actual["total"] == expected["total"]
+    assert actual["by_status"] == expected["by_status"]
+    assert actual["estimated_hours"] == pytest.approx(expected["estimated_hours"])
+    assert actual["actual_hours"] == pytest.approx(expected["actual_hours"])
+
+
+def snapshot(storage):
+    tasks = {task.task_id: task.to_dict() for task in storage.load_tasks()}
+    blocks = {block.block_id: block.to_dict() for block in storage.load_timeblocks()}
+    return tasks, blocks, storage.task_totals()
+
+
+@pytest.fixture
+def results(open_storage):
+    return {engine: run_operations(open_storage(f"eq_{engine}", engine)) for engine in ENGINES}
+
+
+def test_engines_agree(results):
+    expected = results["json"]
+    for engine in ("journal", "sqlite"):
+        assert results[engine][0] == expected[0], engine
+        assert results[engine][1] == expected[1], engine
+        assert_same_totals(results[engine][2], expected[2])
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_reopen_reads_same_state(engine, open_storage):
+    expected = run_operations(open_storage("reopen", engine))
+    reopened = snapshot(open_storage("reopen", engine))
+    assert reopened[0] == expected[0]
+    assert reopened[1] == expected[1]
+    assert_same_totals(reopened[2], expected[2])
@@ -0,0 +1,101 @@
+"""登录失败的滑动窗口、锁定和后台写入"""
+import time
+
+import pytest
+
+from auth.throttle import LoginThrottle
+from auth.user_store import UserStore
+
+NOW = 1_000_000
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UserStore(db_file=tmp_path / "users.sqlite3", legacy_file=None)
+    assert store.add({"username": "alice", "password_hash": "x", "salt": "s", "user_id": "u1",
+                      "login_attempts": 0, "locked_until": 0})
+    yield store
+    store.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_failures_outside_window_forgotten():
+    throttle = LoginThrottle(max_attempts=3, window=100, lockout=500)
+    assert throttle.record_failure("alice", now=NOW) == 0
+    assert throttle.record_failure("alice", now=NOW + 50) == 0
+    # 第一次失败已移出窗口，窗口内只有两次
+    assert throttle.record_failure("alice", now=NOW + 100) == 0
+    assert throttle.allowed("alice", now=NOW + 100)
+    assert throttle.record_failure("alice", now=NOW + 120) == NOW + 120 + 500
+    assert not throttle.allowed("alice", now=NOW + 619)
+    assert throttle.allowed("alice", now=NOW + 620)
+
+
+def test_source_limited_until_failures_leave_window():
+    throttle = LoginThrottle(max_attempts=100, window=100, max_source_failures=2)
+    throttle.record_failure(None, "10.0.0.1", now=NOW)
+    throttle.record_failure("bob", "10.0.0.1", now=NOW + 10)
+    # 不存在的用户名只计入来源，不保存记录
+    assert ("user", None) not in throttle._failures
+    assert not throttle.allowed("alice", "10.0.0.1", now=NOW + 10)
+    assert throttle.allowed("alice", "10.0.0.2", now=NOW + 10)
+    assert throttle.allowed("alice", "10.0.0.1", now=NOW + 100)
+
+
+def test_success_clears_failures():
+    throttle = LoginThrottle(max_attempts=2, window=100)
+    throttle.record_failure("alice", now=NOW)
+    throttle.record_success("alice")
+    assert throttle.record_failure("alice", now=NOW + 1) == 0
+
+
+def test_keys_bounded():
+    throttle = LoginThrottle(max_attempts=5, max_keys=10)
+    for i in range(100):
+        throttle.record_failure(f"user{i}", now=NOW)
+    assert len(throttle) == 10
+    assert ("user", "user99") in throttle._failures and ("user", "user0") not in throttle._failures
+
+
+def test_lockout_flushed_in_background(store):
+    throttle = LoginThrottle(store, max_attempts=2, lockout=500, flush_interval=0.05)
+    try:
+        throttle.record_failure("alice", now=NOW)
+        # 未锁定时不写入用户库
+        assert throttle._writer is None
+        locked_until = throttle.record_failure("alice", now=NOW)
+        assert wait_for(lambda: store.get("alice")["locked_until"] == locked_until)
+        assert store.get("alice")["login_attempts"] == 2
+        throttle.record_success("alice", 2, locked_until)
+        assert wait_for(lambda: store.get("alice")["locked_until"] == 0)
+        assert store.get("alice")["login_attempts"] == 0
+    finally:
+        throttle.close()
+    assert not throttle._writer.is_alive()
+
+
+def test_close_writes_pending_state(store):
+    # 间隔很长，只有 close 时才会写入
+    throttle = LoginThrottle(store, max_attempts=1, lockout=500, flush_interval=3600)
+    locked_until = throttle.record_failure("alice", now=NOW)
+    assert store.get("alice")["locked_until"] == 0
+    throttle.close()
+    assert store.get("alice")["locked_until"] == locked_until
+
+
+def test_expired_pending_lock_dropped_on_success(store):
+    throttle = LoginThrottle(store, max_attempts=1, lockout=500, flush_interval=3600)
+    throttle.record_failure("alice", now=NOW)
+    # 用户库中还没有锁定记录，成功登录后不需要再写入
+    throttle.record_success("alice")
+    assert throttle._pending == {}
+    throttle.close()
+    assert store.get("alice")["locked_until"] == 0
@@ -0,0 +1,83 @@
+"""时间块工时汇总到任务的 actual_hours"""
+import pytest
+
+from core.models import Task, TimeBlock
+from core.storage import write_json_records_atomic
+
+CREATED = "2026-01-01T08:00:00"
+
+
+def make_task(i: int, **fields) -> Task:
+    data = dict(task_id=f"t{i:03d}", user_id="u", title=f"任务 {i}", created_at=CREATED, updated_at=CREATED)
+    data.update(fields)
+    return Task(**data)
+
+
+def make_block(i: int, task_id: str, hours: int = 1, **fields) -> TimeBlock:
+    day = f"2026-01-{i % 28 + 1:02d}"
+    return TimeBlock(block_id=f"b{i:03d}", user_id="u", task_id=task_id,
+                     start_time=f"{day}T09:00", end_time=f"{day}T{9 + hours:02d}:00", **fields)
+
+
+@pytest.fixture
+def storage(engine, open_storage):
+    storage = open_storage("rollup", engine)
+    assert storage.save_tasks([make_task(i) for i in range(4)])
+    return storage
+
+
+def hours(storage, task_id):
+    return storage.get_task(task_id).actual_hours
+
+
+def test_blocks_rolled_up(storage):
+    assert storage.save_timeblocks([make_block(i, f"t{i % 3:03d}") for i in range(6)])
+    assert hours(storage, "t000") == pytest.approx(2.0)
+    # 改为 3 小时、移到其他任务、删除
+    assert storage.save_timeblock(make_block(0, "t000", hours=3))
+    assert storage.save_timeblock(make_block(1, "t002"))
+    assert storage.delete_timeblock("b002")
+    assert hours(storage, "t000") == pytest.approx(4.0)
+    assert hours(storage, "t001") == pytest.approx(1.0)
+    assert hours(storage, "t002") == pytest.approx(2.0)
+    # 计划时段不计入实际工时，改为实际时段后计入
+    assert storage.save_timeblock(make_block(30, "t003", hours=2, planned=True))
+    assert hours(storage, "t003") == 0
+    assert storage.save_timeblock(make_block(30, "t003", hours=2))
+    assert hours(storage, "t003") == pytest.approx(2.0)
+    assert storage.task_totals()["actual_hours"] == pytest.approx(9.0)
+
+
+def test_rebuild_keeps_manual_hours_without_tracked_blocks(storage):
+    task = storage.get_task("t000")
+    manual = Task.from_dict(task.to_dict())
+    manual.actual_hours = 5.0
+    assert storage.save_task(manual)
+    tracked = Task.from_dict(storage.get_task("t001").to_dict())
+    tracked.actual_hours = 7.0
+    assert storage.save_task(tracked)
+    assert storage.save_timeblocks([make_block(0, "t000", hours=2, planned=True),
+                                    make_block(1, "t001", hours=2)])
+    # 只有计划时段的任务与没有时间块的任务一样保留手工填写的工时
+    changes = storage.rebuild_actual_hours()
+    assert changes == {"t001": (pytest.approx(9.0), pytest.approx(2.0))}
+    assert hours(storage, "t000") == pytest.approx(5.0)
+    assert hours(storage, "t001") == pytest.approx(2.0)
+
+
+def test_rollup_recomputed_after_version_conflict(open_storage, monkeypatch):
+    storage = open_storage("conflict", "json")
+    assert storage.save_tasks([make_task(1)])
+    write_blocks = storage._save_timeblocks
+
+    def write_blocks_then_edit_task(timeblocks):
+        write_blocks(timeblocks)
+        # 未持有文件锁的程序在两次写入之间修改了任务
+        edited = make_task(1, title="其他程序的修改", version=storage.get_task("t001").version + 1)
+        write_json_records_atomic(storage.task_file, [edited.to_dict()])
+
+    monkeypatch.setattr(storage, "_save_timeblocks", write_blocks_then_edit_task)
+    assert storage.save_timeblock(make_block(0, "t001", hours=2))
+    task = open_storage("conflict", "json").get_task("t001")
+    assert task.actual_hours == pytest.approx(2.0)
+    assert task.title == "其他程序的修改"
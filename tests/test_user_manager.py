@@ -0,0 +1,110 @@
+"""账户注册、登录和锁定"""
+import pytest
+
+from auth.security import HashParams, SecurityManager
+from auth.sessions import SessionStore
+from auth.throttle import LoginThrottle
+from auth.user_manager import UserManager
+from auth.user_store import UserStore
+
+
+@pytest.fixture(autouse=True)
+def fast_hash(monkeypatch):
+    # 测试不需要高强度的密码哈希
+    monkeypatch.setattr(SecurityManager, "hash_params", HashParams(iterations=1000))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UserStore(db_file=tmp_path / "users.sqlite3", legacy_file=None)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def users(store):
+    throttle = LoginThrottle(store, max_attempts=3, max_source_failures=100)
+    manager = UserManager(store=store, sessions=SessionStore(), throttle=throttle)
+    yield manager
+    throttle.close()
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    """记录每次登录验证所用的哈希"""
+    calls = []
+    verify = SecurityManager.verify_password_pooled
+
+    def record(password, password_hash, salt):
+        calls.append(password_hash)
+        return verify(password, password_hash, salt)
+
+    monkeypatch.setattr(SecurityManager, "verify_password_pooled", staticmethod(record))
+    return calls
+
+
+def test_register_and_login(users):
+    assert users.register("alice", "secret1")
+    assert not users.register("alice", "other12")
+    assert not users.register("al", "secret1")
+    assert not users.register("bob", "short")
+    result = users.login("alice", "secret1")
+    assert result is not None and users.verify_session(result["token"]).username == "alice"
+    assert users.login("alice", "wrong11") is None
+    assert users.login("nobody", "secret1") is None
+    users.logout(result["token"])
+    assert users.verify_session(result["token"]) is None
+
+
+def test_lockout_after_failures(users):
+    assert users.register("alice", "secret1")
+    for _ in range(3):
+        assert users.login("alice", "wrong11") is None
+    assert users.login("alice", "secret1") is None
+    users.throttle.flush()
+    assert users.store.get("alice")["locked_until"] > 0
+
+
+def test_locked_account_still_hashes(users, store, verified):
+    assert users.register("alice", "secret1")
+    # 其他进程锁定了账户，本进程的限流没有记录
+    store.update("alice", login_attempts=3, locked_until=SecurityManager.get_current_timestamp() + 600)
+    assert users.login("alice", "secret1") is None
+    # 与用户不存在时一样按占位哈希计算一次，响应时间不暴露锁定状态
+    assert verified == [SecurityManager.dummy_hash()[0]]
+    verified.clear()
+    assert users.login("nobody", "secret1") is None
+    assert verified == [SecurityManager.dummy_hash()[0]]
+
+
+@pytest.mark.parametrize("old_params", [HashParams(algorithm="sha256"), HashParams(iterations=500),
+                                        HashParams(algorithm="scrypt", n=16, r=1, p=1)])
+def test_login_rehashes_old_hash(users, store, monkeypatch, old_params):
+    monkeypatch.setattr(SecurityManager, "hash_params", old_params)
+    assert users.register("alice", "secret1")
+    old_hash = store.get("alice")["password_hash"]
+    monkeypatch.setattr(SecurityManager, "hash_params", HashParams(iterations=1000))
+    assert SecurityManager.needs_rehash(old_hash)
+    assert users.login("alice", "secret1") is not None
+    # 登录成功后按当前参数重新计算并写回，新哈希仍能登录
+    record = store.get("alice")
+    assert record["password_hash"].startswith("pbkdf2_sha256$1000$")
+    assert not SecurityManager.needs_rehash(record["password_hash"])
+    assert users.login("alice", "secret1") is not None
+
+
+def test_failed_login_keeps_old_hash(users, store, monkeypatch):
+    monkeypatch.setattr(SecurityManager, "hash_params", HashParams(algorithm="sha256"))
+    assert users.register("alice", "secret1")
+    old_hash = store.get("alice")["password_hash"]
+    monkeypatch.setattr(SecurityManager, "hash_params", HashParams(iterations=1000))
+    assert users.login("alice", "wrong11") is None
+    assert store.get("alice")["password_hash"] == old_hash
+
+
+def test_current_hash_not_rewritten(users, store, monkeypatch):
+    assert users.register("alice", "secret1")
+    before = store.get("alice")
+    monkeypatch.setattr(store, "update", lambda *args, **kwargs: pytest.fail("不应写入用户库"))
+    assert users.login("alice", "secret1") is not None
+    assert store.get("alice")["password_hash"] == before["password_hash"]
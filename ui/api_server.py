@@ -0,0 +1,404 @@
+"""时间管理系统 - HTTP/JSON 接口
+
+    python -m ui.api_server [端口]
+
+只监听本机 (API_HOST)。先 POST /login 取得令牌，之后的请求带上 "Authorization: Bearer <令牌>"：
+
+    POST   /register                {"username", "password"}
+    POST   /login                   {"username", "password"} -> {"token", "user_id", "username"}
+    POST   /logout
+    GET    /tasks[?status=&priority=&limit=&cursor=]  -> {"items", "next_cursor"}
+    POST   /tasks                   {"title", ...任务字段}
+    GET    /tasks/<任务ID>
+    PATCH  /tasks/<任务ID>          {...任务字段, "expected_version"?}
+    DELETE /tasks/<任务ID>
+    GET    /stats
+    GET    /timeblocks[?start=&end=]
+    POST   /timeblocks              {"task_id", "start_time", "end_time", ...}
+    GET    /timeblocks/<时间块ID>
+    PATCH  /timeblocks/<时间块ID>   {...时间块字段}
+    DELETE /timeblocks/<时间块ID>
+
+字段的类型和取值在交给 TaskManager 之前校验，不符合时返回 400。
+GET /tasks 分页返回，每页最多 limit 条 (默认 API_PAGE_SIZE)，next_cursor 不为 null 时
+作为下一次请求的 cursor 取得下一页。
+"""
+import json
+import math
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from config import (API_HOST, API_PORT, API_MAX_WORKERS, API_MAX_BODY_BYTES, API_REQUEST_TIMEOUT,
+                    API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+from auth.user_manager import UserManager
+from core.manager_cache import ManagerCache
+from core.due_dates import normalize_due_date
+from core.intervals import parse_time
+from core.models import TASK_STATUSES, TASK_PRIORITIES
+from core.recurrence import RecurrenceRule
+from core.storage import VersionConflictError
+from core.task_manager import TaskManager
+
+
+class ApiError(Exception):
+    """以指定状态码返回给客户端的错误"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer(HTTPServer):
+    """在有界线程池中处理请求的 HTTP 服务器
+
+    最多 max_workers 个请求同时执行，线程都在忙时不再接受新连接，由系统的监听队列缓冲；
+    空闲时 (serve_forever 的每次轮询) 关闭空闲超时的 TaskManager。
+    """
+
+    def __init__(self, address: Tuple[str, int] = (API_HOST, API_PORT), user_manager: Optional[UserManager] = None,
+                 managers: Optional[ManagerCache] = None, max_workers: int = API_MAX_WORKERS):
+        super().__init__(address, ApiRequestHandler)
+        self.user_manager = user_manager if user_manager is not None else UserManager()
+        self.managers = managers if managers is not None else ManagerCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def service_actions(self):
+        self.managers.evict()
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+        self.managers.close()
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    server: ApiServer
+    # HTTP/1.0，每个连接只处理一个请求，空闲的连接不会占住工作线程
+    timeout = API_REQUEST_TIMEOUT
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        # 默认逐个请求写入 stderr，只保留错误日志
+        pass
+
+    def log_error(self, format, *args):
+        super().log_message(format, *args)
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._read_body()
+            status, result = self._route(method, parts, query, body)
+        except ApiError as e:
+            status, result = e.status, {"error": str(e)}
+        except VersionConflictError as e:
+            status, result = HTTPStatus.CONFLICT, {"error": str(e)}
+        except ValueError as e:
+            # 包括 TimeBlockOverlapError、DependencyCycleError 和无法识别的时间
+            status, result = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            # 存储错误、文件锁超时和程序错误，记录后返回 500，不断开连接
+            self.log_error("%s %s 处理失败: %r", method, url.path, e)
+            traceback.print_exc()
+            status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "服务器内部错误"}
+        self._send(status, result)
+
+    def _read_body(self) -> Dict[str, Any]:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length 无效")
+        if length > API_MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求内容过大")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "请求内容不是有效的 JSON")
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "请求内容应为 JSON 对象")
+        return body
+
+    def _send(self, status: HTTPStatus, result: Any):
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str, parts, query: Dict[str, str], body: Dict[str, Any]) -> Tuple[HTTPStatus, Any]:
+        users = self.server.user_manager
+        if parts == ["register"] and method == "POST":
+            if not users.register(str(body.get("username", "")), str(body.get("password", ""))):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "用户名已存在或不符合要求")
+            return HTTPStatus.CREATED, {"username": body["username"]}
+        if parts == ["login"] and method == "POST":
+            result = users.login(str(body.get("username", "")), str(body.get("password", "")),
+                                 source=self.client_address[0])
+            if result is None:
+                raise ApiError(HTTPStatus.UNAUTHORIZED, "用户名或密码错误，或账户被锁定")
+            user = result["user"]
+            return HTTPStatus.OK, {"token": result["token"], "user_id": user.user_id, "username": user.username}
+
+        token = self._token()
+        user = users.verify_session(token) if token else None
+        if user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "未登录或会话已过期")
+        if parts == ["logout"] and method == "POST":
+            users.logout(token)
+            return HTTPStatus.OK, {}
+        if parts == ["stats"]:
+            if method != "GET":
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+            with self.server.managers.lease(user.user_id) as manager:
+                return HTTPStatus.OK, manager.get_task_statistics()
+        if parts and parts[0] in ("tasks", "timeblocks") and len(parts) <= 2:
+            handler = self._tasks if parts[0] == "tasks" else self._timeblocks
+            with self.server.managers.lease(user.user_id) as manager:
+                return handler(manager, method, parts[1:], query, body)
+        raise ApiError(HTTPStatus.NOT_FOUND, "不存在的接口")
+
+    def _token(self) -> Optional[str]:
+        scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+        return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+    def _tasks(self, manager: TaskManager, method: str, ids, query: Dict[str, str],
+               body: Dict[str, Any]) -> Tuple[HTTPStatus, Any]:
+        if not ids:
+            if method == "GET":
+                # 走查询索引按页返回，不复制全部任务
+                result = manager.query(status=query.get("status"), priority=query.get("priority"),
+                                       limit=_page_size(query.get("limit")), cursor=query.get("cursor"))
+                return HTTPStatus.OK, {"items": [task.to_dict() for task in result.items],
+                                       "next_cursor": result.next_cursor}
+            if method == "POST":
+                fields = _fields(body, TASK_FIELDS)
+                if "title" not in fields:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "缺少任务标题")
+                title = fields.pop("title")
+                return HTTPStatus.CREATED, manager.create_task(title, **fields).to_dict()
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+        task_id = ids[0]
+        if method == "GET":
+            task = manager.get_task(task_id)
+            if task is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "任务不存在")
+            return HTTPStatus.OK, task.to_dict()
+        if method == "PATCH":
+            expected_version = body.get("expected_version")
+            if expected_version is not None and (
+                    isinstance(expected_version, bool) or not isinstance(expected_version, int)):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "expected_version 应为整数")
+            if not manager.update_task(task_id, expected_version=expected_version, **_fields(body, TASK_FIELDS)):
+                raise ApiError(HTTPStatus.NOT_FOUND, "任务不存在")
+            return HTTPStatus.OK, manager.get_task(task_id).to_dict()
+        if method == "DELETE":
+            if not manager.delete_task(task_id):
+                raise ApiError(HTTPStatus.NOT_FOUND, "任务不存在")
+            return HTTPStatus.OK, {}
+        raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+
+    def _timeblocks(self, manager: TaskManager, method: str, ids, query: Dict[str, str],
+                    body: Dict[str, Any]) -> Tuple[HTTPStatus, Any]:
+        if not ids:
+            if method == "GET":
+                if "start" in query or "end" in query:
+                    if "start" not in query or "end" not in query:
+                        raise ApiError(HTTPStatus.BAD_REQUEST, "start 和 end 需同时指定")
+                    blocks = manager.timeblocks_between(query["start"], query["end"])
+                else:
+                    blocks = manager.storage.load_timeblocks()
+                return HTTPStatus.OK, [block.to_dict() for block in blocks]
+            if method == "POST":
+                fields = _fields(body, TIMEBLOCK_FIELDS)
+                missing = [name for name in ("task_id", "start_time", "end_time") if name not in fields]
+                if missing:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, f"缺少字段: {', '.join(missing)}")
+                if manager.get_task(fields["task_id"]) is None:
+                    raise ApiError(HTTPStatus.NOT_FOUND, "任务不存在")
+                return HTTPStatus.CREATED, manager.create_timeblock(**fields).to_dict()
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+        block_id = ids[0]
+        if method == "GET":
+            block = manager.get_timeblock(block_id)
+            if block is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "时间块不存在")
+            return HTTPStatus.OK, block.to_dict()
+        if method == "PATCH":
+            if not manager.update_timeblock(block_id, **_fields(body, TIMEBLOCK_FIELDS)):
+                raise ApiError(HTTPStatus.NOT_FOUND, "时间块不存在")
+            return HTTPStatus.OK, manager.get_timeblock(block_id).to_dict()
+        if method == "DELETE":
+            if not manager.delete_timeblock(block_id):
+                raise ApiError(HTTPStatus.NOT_FOUND, "时间块不存在")
+            return HTTPStatus.OK, {}
+        raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "不支持的请求方法")
+
+
+def _page_size(value: Optional[str]) -> int:
+    if value is None:
+        return API_PAGE_SIZE
+    if not value.isdigit() or not 1 <= int(value) <= API_MAX_PAGE_SIZE:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"limit 应为 1 到 {API_MAX_PAGE_SIZE} 的整数")
+    return int(value)
+
+
+def _invalid(name: str, expected: str) -> ApiError:
+    return ApiError(HTTPStatus.BAD_REQUEST, f"字段 {name} 应为{expected}")
+
+
+def _text(name: str, value: Any) -> str:
+    if not isinstance(value, str):
+        raise _invalid(name, "字符串")
+    return value
+
+
+def _title(name: str, value: Any) -> str:
+    """新建和修改时标题都不能为空"""
+    if not isinstance(value, str) or not value:
+        raise _invalid(name, "非空字符串")
+    return value
+
+
+def _optional_text(name: str, value: Any) -> Optional[str]:
+    return None if value is None else _text(name, value)
+
+
+def _hours(name: str, value: Any) -> float:
+    # bool 是 int 的子类，单独排除
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise _invalid(name, "非负数")
+    return float(value)
+
+
+def _text_list(name: str, value: Any) -> list:
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise _invalid(name, "字符串列表")
+    return value
+
+
+def _flag(name: str, value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise _invalid(name, " true 或 false")
+    return value
+
+
+def _choice(choices: Tuple[str, ...]) -> Callable[[str, Any], str]:
+    def check(name: str, value: Any) -> str:
+        if value not in choices:
+            raise _invalid(name, f" {', '.join(choices)} 之一")
+        return value
+    return check
+
+
+def _date(name: str, value: Any) -> Optional[str]:
+    """空值或可识别的日期，规范为 YYYY-MM-DD"""
+    if value is None or value == "":
+        return None
+    date_key = normalize_due_date(value) if isinstance(value, str) else None
+    if date_key is None:
+        raise _invalid(name, "日期 (YYYY-MM-DD)")
+    return date_key
+
+
+def _time(name: str, value: Any) -> str:
+    if not isinstance(value, str) or parse_time(value) is None:
+        raise _invalid(name, " ISO 格式的时间")
+    return value
+
+
+def _recurrence(name: str, value: Any) -> Optional[Dict[str, Any]]:
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        raise _invalid(name, "重复规则对象")
+    try:
+        return RecurrenceRule.from_dict(value).to_dict()
+    except (TypeError, KeyError, ValueError):
+        # 缺少或多出的键、类型不符 (如 start 为数字) 和取值无效都是客户端的错误
+        raise _invalid(name, "重复规则对象 (freq, start, interval, until, count)")
+
+
+# 客户端可以设置的字段及其校验，其余 (ID、所属用户、时间戳、版本) 由 TaskManager 维护
+TASK_FIELDS: Dict[str, Callable[[str, Any], Any]] = {
+    "title": _title,
+    "description": _text,
+    "status": _choice(TASK_STATUSES),
+    "priority": _choice(TASK_PRIORITIES),
+    "due_date": _date,
+    "estimated_hours": _hours,
+    "actual_hours": _hours,
+    "tags": _text_list,
+    "blocked_by": _text_list,
+    "recurrence": _recurrence,
+    "series_id": _optional_text,
+    "occurrence_date": _date,
+}
+TIMEBLOCK_FIELDS: Dict[str, Callable[[str, Any], Any]] = {
+    "task_id": _text,
+    "start_time": _time,
+    "end_time": _time,
+    "description": _text,
+    "actual_hours": _hours,
+    "planned": _flag,
+}
+
+
+def _fields(body: Dict[str, Any], allowed: Dict[str, Callable[[str, Any], Any]]) -> Dict[str, Any]:
+    """请求中可设置的字段，经过类型和取值校验；有其他字段或取值不符时返回 400"""
+    unknown = sorted(set(body) - set(allowed) - {"expected_version"})
+    if unknown:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"无法设置的字段: {', '.join(unknown)}")
+    return {key: allowed[key](key, value) for key, value in body.items() if key in allowed}
+
+
+def main(port: int = API_PORT):
+    server = ApiServer((API_HOST, port))
+    print(f"时间管理系统 API: http://{API_HOST}:{port}/ (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else API_PORT)
@@ -3,6 +3,10 @@ from typing import List, Optional
 from datetime import datetime
 from core.models import Task
 from core.task_manager import TaskManager
+from core.due_dates import today_key, days_from_today
+
+# 任务列表每页显示的条数
+PAGE_SIZE = 20
 
 class CLIInterface:
     def __init__(self, task_manager: TaskManager, username: str):
@@ -21,7 +25,7 @@ class CLIInterface:
         print(f"=== {title} ===")
         print()
     
-    def display_tasks(self, tasks: List[Task], show_details: bool = False):
+    def display_tasks(self, tasks: List[Task], show_details: bool = False, start: int = 1):
         """显示任务列表"""
         if not tasks:
             print("没有任务")
@@ -41,7 +45,7 @@ class CLIInterface:
             "urgent": "‼"
         }
         
-        for i, task in enumerate(tasks, 1):
+        for i, task in enumerate(tasks, start):
             status_icon = status_icons.get(task.status, " ")
             priority_icon = priority_icons.get(task.priority, " ")
             
@@ -57,6 +61,43 @@ class CLIInterface:
                 print(f"     标签: {', '.join(task.tags)}")
             print()
     
+    def browse_tasks(self, title: str, **criteria):
+        """分页浏览任务，criteria 为 TaskManager.query 的查询条件"""
+        self._page_tasks(title, None, criteria)
+    
+    def select_task(self, title: str, prompt: str = "选择任务编号", **criteria) -> Optional[Task]:
+        """分页浏览并选择一个任务，返回选中的任务，直接回车返回 None"""
+        return self._page_tasks(title, prompt, criteria)
+    
+    def _page_tasks(self, title: str, prompt: Optional[str], criteria: dict) -> Optional[Task]:
+        """每次只查询并显示一页；prompt 不为 None 时可输入本页的任务编号选择任务"""
+        cursors = [None]
+        while True:
+            result = self.manager.query(limit=PAGE_SIZE, cursor=cursors[-1], **criteria)
+            start = (len(cursors) - 1) * PAGE_SIZE + 1
+            self.display_header(f"{title} - 第 {len(cursors)} 页")
+            self.display_tasks(result.items, show_details=prompt is None, start=start)
+            options = []
+            if prompt is not None and result.items:
+                options.append(f"{prompt} ({start}-{start + len(result.items) - 1})")
+            if result.next_cursor:
+                options.append("n 下一页")
+            if len(cursors) > 1:
+                options.append("p 上一页")
+            options.append("回车 返回")
+            choice = self.get_user_choice(f"{', '.join(options)}: ").lower()
+            if choice == "n" and result.next_cursor:
+                cursors.append(result.next_cursor)
+            elif choice == "p" and len(cursors) > 1:
+                cursors.pop()
+            elif not choice:
+                return None
+            elif prompt is not None:
+                if choice.isdigit() and start <= int(choice) < start + len(result.items):
+                    return result.items[int(choice) - start]
+                print("无效的任务编号!")
+                input("按回车键继续...")
+    
     def show_main_menu(self):
         """显示主菜单"""
         self.display_header("主菜单")
@@ -66,9 +107,30 @@ class CLIInterface:
         print("4. 标记任务状态")
         print("5. 删除任务")
         print("6. 查看统计")
-        print("7. 退出系统")
+        print("7. 搜索任务")
+        print("8. 截止日期提醒")
+        print("9. 接下来做什么")
+        undo_label = self.manager.history.undo_label()
+        if undo_label:
+            print(f"u. 撤销: {undo_label}")
+        redo_label = self.manager.history.redo_label()
+        if redo_label:
+            print(f"r. 重做: {redo_label}")
+        print("0. 退出系统")
         print()
     
+    def undo(self):
+        """撤销最近一次操作"""
+        label = self.manager.undo()
+        print(f"已撤销: {label}" if label else "没有可撤销的操作")
+        input("按回车键继续...")
+    
+    def redo(self):
+        """重做最近一次撤销的操作"""
+        label = self.manager.redo()
+        print(f"已重做: {label}" if label else "没有可重做的操作")
+        input("按回车键继续...")
+    
     def get_user_choice(self, prompt: str = "请选择操作: ") -> str:
         """获取用户输入"""
         return input(prompt).strip()
@@ -103,7 +165,7 @@ class CLIInterface:
         else:
             tags = existing_task.tags if existing_task else []
         
-        return {
+        task_data = {
             "title": title,
             "description": description,
             "priority": priority,
@@ -111,6 +173,45 @@ class CLIInterface:
             "estimated_hours": estimated_hours,
             "tags": tags
         }
+        if not existing_task:
+            # 重复任务从截止日期 (默认今天) 开始
+            repeat = input("重复 (daily/weekly/monthly, 可选): ").strip().lower()
+            if repeat in ("daily", "weekly", "monthly"):
+                task_data["repeat"] = repeat
+        return task_data
+    
+    def show_search(self):
+        """搜索任务并显示结果"""
+        self.display_header("搜索任务")
+        keyword = input("关键词: ").strip()
+        if keyword:
+            tasks = self.manager.search(keyword, limit=PAGE_SIZE)
+            print()
+            self.display_tasks(tasks, show_details=True)
+        input("按回车键继续...")
+    
+    def show_deadlines(self, days: int = 7):
+        """显示已逾期和近期到期的任务"""
+        self.display_header("截止日期提醒")
+        overdue = self.manager.overdue()
+        print(f"已逾期 ({len(overdue)}):")
+        self.display_tasks(overdue)
+        upcoming = self.manager.tasks_due_between(today_key(), days_from_today(days))
+        print(f"未来 {days} 天内到期 ({len(upcoming)}):")
+        self.display_tasks(upcoming)
+        input("按回车键继续...")
+    
+    def show_next_tasks(self, k: int = 10):
+        """显示按优先级、截止日期和存在时间排序的待做任务"""
+        self.display_header("接下来做什么")
+        tasks = self.manager.next_tasks(k)
+        if not tasks:
+            print("没有可以开始的任务")
+        for i, task in enumerate(tasks, 1):
+            due = f"  截止 {task.due_date}" if task.due_date else ""
+            print(f"{i}. [{self.manager.task_score(task):6.1f}] {task.title}  ({task.priority}){due}")
+        print()
+        input("按回车键继续...")
     
     def show_statistics(self):
         """显示统计信息"""
@@ -125,4 +226,53 @@ class CLIInterface:
         print(f"总预估时间: {stats['total_estimated_hours']:.1f}h")
         print(f"总实际时间: {stats['total_actual_hours']:.1f}h")
         print()
+        choice = self.get_user_choice("输入 c 校验统计数据，t 查看工时报表，回车返回: ").lower()
+        if choice == "c":
+            self.show_statistics_check()
+        elif choice == "t":
+            self.show_time_report()
+    
+    def show_time_report(self, recent_days: int = 14):
+        """显示时间块工时报表: 最近每天、每周、每月、按任务、按标签、预估偏差"""
+        self.display_header("工时报表")
+        try:
+            daily = self.manager.hours_by_period("day", start=days_from_today(-recent_days + 1))
+        except ImportError as e:
+            print(e)
+            input("按回车键继续...")
+            return
+        print(f"最近 {recent_days} 天:")
+        for label, hours in daily:
+            print(f"  {label}  {hours:6.1f}h")
+        print("按周:")
+        for label, hours in self.manager.hours_by_period("week")[-8:]:
+            print(f"  {label}  {hours:6.1f}h")
+        print("按月:")
+        for label, hours in self.manager.hours_by_period("month")[-12:]:
+            print(f"  {label}  {hours:6.1f}h")
+        print("按任务:")
+        for task, hours in self.manager.hours_by_task()[:10]:
+            print(f"  {task.title[:20]:<20}  {hours:6.1f}h")
+        print("按标签:")
+        for tag, hours in self.manager.hours_by_tag()[:10]:
+            print(f"  {tag[:20]:<20}  {hours:6.1f}h")
+        variance = self.manager.hours_variance()
+        print(f"预估 {variance['estimated_hours']:.1f}h，记录 {variance['tracked_hours']:.1f}h，"
+              f"偏差 {variance['variance']:+.1f}h")
+        for item in variance["items"][:10]:
+            print(f"  {item['task'].title[:20]:<20}  预估 {item['estimated_hours']:5.1f}h  "
+                  f"记录 {item['tracked_hours']:5.1f}h  偏差 {item['variance']:+.1f}h")
+        print()
+        input("按回车键继续...")
+    
+    def show_statistics_check(self):
+        """从头重新统计，显示并修复增量统计的偏差"""
+        drift = self.manager.check_statistics(repair=True)
+        if not drift:
+            print("统计数据一致")
+        else:
+            print("发现统计偏差，已按实际数据修复:")
+            for key, (recorded, actual) in drift.items():
+                print(f"  {key}: 记录 {recorded} -> 实际 {actual}")
+        print()
         input("按回车键继续...")
\ No newline at end of file